@@ -0,0 +1,251 @@
+"""Offline benchmarks of the TickerStore fetch path.
+
+Recorded (or synthesised) Upstox and NSE payloads are replayed through local
+stand-ins, so no network access is needed. Results are written as JSON and
+can be compared with the results of an earlier run::
+
+    $ python -m benchmarks.bench_historical --output new.json --compare old.json
+"""
+
+from benchmarks.stand_ins import Fixtures
+from benchmarks.stand_ins import StandInNse
+from benchmarks.stand_ins import StandInUpstox
+from tickerstore.auth import TokenManager
+from tickerstore.contracts import MasterContract
+from tickerstore.shared import SharedState
+from tickerstore.store import TickerStore
+from tickerstore import normalize
+import tracemalloc
+import contextlib
+import argparse
+import datetime
+import platform
+import tempfile
+import shutil
+import pandas
+import numpy
+import nsepy
+import json
+import time
+import sys
+import os
+
+DAY_SPAN = (datetime.date(2018, 1, 1), datetime.date(2018, 12, 31))
+MINUTE_SPAN = (datetime.date(2018, 12, 24), datetime.date(2018, 12, 28))
+
+INTERVALS = {
+    "day_1": (TickerStore.INTERVAL_DAY_1, DAY_SPAN),
+    "minute_1": (TickerStore.INTERVAL_MINUTE_1, MINUTE_SPAN),
+}
+
+
+def scenarios(full):
+    """Returns the (kind, tickers, interval) of every scenario to run."""
+    ticker_counts = [1, 10, 100, 1000]
+    runs = []
+    for interval in INTERVALS:
+        for count in ticker_counts:
+            # 1000 tickers of minute bars need a few GB of payloads in memory
+            if interval == "minute_1" and count == 1000 and not full:
+                continue
+            runs.append(("historical_data", count, interval))
+    runs += [
+        ("normalise", 1, "minute_1"),
+        ("normalise", 1, "day_1"),
+        ("fallback", 10, "day_1"),
+        ("cache_miss", 10, "minute_1"),
+        ("cache_hit", 10, "minute_1"),
+    ]
+    return runs
+
+
+def symbols(count):
+    return ["SYM%04d" % i for i in range(count)]
+
+
+@contextlib.contextmanager
+def stand_in_store(fixtures, tickers, upstox_fail=False, cache=False):
+    """Yields a TickerStore wired to the stand-ins instead of the network."""
+    folder = tempfile.mkdtemp(prefix="tickerstore-bench-")
+    cache_dir = os.path.join(folder, "cache")
+    get_history = nsepy.get_history
+    try:
+        with open(os.path.join(folder, "access_token.file"), "w") as file:
+            json.dump({"access_token": "stand-in", "time": int(time.time())}, file)
+
+        kwargs = {"access_token_file_path": folder}
+        if cache:
+            kwargs["cache_dir"] = cache_dir
+        store = TickerStore(**kwargs)
+
+        upstox = StandInUpstox(fixtures, tickers, fail=upstox_fail)
+        nse = StandInNse(fixtures)
+        store.upstox_credentials_verified = True
+        store.upstox_client = upstox
+        store.upstox_client_token = "stand-in"  # Matches access_token.file
+        store.master_contract = MasterContract("NSE_EQ", folder)
+        store.chunk_retries = 0  # A failing stand-in shouldn't wait for backoffs
+
+        nsepy.get_history = nse.get_history
+        yield store, upstox, nse
+    finally:
+        nsepy.get_history = get_history
+        # Every run creates a store, none of them may outlive its folder
+        TokenManager.forget(folder)
+        SharedState.forget(folder)
+        SharedState.forget(cache_dir)
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run_scenario(kind, count, interval_name, fixtures):
+    """Runs a scenario once.
+
+    Returns the number of rows produced, the seconds spent in the measured
+    call and extra counters of the scenario.
+    """
+    interval, (start_date, end_date) = INTERVALS[interval_name]
+    tickers = symbols(count)
+
+    if kind == "normalise":
+        rows = fixtures.upstox_days(tickers[0], interval_name)
+        payload = [row for day in rows.values() for row in day]
+        _reset_peak_memory()
+        started = time.perf_counter()
+        frame = normalize.upstox_frame(payload, tickers[0])
+        return len(frame), time.perf_counter() - started, {}
+
+    cache = kind in ("cache_miss", "cache_hit")
+    with stand_in_store(
+        fixtures, tickers, upstox_fail=kind == "fallback", cache=cache
+    ) as (store, upstox, nse):
+        if kind == "cache_hit":
+            store.historical_data_many(tickers, start_date, end_date, interval)
+            upstox.calls = 0
+
+        _reset_peak_memory()
+        started = time.perf_counter()
+        data, failures = store.historical_data_many(
+            tickers, start_date, end_date, interval
+        )
+        elapsed = time.perf_counter() - started
+
+        extra = {
+            "failures": len(failures),
+            "upstox_calls": upstox.calls,
+            "nse_calls": nse.calls,
+        }
+        return (0 if data is None else len(data)), elapsed, extra
+
+
+def measure(kind, count, interval_name, fixtures, repeat, memory):
+    # Warm up, this also builds the payloads so they aren't part of the timings
+    run_scenario(kind, count, interval_name, fixtures)
+
+    timings = []
+    for _ in range(repeat):
+        rows, elapsed, extra = run_scenario(kind, count, interval_name, fixtures)
+        timings.append(elapsed)
+
+    result = {
+        "name": f"{kind}[{count}x{interval_name}]",
+        "kind": kind,
+        "tickers": count,
+        "interval": interval_name,
+        "repeat": repeat,
+        "seconds": min(timings),
+        "seconds_median": float(numpy.median(timings)),
+        "rows": rows,
+        "rows_per_second": rows / min(timings),
+        "tickers_per_second": count / min(timings),
+    }
+    result.update(extra)
+
+    # Measured separately, tracing allocations slows everything down
+    if memory:
+        tracemalloc.start()
+        run_scenario(kind, count, interval_name, fixtures)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+
+def _reset_peak_memory():
+    """Leaves the setup of a scenario out of its peak memory, where possible."""
+    if tracemalloc.is_tracing() and hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+
+def compare(results, baseline_path):
+    """Prints the change of every scenario against an earlier run."""
+    with open(baseline_path, "r") as file:
+        baseline = {r["name"]: r for r in json.load(file)["scenarios"]}
+
+    print("%-36s %12s %12s %10s" % ("scenario", "old (s)", "new (s)", "change"))
+    for result in results:
+        old = baseline.get(result["name"])
+        if old is None:
+            continue
+        change = (result["seconds"] - old["seconds"]) / old["seconds"] * 100
+        print(
+            "%-36s %12.4f %12.4f %+9.1f%%"
+            % (result["name"], old["seconds"], result["seconds"], change)
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--fixtures", help="folder with recorded payloads")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="run scenarios whose name contains this")
+    parser.add_argument(
+        "--full", action="store_true", help="include 1000 tickers of minute bars"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip peak memory runs"
+    )
+    parser.add_argument("--compare", help="earlier results to compare against")
+    args = parser.parse_args(argv)
+
+    fixtures = {
+        name: Fixtures(span[0], span[1], args.fixtures)
+        for name, (interval, span) in INTERVALS.items()
+    }
+
+    results = []
+    for kind, count, interval_name in scenarios(args.full):
+        name = f"{kind}[{count}x{interval_name}]"
+        if args.only and args.only not in name:
+            continue
+        result = measure(
+            kind,
+            count,
+            interval_name,
+            fixtures[interval_name],
+            args.repeat,
+            memory=not args.no_memory,
+        )
+        print(
+            "%-36s %10.4fs %12.0f rows/s"
+            % (name, result["seconds"], result["rows_per_second"]),
+            file=sys.stderr,
+        )
+        results.append(result)
+
+    report = {
+        "generated_at": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "scenarios": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
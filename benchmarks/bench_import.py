@@ -0,0 +1,112 @@
+"""Import time benchmark of the tickerstore package.
+
+Every module is imported in a fresh interpreter, so nothing is cached between
+runs. Besides the time, the heavy dependencies each import pulled in are
+recorded; an import that loads a dependency it must not load fails the run::
+
+    $ python -m benchmarks.bench_import --output import.json --compare old.json
+"""
+
+import subprocess
+import argparse
+import datetime
+import platform
+import json
+import sys
+
+HEAVY = ["pandas", "numpy", "flask", "upstox_api", "nsepy", "requests", "crayons"]
+
+# Module to the heavy dependencies importing it must not load
+IMPORTS = {
+    "tickerstore": HEAVY,
+    "tickerstore.errors": HEAVY,
+    "tickerstore.metrics": HEAVY,
+    "tickerstore.routing": HEAVY,
+    "tickerstore.coalesce": HEAVY,
+    "tickerstore.shared": HEAVY,
+    "tickerstore.columnar": ["flask", "upstox_api", "nsepy", "requests", "crayons"],
+    "tickerstore.influx": ["flask", "upstox_api", "nsepy", "requests", "crayons"],
+    "tickerstore.store": ["flask", "upstox_api", "nsepy", "requests", "crayons"],
+    "tickerstore.server": ["flask", "upstox_api", "nsepy", "requests", "crayons"],
+    "tickerstore.sync": ["flask", "upstox_api", "nsepy", "requests", "crayons"],
+    "tickerstore.ticks": ["flask", "upstox_api", "nsepy", "requests", "crayons"],
+}
+
+PROBE = """
+import time, sys
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(elapsed)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def measure(module, repeat):
+    """Returns the best import time of a module and the heavy modules it loaded."""
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+            universal_newlines=True,
+        )
+        elapsed, loaded = output.splitlines()[-2:]
+        timings.append(float(elapsed))
+    return min(timings), [name for name in loaded.split(",") if name]
+
+
+def compare(results, baseline_path):
+    """Prints the change of every import against an earlier run."""
+    with open(baseline_path, "r") as file:
+        baseline = {r["module"]: r for r in json.load(file)["imports"]}
+
+    print("%-24s %12s %12s %10s" % ("module", "old (s)", "new (s)", "change"))
+    for result in results:
+        old = baseline.get(result["module"])
+        if old is None:
+            continue
+        change = (result["seconds"] - old["seconds"]) / old["seconds"] * 100
+        print(
+            "%-24s %12.4f %12.4f %+9.1f%%"
+            % (result["module"], old["seconds"], result["seconds"], change)
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="import-results.json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--compare", help="earlier results to compare against")
+    args = parser.parse_args(argv)
+
+    results = []
+    violations = []
+    for module, forbidden in IMPORTS.items():
+        seconds, loaded = measure(module, args.repeat)
+        unexpected = sorted(set(loaded) & set(forbidden))
+        print(
+            "%-24s %8.4fs  loads: %s" % (module, seconds, ", ".join(loaded) or "-"),
+            file=sys.stderr,
+        )
+        if unexpected:
+            violations.append(f"{module} imports {', '.join(unexpected)}")
+        results.append({"module": module, "seconds": seconds, "loaded": loaded})
+
+    report = {
+        "generated_at": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "imports": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+
+    for violation in violations:
+        print(f"FAIL: {violation}", file=sys.stderr)
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,125 @@
+"""Throughput benchmark of the InfluxDB sink.
+
+Synthetic minute bars are written through InfluxSink to a local
+InfluxDB-compatible stand-in, which can be made to lag or fail. The run
+checks that every point arrived and records points per second::
+
+    $ python -m benchmarks.bench_influx --tickers 100 --latency 0.05
+"""
+
+from benchmarks.stand_ins import StandInInflux
+from tickerstore.influx import InfluxSink
+from tickerstore.metrics import InMemorySink
+from tickerstore.metrics import Metrics
+import argparse
+import datetime
+import platform
+import pandas
+import numpy
+import json
+import time
+import sys
+
+
+def minute_bars(symbol, days, seed):
+    """Returns a week's worth of synthetic minute bars of a ticker."""
+    random = numpy.random.RandomState(seed)
+    index = pandas.DatetimeIndex(
+        [
+            pandas.Timestamp("2018-12-24 09:15") + pandas.Timedelta(days=day, minutes=m)
+            for day in range(days)
+            for m in range(375)
+        ],
+        name="timestamp",
+    ).tz_localize("Asia/Kolkata")
+    close = 100 + numpy.cumsum(random.normal(0, 0.1, len(index)))
+    return pandas.DataFrame(
+        {
+            "Open": close.round(2),
+            "High": (close + 0.05).round(2),
+            "Low": (close - 0.05).round(2),
+            "Close": close.round(2),
+            "Volume": random.randint(1, 10000, len(index)).astype(numpy.int64),
+            "Symbol": symbol,
+        },
+        index=index,
+    )
+
+
+def run(args):
+    stand_in = StandInInflux(latency=args.latency, fail=args.fail)
+    memory = InMemorySink()
+    frames = [minute_bars("SYM%04d" % i, args.days, i) for i in range(args.tickers)]
+    sent = sum(len(frame) for frame in frames)
+
+    started = time.perf_counter()
+    with InfluxSink(
+        stand_in.url,
+        "bench",
+        batch_size=args.batch_size,
+        senders=args.senders,
+        metrics=Metrics([memory]),
+    ) as sink:
+        for frame in frames:
+            sink.write(frame, tags={"interval": "minute_1"})
+    elapsed = time.perf_counter() - started
+    stand_in.close()
+
+    received = len(set(stand_in.points["bench"]))
+    return {
+        "points": sent,
+        "received": received,
+        "seconds": elapsed,
+        "points_per_second": sent / elapsed,
+        "requests": stand_in.requests,
+        "bytes_received": stand_in.bytes_received,
+        "backpressure_seconds": memory.summary("influx_backpressure_seconds")["sum"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="influx-results.json")
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--senders", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--fail", type=int, default=0, help="writes answered 503")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print(
+        "%d points in %.2fs: %.0f points/s, %d requests, %d bytes, %.2fs back-pressure"
+        % (
+            result["points"],
+            result["seconds"],
+            result["points_per_second"],
+            result["requests"],
+            result["bytes_received"],
+            result["backpressure_seconds"],
+        ),
+        file=sys.stderr,
+    )
+
+    report = {
+        "generated_at": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "arguments": vars(args),
+        "result": result,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    if result["received"] != result["points"]:
+        print(
+            "FAIL: sent %d points, received %d"
+            % (result["points"], result["received"]),
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
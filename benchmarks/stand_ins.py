@@ -0,0 +1,298 @@
+"""Local stand-ins for the Upstox client and nsepy, replaying recorded data.
+
+Recorded data lives in a fixtures folder::
+
+    <fixtures>/upstox/<SYMBOL>_<interval>.json   get_ohlc payload (list of dicts)
+    <fixtures>/nse/<SYMBOL>.csv                  nsepy.get_history frame
+
+``interval`` is ``minute_1`` or ``day_1``. Symbols without a recording are
+synthesised deterministically, so the benchmarks can run for any number of
+tickers without network access.
+
+StandInInflux is a local HTTP server answering the InfluxDB /write endpoint.
+"""
+
+from upstox_api.api import Instrument
+from upstox_api.api import OHLCInterval
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import urllib.parse
+import collections
+import threading
+import datetime
+import requests
+import pathlib
+import pandas
+import numpy
+import json
+import gzip
+import time
+import zlib
+
+SESSION_MINUTES = 375  # 09:15 to 15:30
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+NSE_COLUMNS = [
+    "Symbol",
+    "Series",
+    "Prev Close",
+    "Open",
+    "High",
+    "Low",
+    "Last",
+    "Close",
+    "VWAP",
+    "Volume",
+    "Turnover",
+    "Trades",
+    "Deliverable Volume",
+    "%Deliverble",
+]
+
+
+class Fixtures:
+    """Recorded or synthesised payloads, grouped by trading day."""
+
+    def __init__(self, start_date, end_date, folder=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.folder = pathlib.Path(folder) if folder else None
+        self.__upstox = {}
+        self.__nse = {}
+
+    def upstox_days(self, symbol, interval):
+        """Returns the get_ohlc rows of a symbol keyed by trading day."""
+        key = (symbol, interval)
+        if key not in self.__upstox:
+            rows = self.__recorded_upstox(symbol, interval)
+            if rows is None:
+                rows = synthesise_upstox(
+                    symbol, interval, self.start_date, self.end_date
+                )
+            days = collections.OrderedDict()
+            for row in rows:
+                day = datetime.datetime.fromtimestamp(
+                    int(row["timestamp"]) / 1000, IST
+                ).date()
+                days.setdefault(day, []).append(row)
+            self.__upstox[key] = days
+        return self.__upstox[key]
+
+    def nse_frame(self, symbol):
+        """Returns the nsepy.get_history frame of a symbol."""
+        if symbol not in self.__nse:
+            frame = self.__recorded_nse(symbol)
+            if frame is None:
+                frame = synthesise_nse(symbol, self.start_date, self.end_date)
+            self.__nse[symbol] = frame
+        return self.__nse[symbol]
+
+    def __recorded_upstox(self, symbol, interval):
+        if self.folder is None:
+            return None
+        path = self.folder / "upstox" / f"{symbol}_{interval}.json"
+        if not path.exists():
+            return None
+        with open(path, "r") as file:
+            return json.load(file)
+
+    def __recorded_nse(self, symbol):
+        if self.folder is None:
+            return None
+        path = self.folder / "nse" / f"{symbol}.csv"
+        if not path.exists():
+            return None
+        frame = pandas.read_csv(path, index_col=0, parse_dates=True)
+        frame.index = frame.index.date
+        return frame
+
+
+class StandInUpstox:
+    """Replays recorded get_ohlc payloads in place of upstox_api.api.Upstox."""
+
+    INTERVALS = {OHLCInterval.Minute_1: "minute_1", OHLCInterval.Day_1: "day_1"}
+
+    def __init__(self, fixtures, symbols, fail=False):
+        self.fixtures = fixtures
+        self.symbols = symbols
+        self.fail = fail  # Raise a connection error on every get_ohlc call
+        self.calls = 0
+
+    def get_master_contract(self, exchange):
+        return collections.OrderedDict(
+            (
+                token,
+                Instrument(
+                    "nse_eq",
+                    token,
+                    None,
+                    symbol.lower(),
+                    symbol,
+                    0.0,
+                    None,
+                    None,
+                    0.05,
+                    1,
+                    "EQ",
+                    None,
+                ),
+            )
+            for token, symbol in enumerate(self.symbols)
+        )
+
+    def get_ohlc(self, instrument, interval, start_date, end_date):
+        self.calls += 1
+        if self.fail:
+            raise requests.ConnectionError("stand-in configured to fail")
+
+        days = self.fixtures.upstox_days(
+            instrument.symbol.upper(), StandInUpstox.INTERVALS[interval]
+        )
+        rows = []
+        for day, day_rows in days.items():
+            if start_date <= day <= end_date:
+                rows.extend(day_rows)
+        return rows
+
+
+class StandInNse:
+    """Replays recorded nsepy.get_history frames."""
+
+    def __init__(self, fixtures):
+        self.fixtures = fixtures
+        self.calls = 0
+
+    def get_history(self, symbol, start, end, **kwargs):
+        self.calls += 1
+        frame = self.fixtures.nse_frame(symbol)
+        dates = numpy.asarray(frame.index)
+        return frame[(dates >= start) & (dates <= end)]
+
+
+class StandInInflux:
+    """
+    Accepts InfluxDB line protocol writes on a local port and keeps the points.
+
+    ``latency`` delays every answer, to make the server lag behind, and the
+    first ``fail`` writes are answered with 503 to exercise retries.
+    """
+
+    def __init__(self, latency=0.0, fail=0):
+        self.latency = latency
+        self.fail = fail
+        self.points = collections.defaultdict(list)  # Database to lines
+        self.requests = 0
+        self.bytes_received = 0
+        self.__lock = threading.Lock()
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stand_in.handle_write(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def handle_write(self, request):
+        url = urllib.parse.urlparse(request.path)
+        body = request.rfile.read(int(request.headers["Content-Length"]))
+        time.sleep(self.latency)
+
+        with self.__lock:
+            self.requests += 1
+            self.bytes_received += len(body)
+            failing = self.fail > 0
+            self.fail -= 1 if failing else 0
+        if url.path != "/write" or failing:
+            request.send_response(503 if failing else 404)
+            request.end_headers()
+            return
+
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        database = urllib.parse.parse_qs(url.query)["db"][0]
+        lines = [line for line in body.decode().split("\n") if line]
+        with self.__lock:
+            self.points[database].extend(lines)
+        request.send_response(204)
+        request.end_headers()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def trading_days(start_date, end_date):
+    """Returns the weekdays between two dates, inclusive."""
+    days = pandas.bdate_range(start_date, end_date)
+    return [day.date() for day in days]
+
+
+def synthesise_upstox(symbol, interval, start_date, end_date):
+    """Builds a deterministic get_ohlc payload in the shape Upstox returns."""
+    days = trading_days(start_date, end_date)
+    minutes = SESSION_MINUTES if interval == "minute_1" else 1
+    rng = numpy.random.RandomState(zlib.crc32(symbol.encode()))
+    count = len(days) * minutes
+
+    midnight = pandas.DatetimeIndex(days).tz_localize("Asia/Kolkata")
+    midnight = numpy.asarray(
+        midnight.tz_convert("UTC").tz_localize(None).values, dtype="datetime64[ms]"
+    ).astype(numpy.int64)
+    if minutes == 1:
+        timestamps = midnight
+    else:
+        offsets = (555 + numpy.arange(minutes)) * 60000
+        timestamps = (midnight[:, None] + offsets[None, :]).ravel()
+
+    close = 100 + numpy.cumsum(rng.normal(0, 0.5, count))
+    spread = numpy.abs(rng.normal(0, 0.3, count))
+    volume = rng.randint(100, 100000, count)
+    return [
+        {
+            "timestamp": str(timestamps[i]),
+            "open": "%.2f" % (close[i] - spread[i] / 2),
+            "high": "%.2f" % (close[i] + spread[i]),
+            "low": "%.2f" % (close[i] - spread[i]),
+            "close": "%.2f" % close[i],
+            "volume": str(volume[i]),
+        }
+        for i in range(count)
+    ]
+
+
+def synthesise_nse(symbol, start_date, end_date):
+    """Builds a deterministic frame in the shape nsepy.get_history returns."""
+    days = trading_days(start_date, end_date)
+    rng = numpy.random.RandomState(zlib.crc32(symbol.encode()))
+    count = len(days)
+    close = 100 + numpy.cumsum(rng.normal(0, 2, count))
+    spread = numpy.abs(rng.normal(0, 1, count))
+    volume = rng.randint(10000, 10000000, count)
+
+    frame = pandas.DataFrame(
+        {
+            "Symbol": symbol,
+            "Series": "EQ",
+            "Prev Close": numpy.roll(close, 1),
+            "Open": close - spread / 2,
+            "High": close + spread,
+            "Low": close - spread,
+            "Last": close,
+            "Close": close,
+            "VWAP": close,
+            "Volume": volume,
+            "Turnover": volume * close * 1e5,
+            "Trades": volume // 10,
+            "Deliverable Volume": volume // 2,
+            "%Deliverble": 0.5,
+        },
+        index=pandas.Index(days, name="Date"),
+        columns=NSE_COLUMNS,
+    )
+    return frame
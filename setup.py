@@ -24,7 +24,14 @@ setuptools.setup(
         "lxml",
         "loguru",
     ],
+    extras_require={"arrow": ["pyarrow"]},
     packages=setuptools.find_packages(),
+    entry_points={
+        "console_scripts": [
+            "tickerstore-sync=tickerstore.sync:main",
+            "tickerstore-serve=tickerstore.server:main",
+        ]
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,53 @@
+from tickerstore.aio import AsyncTickerStore
+from tickerstore.store import TickerStore
+import threading
+import datetime
+import asyncio
+import pandas
+
+
+def daily_bars(ticker, start_date, end_date):
+    index = pandas.date_range(start_date, end_date, freq="D", name="timestamp")
+    return pandas.DataFrame(
+        {"Close": range(len(index)), "Symbol": ticker},
+        index=index.tz_localize("Asia/Kolkata"),
+    )
+
+
+def test_hung_source_does_not_hold_up_the_fallback():
+    fetcher = TickerStore()
+    fetcher.upstox_credentials_verified = True
+    fetcher.set_fetch_order([TickerStore.UPSTOX, TickerStore.NSE])
+    release = threading.Event()
+
+    def hung_upstox(ticker, start_date, end_date, interval):
+        release.wait(5)
+        return daily_bars(ticker, start_date, end_date)
+
+    def nse(ticker, start_date, end_date, interval):
+        return daily_bars(ticker, start_date, end_date)
+
+    fetcher.upstox_historical_data = hung_upstox
+    fetcher.nse_historical_data = nse
+    store = AsyncTickerStore(fetcher, max_workers=4, timeout=0.2)
+    tickers = ["SYM%d" % i for i in range(8)]
+
+    try:
+        data, failures = asyncio.run(
+            store.historical_data_many(
+                tickers,
+                datetime.date(2018, 1, 1),
+                datetime.date(2018, 1, 31),
+                TickerStore.INTERVAL_DAY_1,
+                combine=False,
+            )
+        )
+    finally:
+        release.set()
+        store.close()
+
+    assert failures == {}
+    assert list(data) == tickers
+    sink = fetcher.metrics.sinks[0]
+    assert sink.summary("source_fetch_seconds", source=TickerStore.NSE)["count"] == 8
+    assert sink.counter("source_fallbacks", source=TickerStore.UPSTOX) == 8
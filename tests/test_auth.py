@@ -0,0 +1,57 @@
+from tickerstore.auth import TokenManager
+from tickerstore.auth import token_expiry
+from tickerstore.errors import SourceError
+import threading
+import pytest
+import json
+import time
+
+
+def write_token(folder):
+    """Stores a token, returns the refresh_ahead that makes it due in 0.1s."""
+    issued_at = int(time.time())
+    with open(folder / "access_token.file", "w") as file:
+        json.dump({"access_token": "stored", "time": issued_at}, file)
+    return token_expiry(issued_at) - time.time() - 0.1
+
+
+def timers():
+    return [t for t in threading.enumerate() if isinstance(t, threading.Timer)]
+
+
+def test_interactive_login_is_never_scheduled(tmp_path):
+    manager = TokenManager(tmp_path, refresh_ahead=write_token(tmp_path))
+    assert manager.token() == "stored"
+    assert timers() == []
+
+
+def test_background_refresh_with_an_authorize_callable(tmp_path):
+    refreshed = threading.Event()
+
+    def authorize():
+        refreshed.set()
+        return "fresh"
+
+    manager = TokenManager(
+        tmp_path, authorize=authorize, refresh_ahead=write_token(tmp_path)
+    )
+    assert manager.token() == "stored"
+    assert refreshed.wait(2)
+    manager.stop()
+
+
+def test_hung_login_times_out(tmp_path):
+    release = threading.Event()
+
+    def authorize():
+        release.wait(5)
+        return "late"
+
+    manager = TokenManager(tmp_path, authorize=authorize, timeout=0.2)
+    try:
+        started = time.perf_counter()
+        with pytest.raises(SourceError):
+            manager.token()
+        assert time.perf_counter() - started < 2
+    finally:
+        release.set()
@@ -0,0 +1,74 @@
+from tickerstore.cache import HistoricalDataCache
+from tickerstore.errors import SourceError
+import datetime
+import pandas
+import pytest
+
+
+def daily_bars(start_date, end_date):
+    index = pandas.date_range(start_date, end_date, freq="D", name="timestamp")
+    return pandas.DataFrame(
+        {"Close": range(len(index)), "Symbol": "SBIN"},
+        index=index.tz_localize("Asia/Kolkata"),
+    )
+
+
+def test_failed_fetch_is_retried(tmp_path):
+    cache = HistoricalDataCache(str(tmp_path))
+    start_date = datetime.date(2018, 1, 1)
+    end_date = datetime.date(2018, 1, 31)
+    calls = []
+
+    def failing(start, end):
+        calls.append((start, end))
+        raise SourceError("connection reset")
+
+    with pytest.raises(SourceError):
+        cache.get("upstox", "SBIN", 7, start_date, end_date, failing)
+    assert cache.size() == 0
+
+    def working(start, end):
+        calls.append((start, end))
+        return daily_bars(start, end)
+
+    data = cache.get("upstox", "SBIN", 7, start_date, end_date, working)
+    assert calls == [(start_date, end_date), (start_date, end_date)]
+    assert len(data) == 31
+
+    # Served from disk from now on
+    data = cache.get("upstox", "SBIN", 7, start_date, end_date, failing)
+    assert len(data) == 31
+    assert len(calls) == 2
+
+
+def test_ranges_fetched_before_a_failure_are_kept(tmp_path):
+    cache = HistoricalDataCache(str(tmp_path))
+    start_date = datetime.date(2018, 1, 1)
+    end_date = datetime.date(2018, 3, 31)
+    cache.get(
+        "nse",
+        "SBIN",
+        7,
+        datetime.date(2018, 2, 1),
+        datetime.date(2018, 2, 28),
+        daily_bars,
+    )
+
+    # January is fetched, March fails
+    def march_fails(start, end):
+        if start.month == 3:
+            raise SourceError("timed out")
+        return daily_bars(start, end)
+
+    with pytest.raises(SourceError):
+        cache.get("nse", "SBIN", 7, start_date, end_date, march_fails)
+
+    fetched = []
+
+    def record(start, end):
+        fetched.append((start, end))
+        return daily_bars(start, end)
+
+    data = cache.get("nse", "SBIN", 7, start_date, end_date, record)
+    assert fetched == [(datetime.date(2018, 3, 1), end_date)]
+    assert len(data) == 31 + 28 + 31
@@ -0,0 +1,93 @@
+from tickerstore.coalesce import SingleFlight
+from tickerstore.metrics import InMemorySink
+from tickerstore.metrics import Metrics
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import datetime
+import pandas
+import pytest
+import time
+
+KEY = ("nse", "SBIN", 5)
+START = datetime.date(2018, 1, 1)
+END = datetime.date(2018, 1, 31)
+
+
+def daily_bars(start_date, end_date):
+    index = pandas.date_range(start_date, end_date, freq="D", name="timestamp")
+    return pandas.DataFrame(
+        {"Close": range(len(index))}, index=index.tz_localize("Asia/Kolkata")
+    )
+
+
+def run_together(flight, leader_fetch, followers):
+    """
+    Starts a fetch of START to END, then calls do for each (start, end) of
+    followers while it is in flight. Returns the futures of all the calls.
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        return leader_fetch()
+
+    def unexpected():
+        raise AssertionError("followers share the leader's fetch")
+
+    with ThreadPoolExecutor(max_workers=len(followers) + 1) as executor:
+        futures = [executor.submit(flight.do, KEY, START, END, fetch)]
+        assert started.wait(5)
+        futures += [
+            executor.submit(flight.do, KEY, start, end, unexpected)
+            for start, end in followers
+        ]
+        # Followers block on the leader, there's nothing to signal they did
+        time.sleep(0.1)
+        release.set()
+    return futures
+
+
+def test_concurrent_callers_share_one_fetch():
+    metrics = Metrics([InMemorySink()])
+    flight = SingleFlight(metrics)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return daily_bars(START, END)
+
+    futures = run_together(
+        flight, fetch, [(START, END), (datetime.date(2018, 1, 10), END)]
+    )
+
+    assert len(calls) == 1
+    whole, same, part = [future.result() for future in futures]
+    pandas.testing.assert_frame_equal(same, whole)
+    pandas.testing.assert_frame_equal(part, whole.iloc[9:])
+    assert metrics.sinks[0].counter("coalesced_requests") == 2
+
+
+def test_errors_reach_every_waiter():
+    def fetch():
+        raise RuntimeError("down")
+
+    futures = run_together(SingleFlight(), fetch, [(START, END)] * 3)
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="down"):
+            future.result()
+
+
+def test_later_callers_fetch_afresh():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return daily_bars(START, END)
+
+    flight.do(KEY, START, END, fetch)
+    flight.do(KEY, START, END, fetch)
+    assert len(calls) == 2
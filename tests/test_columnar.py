@@ -0,0 +1,85 @@
+from tickerstore.columnar import ColumnStore
+import datetime
+import pandas
+
+
+def minute_bars(start, count, close=1.0):
+    index = pandas.date_range(start, periods=count, freq="min", name="timestamp")
+    return pandas.DataFrame(
+        {
+            "Open": close,
+            "High": close,
+            "Low": close,
+            "Close": close,
+            "Volume": 1,
+            "Symbol": "SBIN",
+        },
+        index=index.tz_localize("Asia/Kolkata"),
+    )
+
+
+def test_replace_rewrites_bars_from_the_first_given_one(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    assert store.append("SBIN", 2, minute_bars("2018-01-01 09:15", 5)) == 5
+
+    # The last two bars change and one is new, only the new one is counted
+    added = store.append(
+        "SBIN", 2, minute_bars("2018-01-01 09:18", 3, close=2.0), replace=True
+    )
+    assert added == 1
+    assert store.read("SBIN", 2)["Close"].tolist() == [1, 1, 1, 2, 2, 2]
+
+
+def test_replacing_with_fewer_bars_keeps_old_views_readable(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    store.append("SBIN", 2, minute_bars("2018-01-01 09:15", 1000))
+    view = store.read_arrays("SBIN", 2)
+
+    added = store.append(
+        "SBIN", 2, minute_bars("2018-01-01 09:15", 10, close=2.0), replace=True
+    )
+    assert added == 0
+    assert store.rows("SBIN", 2) == 10
+    store.append("SBIN", 2, minute_bars("2018-01-01 09:25", 5))
+    assert store.rows("SBIN", 2) == 15
+
+    # The files didn't shrink under the old view
+    assert len(view["Close"]) == 1000
+    assert float(view["Close"][-1]) == 1.0
+
+
+def test_overlapping_appends_never_duplicate_bars(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    assert store.append("SBIN", 2, minute_bars("2018-01-01 09:15", 5)) == 5
+    # Stored bars are skipped even if they changed, only 09:20 and 09:21 are new
+    assert store.append("SBIN", 2, minute_bars("2018-01-01 09:17", 5, 2.0)) == 2
+    assert store.append("SBIN", 2, minute_bars("2018-01-01 09:15", 3)) == 0
+
+    data = store.read("SBIN", 2)
+    assert data.index.is_unique and data.index.is_monotonic_increasing
+    assert data["Close"].tolist() == [1, 1, 1, 1, 1, 2, 2]
+    assert store.last_timestamp("SBIN", 2) == data.index[-1]
+    assert store.tickers(2) == ["SBIN"]
+
+
+def test_unsorted_frames_are_stored_in_order(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    bars = minute_bars("2018-01-01 09:15", 4)
+    bars["Close"] = [1.0, 2.0, 3.0, 4.0]
+    # The duplicated timestamp keeps its last bar
+    shuffled = pandas.concat([bars.iloc[[2, 0, 3, 1]], bars.iloc[[2]]])
+    shuffled.iloc[-1, shuffled.columns.get_loc("Close")] = 5.0
+
+    assert store.append("SBIN", 2, shuffled) == 4
+    assert store.read("SBIN", 2)["Close"].tolist() == [1, 2, 5, 4]
+
+
+def test_read_a_range(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    store.append("SBIN", 2, minute_bars("2018-01-01 09:15", 3 * 24 * 60))
+
+    day = store.read("SBIN", 2, datetime.date(2018, 1, 2), datetime.date(2018, 1, 2))
+    assert len(day) == 24 * 60
+    assert (day.index.date == datetime.date(2018, 1, 2)).all()
+    assert store.read("SBIN", 2, datetime.date(2019, 1, 1)) is None
+    assert store.read("INFY", 2) is None
@@ -0,0 +1,69 @@
+from tickerstore.store import TickerStore
+import threading
+import datetime
+import time
+
+
+class StandInTokens:
+    def token(self):
+        return "token"
+
+
+class StandInContract:
+    def instrument(self, client, ticker):
+        return ticker
+
+
+class StandInUpstox:
+    """Counts the get_ohlc requests in flight at the same time."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.most = 0
+        self.requests = 0
+
+    def get_ohlc(self, instrument, interval, start, end):
+        with self.lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.most = max(self.most, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        epoch = datetime.datetime(start.year, start.month, start.day)
+        return [
+            {
+                "timestamp": int(epoch.timestamp() * 1000),
+                "open": 1.0,
+                "high": 1.0,
+                "low": 1.0,
+                "close": 1.0,
+                "volume": 1,
+            }
+        ]
+
+
+def test_every_upstox_chunk_counts_against_the_limit():
+    fetcher = TickerStore(
+        source_concurrency={TickerStore.UPSTOX: 2},
+        chunk_days={TickerStore.INTERVAL_MINUTE_1: 1},
+        chunk_workers=8,
+        coalesce=False,
+    )
+    client = StandInUpstox()
+    fetcher.token_manager = StandInTokens()
+    fetcher.upstox_access_token = fetcher.upstox_client_token = "token"
+    fetcher.upstox_client = client
+    fetcher.master_contract = StandInContract()
+
+    data = fetcher.upstox_historical_data(
+        "SBIN",
+        datetime.date(2018, 1, 1),
+        datetime.date(2018, 1, 8),
+        TickerStore.INTERVAL_MINUTE_1,
+    )
+
+    assert data is not None
+    assert client.requests == 8
+    assert client.most == 2
@@ -0,0 +1,63 @@
+from tickerstore.store import TickerStore
+import datetime
+import pandas
+import threading
+import pytest
+
+
+def daily_bars(ticker, start_date, end_date):
+    index = pandas.date_range(start_date, end_date, freq="D", name="timestamp")
+    return pandas.DataFrame(
+        {"Close": range(len(index)), "Symbol": ticker},
+        index=index.tz_localize("Asia/Kolkata"),
+    )
+
+
+def test_batch_hedges_do_not_wait_for_slow_primaries():
+    fetcher = TickerStore()
+    fetcher.upstox_credentials_verified = True
+    fetcher.set_fetch_order([TickerStore.UPSTOX, TickerStore.NSE])
+    release = threading.Event()
+    calls = []  # Source of every call, appending is thread safe
+
+    def hung_upstox(ticker, start_date, end_date, interval):
+        calls.append(TickerStore.UPSTOX)
+        release.wait(5)
+        return daily_bars(ticker, start_date, end_date)
+
+    def nse(ticker, start_date, end_date, interval):
+        calls.append(TickerStore.NSE)
+        return daily_bars(ticker, start_date, end_date)
+
+    fetcher.upstox_historical_data = hung_upstox
+    fetcher.nse_historical_data = nse
+
+    tickers = ["SYM%02d" % i for i in range(16)]
+    try:
+        data, failures = fetcher.historical_data_many(
+            tickers,
+            datetime.date(2018, 1, 1),
+            datetime.date(2018, 1, 31),
+            TickerStore.INTERVAL_DAY_1,
+            max_workers=8,
+            combine=False,
+            hedge_delay=0.05,
+        )
+    finally:
+        release.set()
+        fetcher.close()
+
+    # Upstox never answered in time, so every ticker was won by its NSE hedge
+    assert failures == {}
+    assert list(data) == tickers
+    assert calls.count(TickerStore.NSE) == 16
+    sink = fetcher.metrics.sinks[0]
+    assert sink.counter("hedge_wins", source=TickerStore.NSE) == 16
+    assert sink.counter("hedge_wins", source=TickerStore.UPSTOX) == 0
+
+
+def test_close_stops_the_pools():
+    with TickerStore() as fetcher:
+        pass
+    with pytest.raises(RuntimeError):
+        fetcher.hedge_executor.submit(print)
@@ -0,0 +1,50 @@
+from tickerstore.errors import SourceError
+from tickerstore.errors import SourcesFailedError
+from tickerstore.store import TickerStore
+import datetime
+import pandas
+import pytest
+
+
+def daily_bars(ticker, start_date, end_date):
+    index = pandas.date_range(start_date, end_date, freq="D", name="timestamp")
+    return pandas.DataFrame(
+        {"Close": range(len(index)), "Symbol": ticker},
+        index=index.tz_localize("Asia/Kolkata"),
+    )
+
+
+def iterate(nse):
+    fetcher = TickerStore()
+    fetcher.set_fetch_order([TickerStore.NSE])
+    fetcher.nse_historical_data = nse
+    return fetcher.iter_historical_data(
+        "SBIN",
+        datetime.date(2018, 1, 1),
+        datetime.date(2018, 1, 30),
+        TickerStore.INTERVAL_DAY_1,
+        days_per_fetch=10,
+    )
+
+
+def test_sub_ranges_without_data_are_skipped():
+    def nse(ticker, start_date, end_date, interval):
+        if start_date.day < 10:
+            return None
+        return daily_bars(ticker, start_date, end_date)
+
+    frames = list(iterate(nse))
+    assert frames
+    assert pandas.concat(frames).index[0].day >= 10
+
+
+def test_sub_ranges_every_source_failed_for_raise():
+    def nse(ticker, start_date, end_date, interval):
+        if start_date.day >= 10:
+            raise SourceError("down")
+        return daily_bars(ticker, start_date, end_date)
+
+    frames = iterate(nse)
+    assert next(frames).index[0].day == 1
+    with pytest.raises(SourcesFailedError):
+        list(frames)
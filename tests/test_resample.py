@@ -0,0 +1,36 @@
+from tickerstore.store import TickerStore
+import datetime
+import pandas
+
+
+def daily_bars(ticker, start_date, end_date, interval):
+    index = pandas.bdate_range(start_date, end_date, name="timestamp")
+    close = [float(day.toordinal() % 1000) for day in index]
+    return pandas.DataFrame(
+        {
+            "Open": close,
+            "High": close,
+            "Low": close,
+            "Close": close,
+            "Volume": 1,
+            "Symbol": ticker,
+        },
+        index=index.tz_localize("Asia/Kolkata"),
+    )
+
+
+def test_bars_cover_their_whole_period_whatever_the_start():
+    fetcher = TickerStore()
+    fetcher.set_fetch_order([TickerStore.NSE])
+    fetcher.nse_historical_data = daily_bars
+    end_date = datetime.date(2018, 2, 28)
+
+    for interval in [TickerStore.INTERVAL_WEEK_1, TickerStore.INTERVAL_MONTH_1]:
+        whole = fetcher.historical_data(
+            "SBIN", datetime.date(2018, 1, 1), end_date, interval
+        )
+        late = fetcher.historical_data(
+            "SBIN", datetime.date(2018, 1, 17), end_date, interval
+        )
+        pandas.testing.assert_frame_equal(late, whole.loc[late.index])
+        assert late.index[0] <= pandas.Timestamp("2018-01-17", tz="Asia/Kolkata")
@@ -0,0 +1,66 @@
+from tickerstore.routing import AdaptiveRouter
+from tickerstore.routing import CLOSED
+from tickerstore.routing import HALF_OPEN
+from tickerstore.routing import OPEN
+import threading
+import time
+
+
+def test_circuit_opens_after_consecutive_failures():
+    router = AdaptiveRouter(["upstox", "nse"], failure_threshold=3, cooldown=60)
+    router.record("upstox", False, 1.0)
+    router.record("upstox", True, 1.0)  # Resets the run of failures
+    router.record("upstox", False, 1.0)
+    router.record("upstox", False, 1.0)
+    assert router.health["upstox"].state == CLOSED
+    assert "upstox" in router.order()
+
+    router.record("upstox", False, 1.0)
+    assert router.health["upstox"].state == OPEN
+    assert router.order() == ["nse"]
+
+
+def test_single_trial_after_the_cooldown():
+    router = AdaptiveRouter(["upstox", "nse"], failure_threshold=1, cooldown=0.05)
+    router.record("upstox", False, 1.0)
+    assert router.order() == ["nse"]
+
+    time.sleep(0.1)
+    assert router.order() == ["upstox", "nse"]
+    assert router.health["upstox"].state == HALF_OPEN
+    # Only one request is let through while the trial runs
+    assert router.order() == ["nse"]
+
+    # A failed trial opens the circuit again, a successful one closes it
+    router.record("upstox", False, 1.0)
+    assert router.health["upstox"].state == OPEN
+    time.sleep(0.1)
+    assert "upstox" in router.order()
+    router.record("upstox", True, 1.0)
+    assert router.health["upstox"].state == CLOSED
+
+
+def test_sources_ordered_by_latency():
+    router = AdaptiveRouter(["upstox", "nse"])
+    router.record("upstox", True, 2.0)
+    router.record("nse", True, 0.5)
+    assert router.order() == ["nse", "upstox"]
+
+
+def test_prober_closes_recovered_circuits():
+    router = AdaptiveRouter(["upstox", "nse"], failure_threshold=1, cooldown=0)
+    router.record("upstox", False, 1.0)
+    probed = threading.Event()
+
+    def probe(source):
+        probed.set()
+
+    router.start_probing(probe, interval=0.01)
+    try:
+        assert probed.wait(5)
+        deadline = time.monotonic() + 5
+        while router.health["upstox"].state != CLOSED:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        router.stop_probing()
@@ -0,0 +1,94 @@
+from tickerstore.server import create_app
+from tickerstore.store import TickerStore
+import pandas
+import pytest
+
+QUERY = "start=2018-01-01&end=2018-03-01&interval=day_1"
+
+
+def daily_bars(ticker, start_date, end_date, interval):
+    if ticker == "BAD":
+        return None
+    index = pandas.bdate_range(start_date, end_date, name="timestamp")
+    return pandas.DataFrame(
+        {
+            "Open": 1.0,
+            "High": 2.0,
+            "Low": 0.5,
+            "Close": 1.5,
+            "Volume": 10,
+            "Symbol": ticker,
+        },
+        index=index.tz_localize("Asia/Kolkata"),
+    )
+
+
+@pytest.fixture
+def client():
+    fetcher = TickerStore()
+    fetcher.set_fetch_order([TickerStore.NSE])
+    fetcher.nse_historical_data = daily_bars
+    return create_app(fetcher).test_client()
+
+
+def test_unchanged_bars_are_not_sent_again(client):
+    response = client.get(f"/historical?ticker=SBIN&{QUERY}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.json["data"][0][0] == "2018-01-01T00:00:00+05:30"
+
+    response = client.get(
+        f"/historical?ticker=SBIN&{QUERY}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.data == b""
+
+    # Different bars, different tag
+    response = client.get(
+        f"/historical?ticker=INFY&{QUERY}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_batch_reports_failures(client):
+    response = client.post(
+        f"/historical/batch?{QUERY}", json={"tickers": ["SBIN", "INFY", "BAD"]}
+    )
+    assert response.status_code == 200
+    assert {row[-1] for row in response.json["data"]} == {"SBIN", "INFY"}
+    assert list(response.json["failures"]) == ["BAD"]
+
+
+def test_batch_fields_can_be_sent_in_the_body(client):
+    response = client.post(
+        "/historical/batch",
+        json={"tickers": ["SBIN"], "start": "2018-01-01", "end": "2018-01-05"},
+    )
+    assert response.status_code == 200
+    assert len(response.json["data"]) == 5
+
+
+@pytest.mark.parametrize(
+    "body, error",
+    [
+        (None, "Body must be a JSON object"),
+        (["SBIN"], "Body must be a JSON object"),
+        ({"tickers": "SBIN"}, "tickers must be a non-empty list of strings"),
+        ({"tickers": []}, "tickers must be a non-empty list of strings"),
+        ({"tickers": ["SBIN", 1]}, "tickers must be a non-empty list of strings"),
+        ({"tickers": ["SBIN"], "start": 20180101}, "start must be a string"),
+        ({"tickers": ["SBIN"], "foo": "x"}, "Unknown fields foo"),
+    ],
+)
+def test_invalid_batch_bodies_are_rejected(client, body, error):
+    response = client.post(f"/historical/batch?{QUERY}", json=body)
+    assert response.status_code == 400
+    assert response.json == {"error": error}
+
+
+def test_malformed_json_is_rejected(client):
+    response = client.post(
+        f"/historical/batch?{QUERY}", data="{", content_type="application/json"
+    )
+    assert response.status_code == 400
@@ -0,0 +1,67 @@
+from tickerstore.columnar import ColumnStore
+from tickerstore.store import TickerStore
+from tickerstore.sync import sync
+import datetime
+import pandas
+
+
+class StandInFetcher:
+    """Returns daily bars for every business day of the requested range."""
+
+    def historical_data_many(
+        self, tickers, start_date, end_date, interval, *args, **kwargs
+    ):
+        index = pandas.bdate_range(start_date, end_date, name="timestamp")
+        frames = {
+            ticker: pandas.DataFrame(
+                {
+                    "Open": 1.0,
+                    "High": 1.0,
+                    "Low": 1.0,
+                    "Close": 1.0,
+                    "Volume": 1,
+                    "Symbol": ticker,
+                },
+                index=index.tz_localize("Asia/Kolkata"),
+            )
+            for ticker in tickers
+        }
+        return frames, {}
+
+
+def test_refetched_bars_are_not_counted_as_new(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    start_date = datetime.date(2018, 1, 1)
+    end_date = datetime.date(2018, 1, 5)
+
+    stats = sync(
+        StandInFetcher(),
+        store,
+        ["SBIN", "INFY"],
+        TickerStore.INTERVAL_DAY_1,
+        start_date,
+        end_date,
+    )
+    assert (stats.tickers, stats.up_to_date, stats.bars) == (2, 0, 10)
+
+    # The last day is fetched again and replaced, but nothing is new
+    stats = sync(
+        StandInFetcher(),
+        store,
+        ["SBIN", "INFY"],
+        TickerStore.INTERVAL_DAY_1,
+        start_date,
+        end_date,
+    )
+    assert (stats.tickers, stats.up_to_date, stats.bars) == (0, 2, 0)
+
+    stats = sync(
+        StandInFetcher(),
+        store,
+        ["SBIN"],
+        TickerStore.INTERVAL_DAY_1,
+        start_date,
+        datetime.date(2018, 1, 9),
+    )
+    assert (stats.tickers, stats.up_to_date, stats.bars) == (1, 0, 2)
+    assert store.rows("SBIN", TickerStore.INTERVAL_DAY_1) == 7
@@ -0,0 +1,75 @@
+from tickerstore.resample import MINUTE
+from tickerstore.ticks import BarAggregator
+import numpy
+import pandas
+
+
+def wall_clock(time):
+    """IST wall clock time as nanoseconds since epoch."""
+    return pandas.Timestamp(f"2018-01-01 {time}").value
+
+
+def ticks(*rows):
+    symbols, times, prices, quantities = zip(*rows)
+    return (
+        numpy.array(symbols, dtype=numpy.int32),
+        numpy.array([wall_clock(time) for time in times], dtype=numpy.int64),
+        numpy.array(prices, dtype=numpy.float64),
+        numpy.array(quantities, dtype=numpy.int64),
+    )
+
+
+def test_ticks_are_folded_into_bars_whatever_their_order():
+    aggregator = BarAggregator(5)
+    bars = aggregator.add(
+        *ticks(
+            (0, "09:16:00", 101.0, 1),
+            (0, "09:15:00", 100.0, 2),
+            (0, "09:18:00", 99.0, 3),
+            (0, "09:20:30", 102.0, 4),  # Opens the next bar
+        )
+    )
+    assert bars["start"].tolist() == [wall_clock("09:15")]
+    assert bars["Open"].tolist() == [100.0]
+    assert bars["High"].tolist() == [101.0]
+    assert bars["Low"].tolist() == [99.0]
+    assert bars["Close"].tolist() == [99.0]
+    assert bars["Volume"].tolist() == [6]
+    assert aggregator.late == 0
+
+
+def test_late_ticks_are_counted_not_folded():
+    aggregator = BarAggregator(5)
+    aggregator.add(*ticks((0, "09:15:00", 100.0, 1), (0, "09:21:00", 101.0, 1)))
+
+    # A tick of the bar already completed doesn't change the open one
+    bars = aggregator.add(*ticks((0, "09:19:00", 500.0, 7)))
+    assert len(bars["start"]) == 0
+    assert aggregator.late == 1
+
+    bars = aggregator.close_all()
+    assert bars["start"].tolist() == [wall_clock("09:20")]
+    assert bars["High"].tolist() == [101.0]
+    assert bars["Volume"].tolist() == [1]
+
+    # Nor does a tick of an expired bar reopen it
+    aggregator.add(*ticks((0, "09:22:00", 500.0, 7)))
+    assert aggregator.late == 2
+
+
+def test_expire_completes_bars_after_the_grace():
+    aggregator = BarAggregator(1)
+    aggregator.add(*ticks((0, "09:15:10", 100.0, 1), (1, "09:15:20", 200.0, 1)))
+
+    assert len(aggregator.expire(wall_clock("09:16:00"), grace=MINUTE)["start"]) == 0
+    bars = aggregator.expire(wall_clock("09:17:00"), grace=MINUTE)
+    assert bars["symbol"].tolist() == [0, 1]
+    assert bars["Close"].tolist() == [100.0, 200.0]
+
+
+def test_ticks_outside_the_session_are_ignored():
+    aggregator = BarAggregator(1)
+    bars = aggregator.add(*ticks((0, "09:00:00", 100.0, 1), (0, "15:30:00", 1.0, 1)))
+    assert len(bars["start"]) == 0
+    assert len(aggregator.close_all()["start"]) == 0
+    assert aggregator.late == 0
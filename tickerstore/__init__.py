@@ -1,4 +1,47 @@
-from tickerstore import daemon
-from tickerstore import errors
-from tickerstore import store
-from tickerstore import tempserver
+"""
+Historical stock market data from multiple sources.
+
+Submodules are imported on first use, so ``import tickerstore`` stays cheap
+for jobs that only need a part of the package. Logging is disabled until the
+caller enables it with ``loguru.logger.enable("tickerstore")``.
+"""
+
+from loguru import logger
+import importlib
+
+logger.disable("tickerstore")
+
+__all__ = [
+    "aio",
+    "auth",
+    "cache",
+    "coalesce",
+    "columnar",
+    "contracts",
+    "daemon",
+    "errors",
+    "export",
+    "indicators",
+    "influx",
+    "metrics",
+    "normalize",
+    "ranges",
+    "resample",
+    "routing",
+    "server",
+    "shared",
+    "store",
+    "sync",
+    "tempserver",
+    "ticks",
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"tickerstore.{name}")
+    raise AttributeError(f"module 'tickerstore' has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,271 @@
+from tickerstore.errors import SourceError
+from tickerstore.store import TickerStore
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+import functools
+import asyncio
+import pandas
+import time
+
+
+class AsyncTickerStore:
+    """
+    asyncio interface to TickerStore.
+
+    Source fetches run on one thread pool per source, so they never block the
+    event loop and a source that hangs can't hold up the others. Sources are
+    tried in the fetch order of the wrapped TickerStore, exactly like
+    TickerStore.historical_data does, and fetches are recorded in its metrics
+    and router. A source that raises SourceError or doesn't answer within the
+    timeout falls back to the next one.
+
+    Cancelling a coroutine stops waiting for the fetch, the worker thread
+    itself finishes in the background and its result is discarded. Until it
+    does, it keeps its slot of the source's concurrency limit.
+    """
+
+    def __init__(
+        self, store=None, max_workers=16, source_concurrency=None, timeout=None
+    ):
+        """
+        Parameters
+        ---------
+            store: TickerStore
+                TickerStore to wrap. A new one is created if None.
+            max_workers: int
+                Maximum number of fetches running at the same time on each source.
+            source_concurrency: dict
+                Maximum number of concurrent fetches for each source.
+                eg. {TickerStore.NSE: 4}
+            timeout: float
+                Seconds to wait for a source before falling back to the next one.
+                None waits forever.
+        """
+        self.store = store if store is not None else TickerStore()
+        self.timeout = timeout
+        self.max_workers = max_workers
+        # Runs the calls that aren't fetches, eg. picking the sources
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.source_concurrency = dict(source_concurrency or {})
+        self.__executors = {}  # Source to the pool its fetches run on
+        self.__semaphores = {}  # Created lazily, they must belong to the running loop
+
+    @classmethod
+    async def create(
+        cls, max_workers=16, source_concurrency=None, timeout=None, **kwargs
+    ):
+        """
+        Creates the wrapped TickerStore without blocking the event loop.
+
+        TickerStore reads its access token from disk when it is created and
+        verifies the Upstox credentials over the network the first time a
+        source is picked. Both happen on the thread pool here, so this should
+        be preferred over creating it inside a coroutine. All keyword
+        arguments not listed below are passed to TickerStore.
+
+        Parameters
+        ---------
+            max_workers: int
+                Maximum number of fetches running at the same time on each source.
+            source_concurrency: dict
+                Maximum number of concurrent fetches for each source.
+            timeout: float
+                Seconds to wait for a source before falling back to the next one.
+
+        Returns
+        -------
+        AsyncTickerStore
+        """
+        instance = cls(
+            store=None,
+            max_workers=max_workers,
+            source_concurrency=source_concurrency,
+            timeout=timeout,
+        )
+        loop = asyncio.get_running_loop()
+        instance.store = await loop.run_in_executor(
+            instance.executor, functools.partial(TickerStore, **kwargs)
+        )
+        await loop.run_in_executor(instance.executor, instance.store.available_sources)
+        return instance
+
+    async def historical_data(
+        self, ticker, start_date, end_date, interval, timeout=None
+    ):
+        """
+        Fetches data from multiple sources.
+
+        Parameters
+        ---------
+            ticker: str
+                String representing the ticker symbol. eg. "SBIN"
+            start_date: datetime.date
+                Date from where historical data needs to be fetched. Eg. date(2018,1,1)
+            end_date: datetime.date
+                Date uptil which you want the historical data to be fetched. Eg. date(2018,6,1)
+            interval: int
+                Make use of INTERVAL_* variables in TickerStore class to specify the
+                time interval in which to operate on.
+            timeout: float
+                Seconds to wait for each source. Defaults to the timeout of the instance.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Bars indexed by an IST aware timestamp with Open, High, Low, Close,
+            Volume and Symbol columns. None if there is no data.
+        """
+        data, errors = await self.__fetch_with_fallback(
+            ticker, start_date, end_date, interval, timeout
+        )
+        if data is None:
+            logger.error(f"None of the source provided any data for {ticker}")
+        return data
+
+    async def historical_data_many(
+        self, tickers, start_date, end_date, interval, timeout=None, combine=True
+    ):
+        """
+        Fetches data for multiple tickers concurrently.
+
+        Parameters
+        ---------
+            tickers: list
+                List of ticker symbols. eg. ["SBIN", "RELIANCE"]
+            start_date: datetime.date
+                Date from where historical data needs to be fetched. Eg. date(2018,1,1)
+            end_date: datetime.date
+                Date uptil which you want the historical data to be fetched. Eg. date(2018,6,1)
+            interval: int
+                Make use of INTERVAL_* variables in TickerStore class to specify the
+                time interval in which to operate on.
+            timeout: float
+                Seconds to wait for each source. Defaults to the timeout of the instance.
+            combine: bool
+                If True, return a single DataFrame with all the tickers. Otherwise
+                return a dict of DataFrames keyed by ticker.
+
+        Returns
+        -------
+        tuple
+            (data, failures) in the same form as TickerStore.historical_data_many.
+        """
+        results = await asyncio.gather(
+            *[
+                self.__fetch_with_fallback(
+                    ticker, start_date, end_date, interval, timeout
+                )
+                for ticker in tickers
+            ],
+            return_exceptions=True,
+        )
+
+        frames = {}
+        failures = {}
+        for ticker, result in zip(tickers, results):
+            if isinstance(result, Exception):
+                failures[ticker] = str(result)
+                continue
+
+            data, errors = result
+            if data is None:
+                failures[ticker] = "No data returned. %s" % "; ".join(errors)
+            else:
+                frames[ticker] = data
+
+        if not combine:
+            return frames, failures
+
+        if not frames:
+            return None, failures
+
+        return pandas.concat(list(frames.values())), failures
+
+    def close(self):
+        """Shuts down the thread pools used for fetching, and the store's."""
+        self.executor.shutdown(wait=False)
+        for executor in self.__executors.values():
+            executor.shutdown(wait=False)
+        self.store.close()
+
+    async def __fetch_with_fallback(
+        self, ticker, start_date, end_date, interval, timeout
+    ):
+        """Tries every source in fetch order, returns the data and the errors seen."""
+        timeout = timeout if timeout is not None else self.timeout
+        loop = asyncio.get_running_loop()
+        errors = []
+
+        # Picking the sources may verify the Upstox credentials over the network
+        sources = await loop.run_in_executor(
+            self.executor, self.store.available_sources, interval
+        )
+        for source in sources:
+            # Records its outcome in the metrics and router of the store
+            fetch = functools.partial(
+                self.store.fetch_source,
+                source,
+                ticker,
+                start_date,
+                end_date,
+                interval,
+            )
+            started = time.perf_counter()
+            try:
+                data = await self.__run(loop, source, fetch, timeout)
+                return data, errors
+
+            except SourceError as e:
+                errors.append(f"{source}: {e}")
+
+            except asyncio.TimeoutError:
+                logger.error(f"{source} did not answer within {timeout}s")
+                errors.append(f"{source}: timed out after {timeout}s")
+                self.store.record_source_result(
+                    source, False, time.perf_counter() - started
+                )
+            self.store.metrics.increment("source_fallbacks", source=source)
+
+        return None, errors
+
+    async def __run(self, loop, source, fetch, timeout):
+        """Runs fetch on the pool of a source, waiting at most timeout seconds."""
+        semaphore = self.__semaphore(source)
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            future = loop.run_in_executor(self.__executor(source), fetch)
+        except BaseException:
+            if semaphore is not None:
+                semaphore.release()
+            raise
+
+        # The slot is only given back once the thread is done, not when the
+        # caller stops waiting, so a hung source can't exceed its limit
+        future.add_done_callback(functools.partial(_finished, semaphore))
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def __executor(self, source):
+        if source not in self.__executors:
+            self.__executors[source] = ThreadPoolExecutor(
+                max_workers=self.source_concurrency.get(source, self.max_workers)
+            )
+        return self.__executors[source]
+
+    def __semaphore(self, source):
+        limit = self.source_concurrency.get(source)
+        if limit is None:
+            return None
+        if source not in self.__semaphores:
+            self.__semaphores[source] = asyncio.Semaphore(limit)
+        return self.__semaphores[source]
+
+
+def _finished(semaphore, future):
+    """Gives back the slot of a fetch whose thread is done."""
+    if semaphore is not None:
+        semaphore.release()
+    # Retrieves the error of a fetch nobody waits for anymore, so asyncio
+    # doesn't report it as never retrieved
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,322 @@
+from tickerstore.errors import SourceError
+from tickerstore.errors import TickerStoreError
+from tickerstore.shared import SharedState
+from tickerstore.shared import atomic_file
+from loguru import logger
+import contextlib
+import threading
+import datetime
+import hashlib
+import pathlib
+import json
+import time
+
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+TOKEN_EXPIRY = datetime.time(3, 30)  # Upstox access tokens expire at 03:30 IST
+VERIFIED_FOR = 24 * 60 * 60  # Seconds a successful credential check is trusted
+LOCK_TIMEOUT = 15 * 60  # Seconds a login may take before its lock is taken over
+
+_verified = {}  # Credentials hash to the time they were verified
+_verified_lock = threading.Lock()
+
+
+def verify_credentials(api_key, api_secret, redirect_uri, folder):
+    """
+    Checks Upstox credentials against the login URL, remembering the result.
+
+    A successful check is kept in memory and in the shared state of folder, so
+    other instances and processes skip the round-trip for VERIFIED_FOR
+    seconds.
+
+    Parameters
+    ---------
+        api_key: str
+            Upstox API key.
+        api_secret: str
+            Upstox API secret.
+        redirect_uri: str
+            Redirect URI registered with Upstox.
+        folder: str
+            Folder in which the result is persisted.
+
+    Returns
+    -------
+    bool
+        True if Upstox accepted the credentials.
+    """
+    if not (api_key and api_secret and redirect_uri):
+        logger.error(
+            "Unable to access values of UPSTOX_API_KEY, UPSTOX_API_SECRET or UPSTOX_REDIRECT_URI"
+        )
+        return False
+
+    key = hashlib.sha256(
+        "\n".join([api_key, api_secret, redirect_uri]).encode()
+    ).hexdigest()
+    key = f"credentials:{key}"
+    shared = SharedState.for_folder(folder)
+
+    with _verified_lock:
+        if time.time() - _verified.get(key, 0) < VERIFIED_FOR:
+            return True
+
+        checked = shared.get(key, 0)
+        if time.time() - checked < VERIFIED_FOR:
+            logger.debug("Credentials were verified by another process")
+            _verified[key] = checked
+            return True
+
+        logger.debug("Verifying API key and secret credentials")
+        from upstox_api.api import Session
+        import requests
+
+        try:
+            s = Session(api_key)
+            s.set_redirect_uri(redirect_uri)
+            s.set_api_secret(api_secret)
+            req = requests.get(s.get_login_url())
+        except requests.ConnectionError:
+            logger.exception("ConnectionError while verifying Upstox credentials")
+            return False
+
+        if req.status_code != 200:
+            # Something, wrong with the API or credentials provided
+            logger.debug(f"Unable to verify credentials. Status: {req.status_code}")
+            return False
+
+        _verified[key] = time.time()
+        shared.set(key, _verified[key])
+        return True
+
+
+def token_expiry(issued_at):
+    """Returns the time (in seconds since the epoch) a token issued at issued_at expires."""
+    issued = datetime.datetime.fromtimestamp(issued_at, IST)
+    expiry = datetime.datetime.combine(issued.date(), TOKEN_EXPIRY, tzinfo=IST)
+    if expiry <= issued:
+        expiry += datetime.timedelta(days=1)
+    return expiry.timestamp()
+
+
+class TokenManager:
+    """
+    Holds the Upstox access token in memory until it expires.
+
+    The token is persisted to access_token.file so other processes can use it.
+    Refreshing is shared: threads wait for a refresh that is already running and
+    processes take a shared lock and pick up the token another process wrote
+    while they waited. With a non-interactive authorize callable, a timer
+    refreshes the token ahead of its expiry, so requests don't have to.
+
+    Nobody waits longer than timeout for a login. After that SourceError is
+    raised, so fetches fall back to the next source.
+
+    Use TokenManager.for_folder to share a manager between TickerStore
+    instances.
+    """
+
+    _managers = {}  # Folder to manager
+    _managers_lock = threading.Lock()
+
+    def __init__(
+        self,
+        folder,
+        authorize=None,
+        metrics=None,
+        refresh_ahead=15 * 60,
+        timeout=LOCK_TIMEOUT,
+    ):
+        """
+        Parameters
+        ---------
+            folder: str
+                Folder in which access_token.file is stored.
+            authorize: callable
+                Returns a new access token without user interaction. None logs in
+                with the interactive daemon.auth_upstox, only when a request
+                needs a token.
+            metrics: tickerstore.metrics.Metrics
+                Records how long refreshing takes.
+            refresh_ahead: float
+                Seconds before expiry at which the token is refreshed in the
+                background. Only used with an authorize callable, None disables
+                background refreshing.
+            timeout: float
+                Seconds to wait for a login, whether it runs in this thread or
+                another thread or process is running it.
+        """
+        self.path = pathlib.Path(folder) / "access_token.file"
+        self.shared = SharedState.for_folder(folder)
+        self.authorize = authorize
+        self.metrics = metrics
+        self.refresh_ahead = refresh_ahead
+        self.timeout = timeout
+
+        self.access_token = None
+        self.expires_at = 0.0
+        self.__lock = threading.Lock()
+        self.__timer = None
+
+    @classmethod
+    def for_folder(cls, folder, **kwargs):
+        """Returns the manager of a folder, creating it on first use."""
+        key = str(pathlib.Path(folder).resolve())
+        with cls._managers_lock:
+            if key not in cls._managers:
+                cls._managers[key] = cls(folder, **kwargs)
+            return cls._managers[key]
+
+    @classmethod
+    def forget(cls, folder):
+        """Stops and drops the manager of a folder, if there is one."""
+        key = str(pathlib.Path(folder).resolve())
+        with cls._managers_lock:
+            manager = cls._managers.pop(key, None)
+        if manager is not None:
+            manager.stop()
+
+    def token(self):
+        """Returns a valid access token, refreshing it only if it expired."""
+        if self.access_token is not None and time.time() < self.expires_at:
+            return self.access_token
+
+        with self.__locked():
+            # Another thread might have refreshed it while this one waited
+            if self.access_token is None or time.time() >= self.expires_at:
+                self.__load_or_refresh(force=False)
+            return self.access_token
+
+    def refresh(self):
+        """Fetches a new access token, even if the current one is still valid."""
+        with self.__locked():
+            self.__load_or_refresh(force=True)
+            return self.access_token
+
+    def stop(self):
+        """Cancels the background refresh."""
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+
+    @contextlib.contextmanager
+    def __locked(self):
+        if not self.__lock.acquire(timeout=self.timeout):
+            raise SourceError(
+                f"timed out after {self.timeout}s waiting for the Upstox login"
+            )
+        try:
+            yield
+        except TickerStoreError as e:
+            # Eg. another process held the login lock for longer than timeout
+            raise SourceError(str(e))
+        finally:
+            self.__lock.release()
+
+    def __load_or_refresh(self, force):
+        previous = self.access_token
+        if not force and self.__load():
+            return
+
+        with self.shared.lock("access_token", lease=LOCK_TIMEOUT, timeout=self.timeout):
+            # Another process might have written a new token meanwhile
+            if self.__load() and self.access_token != previous:
+                return
+
+            logger.debug("Getting a new Upstox access token")
+            authorize = self.authorize
+            if authorize is None:
+                from tickerstore import daemon
+
+                authorize = daemon.auth_upstox
+
+            started = time.perf_counter()
+            access_token = _call_with_timeout(authorize, self.timeout)
+            if self.metrics is not None:
+                self.metrics.observe(
+                    "token_refresh_seconds", time.perf_counter() - started
+                )
+
+            issued_at = time.time()
+            self.__set(access_token, token_expiry(issued_at))
+            _write_json(
+                self.path,
+                {
+                    "access_token": access_token,
+                    "time": int(issued_at),
+                    "expires_at": self.expires_at,
+                },
+            )
+
+    def __load(self):
+        """Uses the token in access_token.file if it hasn't expired."""
+        data = _read_json(self.path)
+        if "access_token" not in data:
+            return False
+
+        expires_at = data.get("expires_at") or token_expiry(data["time"])
+        if time.time() >= expires_at:
+            logger.debug("access_token.file contains an expired token")
+            return False
+
+        self.__set(data["access_token"], expires_at)
+        return True
+
+    def __set(self, access_token, expires_at):
+        self.access_token = access_token
+        self.expires_at = expires_at
+        self.__schedule_refresh()
+
+    def __schedule_refresh(self):
+        self.stop()
+        # An interactive login can't run unattended, it waits for a request
+        if self.refresh_ahead is None or self.authorize is None:
+            return
+
+        delay = self.expires_at - self.refresh_ahead - time.time()
+        if delay <= 0:
+            return
+
+        self.__timer = threading.Timer(delay, self.__background_refresh)
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def __background_refresh(self):
+        logger.debug("Refreshing the Upstox access token ahead of its expiry")
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Unable to refresh the Upstox access token")
+
+
+def _call_with_timeout(function, timeout):
+    """Returns function(), raising SourceError if it takes longer than timeout."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["value"] = function()
+        except BaseException as e:
+            outcome["error"] = e
+
+    # A daemon thread, so a login nobody answers doesn't keep the process alive
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise SourceError(f"Upstox login didn't finish within {timeout}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    with atomic_file(path, "w") as file:
+        json.dump(data, file)
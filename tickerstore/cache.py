@@ -0,0 +1,304 @@
+from tickerstore.ranges import merge_ranges
+from tickerstore.ranges import missing_ranges
+from tickerstore.shared import SharedState
+from tickerstore.shared import atomic_file
+from loguru import logger
+import contextlib
+import datetime
+import hashlib
+import pickle
+import pathlib
+import pandas
+import numpy
+import json
+import threading
+import time
+import re
+
+
+class HistoricalDataCache:
+    """
+    On-disk cache of the bars fetched from every source.
+
+    Bars are stored one file per (source, ticker, interval) key, together with
+    the date ranges that have already been fetched for that key. Requests are
+    served from disk and only the missing date ranges are fetched from the
+    source. When the cache grows above ``size_limit`` bytes the least recently
+    used keys are evicted.
+
+    Processes sharing a cache folder fetch every key once between them: a key
+    is locked while its gaps are fetched and the index is re-read whenever
+    another process changed it.
+    """
+
+    FORMAT_VERSION = 2
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir, size_limit=None, refetch_today=True):
+        """
+        Parameters
+        ---------
+            cache_dir: str
+                Folder in which the cached bars are stored. Created if missing.
+            size_limit: int
+                Maximum size of the cache on disk in bytes. None means unbounded.
+            refetch_today: bool
+                If True, bars of the current trading day are never treated as
+                cached and are always fetched again.
+        """
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.size_limit = size_limit
+        self.refetch_today = refetch_today
+        self.shared = SharedState.for_folder(cache_dir)
+        self.__index_signature = None  # Stat of the index file when it was read
+        self.index = self.__load_index()
+        self.__lock = threading.RLock()  # Guards the index
+        self.__key_locks = {}  # One lock per key, held while its gaps are fetched
+
+    def get(self, source, ticker, interval, start_date, end_date, fetch):
+        """
+        Returns bars for the requested window, fetching only what is missing.
+
+        Parameters
+        ---------
+            source: str
+                Name of the source the bars come from. eg. TickerStore.NSE
+            ticker: str
+                Ticker symbol the bars belong to.
+            interval: int
+                One of the TickerStore.INTERVAL_* values.
+            start_date: datetime.date
+                Date from where historical data is needed.
+            end_date: datetime.date
+                Date uptil which historical data is needed.
+            fetch: callable
+                Called as ``fetch(start_date, end_date)`` for every missing date
+                range. Must return a DataFrame or None if there is no data, and
+                raise if the source failed. Only ranges whose fetch returned are
+                marked as cached, the others are fetched again on the next call.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Bars between start_date and end_date, or None if there are none.
+        """
+        key = self.__key(source, ticker, interval)
+        with self.__lock:
+            key_lock = self.__key_locks.setdefault(key, threading.Lock())
+
+        with key_lock, self.shared.lock(f"cache:{key}"):
+            with self.__lock:
+                self.__refresh_index()
+                entry = self.index["entries"].get(key)
+                frame = self.__load_frame(entry)
+                covered = self.__covered_ranges(entry)
+
+            gaps = missing_ranges(covered, start_date, end_date)
+            fetched, error = [], None
+            if gaps:
+                logger.debug(
+                    f"Cache miss for {key}, fetching {len(gaps)} date range(s)"
+                )
+                for gap_start, gap_end in gaps:
+                    try:
+                        fetched.append(fetch(gap_start, gap_end))
+                    except Exception as e:
+                        error = e
+                        break
+            else:
+                logger.debug(f"Cache hit for {key}")
+
+            # The ranges fetched before a failure are kept, the failed one and
+            # those after it stay missing
+            done = gaps[: len(fetched)]
+            if done:
+                frame = self.__merge(frame, fetched, done)
+                file_name, size = self.__write_frame(key, entry, frame)
+
+            with self.__index_transaction():
+                if done:
+                    self.__store(key, file_name, size, covered + done)
+                entry = self.index["entries"].get(key)
+                if entry is not None:
+                    entry["last_access"] = time.time()
+                    self.__evict(keep=key)
+
+            if error is not None:
+                raise error
+            return self.__slice(frame, start_date, end_date)
+
+    def clear(self):
+        """Removes every cached bar from disk."""
+        with self.__index_transaction():
+            for entry in self.index["entries"].values():
+                self.__remove_file(entry)
+            self.index["entries"] = {}
+
+    def size(self):
+        """Returns the size of the cached bars on disk in bytes."""
+        with self.__lock:
+            self.__refresh_index()
+            return self.__size()
+
+    def __size(self):
+        return sum(entry["size"] for entry in self.index["entries"].values())
+
+    def __key(self, source, ticker, interval):
+        return f"{source}|{ticker}|{interval}"
+
+    def __covered_ranges(self, entry):
+        """Returns the date ranges of an entry that can be served from disk."""
+        if entry is None:
+            return []
+
+        last_cacheable_day = datetime.date.today()
+        if self.refetch_today:
+            last_cacheable_day -= datetime.timedelta(days=1)
+
+        covered = []
+        for start, end in entry["ranges"]:
+            start = datetime.date.fromisoformat(start)
+            end = min(datetime.date.fromisoformat(end), last_cacheable_day)
+            if start <= end:
+                covered.append((start, end))
+        return covered
+
+    def __merge(self, frame, fetched, gaps):
+        """Replaces the rows of the gap ranges in frame with the fetched bars."""
+        if frame is not None:
+            dates = _index_dates(frame)
+            stale = numpy.zeros(len(frame), dtype=bool)
+            for gap_start, gap_end in gaps:
+                stale |= (dates >= gap_start) & (dates <= gap_end)
+            frame = frame[~stale]
+
+        frames = [f for f in [frame] + fetched if f is not None and len(f) > 0]
+        if not frames:
+            return None
+
+        merged = pandas.concat(frames).sort_index()
+        return merged[~merged.index.duplicated(keep="last")]
+
+    def __write_frame(self, key, entry, frame):
+        """Writes a frame to disk, returns its file name and size."""
+        file_name = entry["file"] if entry else self.__file_name(key)
+        path = self.cache_dir / file_name
+
+        if frame is None:
+            if path.exists():
+                path.unlink()
+            return file_name, 0
+
+        with atomic_file(path) as file:
+            pickle.dump(frame, file, protocol=pickle.HIGHEST_PROTOCOL)
+        return file_name, path.stat().st_size
+
+    def __store(self, key, file_name, size, ranges):
+        """Records the file of a key and the ranges it covers."""
+        # Dates after today can't have bars yet, so they are never marked as fetched
+        today = datetime.date.today()
+        ranges = [(start, min(end, today)) for start, end in ranges if start <= today]
+
+        self.index["entries"][key] = {
+            "file": file_name,
+            "ranges": [
+                [start.isoformat(), end.isoformat()]
+                for start, end in merge_ranges(ranges)
+            ],
+            "size": size,
+            "last_access": time.time(),
+        }
+
+    def __file_name(self, key):
+        # The hash keeps names unique without looking at the other entries,
+        # which might be changed by another process meanwhile
+        name = re.sub(r"[^A-Za-z0-9_-]+", "_", key)
+        digest = hashlib.sha1(key.encode()).hexdigest()[:8]
+        return f"{name}_{digest}.pkl"
+
+    def __load_frame(self, entry):
+        if entry is None or entry["size"] == 0:
+            return None
+        path = self.cache_dir / entry["file"]
+        try:
+            return pandas.read_pickle(str(path))
+        except FileNotFoundError:
+            # Evicted by another process, its ranges are fetched again
+            logger.warning(f"Cached file {path} is missing")
+            entry["ranges"] = []
+            return None
+
+    def __remove_file(self, entry):
+        path = self.cache_dir / entry["file"]
+        if path.exists():
+            path.unlink()
+
+    def __evict(self, keep):
+        """Evicts least recently used entries until the cache fits size_limit."""
+        if self.size_limit is None:
+            return
+
+        entries = self.index["entries"]
+        total = self.__size()
+        for key in sorted(entries, key=lambda k: entries[k]["last_access"]):
+            if total <= self.size_limit:
+                break
+            if key == keep:
+                continue
+            logger.debug(f"Evicting {key} from cache")
+            total -= entries[key]["size"]
+            self.__remove_file(entries.pop(key))
+
+    @contextlib.contextmanager
+    def __index_transaction(self):
+        """Holds the index of every process, saving it at the end of the block."""
+        with self.__lock, self.shared.lock("cache:index"):
+            self.__refresh_index()
+            yield
+            self.__save_index()
+
+    def __refresh_index(self):
+        """Reads the index again if another process saved it since."""
+        if self.__signature() != self.__index_signature:
+            self.index = self.__load_index()
+
+    def __signature(self):
+        try:
+            stat = (self.cache_dir / HistoricalDataCache.INDEX_FILE).stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def __load_index(self):
+        path = self.cache_dir / HistoricalDataCache.INDEX_FILE
+        self.__index_signature = self.__signature()
+        if path.exists():
+            with open(path, "r") as file:
+                index = json.load(file)
+            if index.get("version") == HistoricalDataCache.FORMAT_VERSION:
+                return index
+            logger.info("Cache was written by an older version, discarding it")
+            for entry in index.get("entries", {}).values():
+                self.__remove_file(entry)
+        return {"version": HistoricalDataCache.FORMAT_VERSION, "entries": {}}
+
+    def __save_index(self):
+        path = self.cache_dir / HistoricalDataCache.INDEX_FILE
+        with atomic_file(path, "w") as file:
+            json.dump(self.index, file)
+        self.__index_signature = self.__signature()
+
+    def __slice(self, frame, start_date, end_date):
+        if frame is None:
+            return None
+        dates = _index_dates(frame)
+        window = frame[(dates >= start_date) & (dates <= end_date)]
+        if len(window) == 0:
+            return None
+        return window
+
+
+def _index_dates(frame):
+    """Returns the calendar date of every row of a frame as a numpy array."""
+    return pandas.DatetimeIndex(pandas.to_datetime(frame.index)).date
@@ -0,0 +1,118 @@
+from loguru import logger
+import threading
+import time
+
+
+class SingleFlight:
+    """
+    De-duplicates concurrent fetches of the same bars.
+
+    The first caller for a key runs the fetch. Callers arriving while it is in
+    flight, for the same key and a date range within the one being fetched,
+    wait for it and share its result instead of fetching again. Nothing is
+    kept once a fetch completes, later callers fetch afresh.
+    """
+
+    def __init__(self, metrics=None):
+        """
+        Parameters
+        ---------
+            metrics: tickerstore.metrics.Metrics
+                Receives the coalesced_requests counter and the
+                coalesce_wait_seconds timing. None records nothing.
+        """
+        self.metrics = metrics
+        self.__calls = {}  # Key to the fetches in flight for it
+        self.__lock = threading.Lock()
+
+    def do(self, key, start_date, end_date, fetch, **labels):
+        """
+        Runs fetch, or waits for an in-flight fetch covering the same bars.
+
+        Parameters
+        ---------
+            key: tuple
+                Identifies what is fetched apart from the dates,
+                eg. (source, ticker, interval).
+            start_date: datetime.date
+                Date from where data is fetched.
+            end_date: datetime.date
+                Date uptil which data is fetched.
+            fetch: callable
+                Called without arguments. Returns a DataFrame indexed by
+                timestamp or None if there is no data.
+            labels:
+                Labels of the recorded metrics.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The bars between start_date and end_date, or None if there are none.
+            Callers sharing a fetch get copies of its result.
+        """
+        with self.__lock:
+            calls = self.__calls.setdefault(key, [])
+            call = _covering(calls, start_date, end_date)
+            leader = call is None
+            if leader:
+                call = _Call(start_date, end_date)
+                calls.append(call)
+
+        if leader:
+            return self.__lead(key, call, fetch)
+
+        logger.debug(f"Waiting for the in-flight fetch of {key}")
+        started = time.perf_counter()
+        call.done.wait()
+        if self.metrics is not None:
+            self.metrics.increment("coalesced_requests", **labels)
+            self.metrics.observe(
+                "coalesce_wait_seconds", time.perf_counter() - started, **labels
+            )
+
+        if call.error is not None:
+            raise call.error
+        return _slice(call.result, start_date, end_date)
+
+    def __lead(self, key, call, fetch):
+        try:
+            call.result = fetch()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.__lock:
+                calls = self.__calls[key]
+                calls.remove(call)
+                if not calls:
+                    del self.__calls[key]
+            call.done.set()
+
+
+class _Call:
+    def __init__(self, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _covering(calls, start_date, end_date):
+    """Returns the call whose dates contain the requested ones, if any."""
+    for call in calls:
+        if call.start_date <= start_date and end_date <= call.end_date:
+            return call
+    return None
+
+
+def _slice(frame, start_date, end_date):
+    """Returns a copy of the bars of a frame between two dates."""
+    if frame is None:
+        return None
+    dates = frame.index.date
+    window = frame[(dates >= start_date) & (dates <= end_date)]
+    if len(window) == 0:
+        return None
+    return window.copy()
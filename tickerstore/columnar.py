@@ -0,0 +1,300 @@
+from tickerstore.normalize import INDEX_NAME
+from tickerstore.normalize import TIMEZONE
+from tickerstore.normalize import utc_nanoseconds
+from loguru import logger
+import threading
+import datetime
+import pathlib
+import pandas
+import numpy
+import json
+import os
+import re
+
+
+# Column files of every series, in the order of the schema
+COLUMNS = [
+    ("timestamp", numpy.int64),  # nanoseconds since epoch, UTC
+    ("Open", numpy.float64),
+    ("High", numpy.float64),
+    ("Low", numpy.float64),
+    ("Close", numpy.float64),
+    ("Volume", numpy.int64),
+]
+
+
+class ColumnStore:
+    """
+    Append-only store of bars kept as fixed-width column files.
+
+    Every (ticker, interval) series is a folder with one binary file per column
+    and a small index.json sidecar holding the number of rows. Reads memory-map
+    the column files, so opening a long series is cheap and a date range is
+    found by a binary search on the timestamp column.
+
+    The sidecar is only replaced once the column files are written, so it is
+    the commit point of an append. Bytes past the committed rows, left behind
+    by an interrupted append or by replaced bars, are ignored and overwritten
+    by the next append. Column files never shrink, so readers still holding
+    memory-mapped views of them can't fault on pages that went away.
+    """
+
+    FORMAT_VERSION = 1
+    INDEX_FILE = "index.json"
+
+    def __init__(self, root):
+        """
+        Parameters
+        ---------
+            root: str
+                Folder in which the series are stored. Created if missing.
+        """
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__series_locks = {}
+
+    def append(self, ticker, interval, frame, replace=False):
+        """
+        Appends bars to a series.
+
+        Only bars newer than the last stored bar are written, so appending
+        overlapping frames never duplicates bars.
+
+        Parameters
+        ---------
+            ticker: str
+                Ticker symbol the bars belong to.
+            interval: int
+                One of the TickerStore.INTERVAL_* values.
+            frame: pandas.DataFrame
+                Bars in the schema returned by TickerStore.historical_data.
+            replace: bool
+                If True, stored bars from the first bar of the frame onwards are
+                dropped and written again from the frame. Used to correct bars
+                that were still being formed when they were stored.
+
+        Returns
+        -------
+        int
+            Number of bars newer than the previously last stored bar. Replaced
+            bars aren't counted.
+        """
+        if frame is None or len(frame) == 0:
+            return 0
+
+        timestamps = utc_nanoseconds(frame.index)
+        order = numpy.argsort(timestamps, kind="mergesort")
+
+        folder = self.__folder(ticker, interval)
+        with self.__series_lock(folder):
+            folder.mkdir(parents=True, exist_ok=True)
+            index = self.__load_index(folder)
+
+            timestamps = timestamps[order]
+            previous_last = index["last"] if index["rows"] > 0 else None
+            if replace and index["rows"] > 0 and timestamps[0] <= index["last"]:
+                self.__truncate(folder, index, timestamps[0])
+
+            # Keep the last of duplicated timestamps and skip stored bars
+            keep = numpy.append(timestamps[1:] != timestamps[:-1], True)
+            if index["rows"] > 0:
+                keep &= timestamps > index["last"]
+            rows = order[keep]
+            if len(rows) == 0:
+                return 0
+
+            columns = {"timestamp": timestamps[keep]}
+            for name, dtype in COLUMNS[1:]:
+                columns[name] = frame[name].values[rows].astype(dtype)
+
+            committed = index["rows"]
+            for name, dtype in COLUMNS:
+                path = folder / f"{name}.bin"
+                with open(path, "r+b" if path.exists() else "wb") as file:
+                    # Overwrite whatever lies past the committed rows in place
+                    file.seek(committed * numpy.dtype(dtype).itemsize)
+                    file.write(numpy.ascontiguousarray(columns[name]).tobytes())
+                    file.flush()
+                    os.fsync(file.fileno())
+
+            index["rows"] = committed + len(rows)
+            if committed == 0:
+                index["first"] = int(columns["timestamp"][0])
+            index["last"] = int(columns["timestamp"][-1])
+            index["symbol"] = ticker
+            self.__save_index(folder, index)
+
+        logger.debug(f"Appended {len(rows)} bars to {folder}")
+        if previous_last is None:
+            return len(rows)
+        return int((columns["timestamp"] > previous_last).sum())
+
+    def read_arrays(self, ticker, interval, start=None, end=None):
+        """
+        Returns read-only views of the column files without copying them.
+
+        Parameters
+        ---------
+            ticker: str
+                Ticker symbol of the series.
+            interval: int
+                One of the TickerStore.INTERVAL_* values.
+            start: datetime.date or datetime.datetime
+                First date (or time) to return. None starts at the first bar.
+            end: datetime.date or datetime.datetime
+                Last date (or time) to return, inclusive. None ends at the last bar.
+
+        Returns
+        -------
+        dict
+            numpy arrays keyed by column name. The timestamp column holds
+            nanoseconds since epoch in UTC.
+        """
+        folder = self.__folder(ticker, interval)
+        rows = self.__load_index(folder)["rows"]
+        if rows == 0:
+            return {name: numpy.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+
+        columns = {
+            name: numpy.memmap(
+                str(folder / f"{name}.bin"), dtype=dtype, mode="r", shape=(rows,)
+            )
+            for name, dtype in COLUMNS
+        }
+
+        timestamps = columns["timestamp"]
+        first = 0
+        last = rows
+        if start is not None:
+            first = numpy.searchsorted(timestamps, _bound(start), side="left")
+        if end is not None:
+            last = numpy.searchsorted(timestamps, _bound(end, end=True), side="right")
+
+        return {name: column[first:last] for name, column in columns.items()}
+
+    def read(self, ticker, interval, start=None, end=None):
+        """
+        Returns the bars of a series as a DataFrame.
+
+        Parameters
+        ---------
+            ticker: str
+                Ticker symbol of the series.
+            interval: int
+                One of the TickerStore.INTERVAL_* values.
+            start: datetime.date or datetime.datetime
+                First date (or time) to return. None starts at the first bar.
+            end: datetime.date or datetime.datetime
+                Last date (or time) to return, inclusive. None ends at the last bar.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Bars in the schema returned by TickerStore.historical_data, or None if
+            there are no bars in the range.
+        """
+        columns = self.read_arrays(ticker, interval, start, end)
+        if len(columns["timestamp"]) == 0:
+            return None
+
+        index = pandas.to_datetime(columns["timestamp"], unit="ns", utc=True)
+        frame = pandas.DataFrame(
+            {name: columns[name] for name, dtype in COLUMNS[1:]},
+            index=pandas.DatetimeIndex(index.tz_convert(TIMEZONE), name=INDEX_NAME),
+            columns=[name for name, dtype in COLUMNS[1:]],
+        )
+        frame["Symbol"] = ticker
+        return frame
+
+    def last_timestamp(self, ticker, interval):
+        """
+        Returns the time of the last stored bar of a series.
+
+        Returns
+        -------
+        pandas.Timestamp
+            IST aware time of the last bar, or None if the series is empty.
+        """
+        index = self.__load_index(self.__folder(ticker, interval))
+        if index["rows"] == 0:
+            return None
+        return pandas.Timestamp(index["last"], tz="UTC").tz_convert(TIMEZONE)
+
+    def rows(self, ticker, interval):
+        """Returns the number of bars stored for a series."""
+        return self.__load_index(self.__folder(ticker, interval))["rows"]
+
+    def tickers(self, interval):
+        """Returns the tickers which have bars stored for an interval."""
+        folder = self.root / str(interval)
+        if not folder.exists():
+            return []
+
+        tickers = []
+        for series in sorted(folder.iterdir()):
+            index = self.__load_index(series)
+            if index["rows"] > 0:
+                tickers.append(index["symbol"])
+        return tickers
+
+    def __truncate(self, folder, index, timestamp):
+        """Commits the series without its bars from timestamp onwards."""
+        stored = numpy.memmap(
+            str(folder / "timestamp.bin"),
+            dtype=numpy.int64,
+            mode="r",
+            shape=(index["rows"],),
+        )
+        rows = int(numpy.searchsorted(stored, timestamp, side="left"))
+        last = int(stored[rows - 1]) if rows > 0 else None
+        del stored
+
+        # The column files keep their bytes, the next write overwrites them
+        index["rows"] = rows
+        if rows == 0:
+            index.pop("first", None)
+            index.pop("last", None)
+        else:
+            index["last"] = last
+        self.__save_index(folder, index)
+        logger.debug(f"Dropped the bars of {folder} from {timestamp} onwards")
+
+    def __folder(self, ticker, interval):
+        return self.root / str(interval) / re.sub(r"[^A-Za-z0-9_.-]+", "_", ticker)
+
+    def __series_lock(self, folder):
+        with self.__lock:
+            return self.__series_locks.setdefault(str(folder), threading.Lock())
+
+    def __load_index(self, folder):
+        path = folder / ColumnStore.INDEX_FILE
+        if not path.exists():
+            return {"version": ColumnStore.FORMAT_VERSION, "rows": 0}
+        with open(path, "r") as file:
+            return json.load(file)
+
+    def __save_index(self, folder, index):
+        path = folder / ColumnStore.INDEX_FILE
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(index, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(str(tmp_path), str(path))
+
+
+def _bound(value, end=False):
+    """Converts a date or datetime into nanoseconds since epoch in UTC.
+
+    Dates are taken as IST days. For the end of a range a date covers the whole day.
+    """
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        timestamp = pandas.Timestamp(value).tz_localize(TIMEZONE)
+        if end:
+            timestamp += pandas.Timedelta(days=1) - pandas.Timedelta(1, unit="ns")
+    else:
+        timestamp = pandas.Timestamp(value)
+        if timestamp.tz is None:
+            timestamp = timestamp.tz_localize(TIMEZONE)
+    return timestamp.value
@@ -0,0 +1,105 @@
+from tickerstore.metrics import Metrics
+from tickerstore.shared import SharedState
+from tickerstore.shared import atomic_file
+from loguru import logger
+import datetime
+import pathlib
+import pickle
+import threading
+
+
+class MasterContract:
+    """
+    Symbol to instrument index of an exchange's master contract.
+
+    Downloading and parsing the master contract of an exchange is slow, so the
+    parsed index is kept in memory and persisted to disk. The file on disk is
+    only used on the day it was downloaded. Processes sharing the folder
+    download it once between them.
+    """
+
+    def __init__(self, exchange, folder, metrics=None):
+        """
+        Parameters
+        ---------
+            exchange: str
+                Upstox exchange name. eg. "NSE_EQ"
+            folder: str
+                Folder in which the parsed master contract is stored.
+            metrics: tickerstore.metrics.Metrics
+                Records how long loading the master contract takes.
+        """
+        self.exchange = exchange
+        self.path = pathlib.Path(folder) / f"master_contract_{exchange.lower()}.file"
+        self.instruments = None
+        self.loaded_on = None
+        self.metrics = metrics or Metrics()
+        self.shared = SharedState.for_folder(folder)
+        self.__lock = threading.Lock()
+
+    def instrument(self, client, symbol):
+        """
+        Returns the Upstox instrument for a symbol.
+
+        Parameters
+        ---------
+            client: upstox_api.api.Upstox
+                Client used to download the master contract when needed.
+            symbol: str
+                Ticker symbol. eg. "SBIN"
+
+        Returns
+        -------
+        upstox_api.api.Instrument
+            The instrument, or None if the symbol isn't part of the master contract.
+        """
+        self.load(client)
+        return self.instruments.get(symbol.lower())
+
+    def load(self, client):
+        """Makes sure today's master contract is loaded, downloading it if needed."""
+        today = datetime.date.today()
+        with self.__lock:
+            if self.instruments is not None and self.loaded_on == today:
+                return
+
+            with self.metrics.timer(
+                "master_contract_load_seconds", exchange=self.exchange, origin="disk"
+            ) as labels, self.shared.lock(f"master_contract:{self.exchange}"):
+                # Another process might have downloaded it while this one waited
+                if self.__load_from_disk(today):
+                    return
+
+                labels["origin"] = "download"
+                logger.debug(f"Downloading master contract for {self.exchange}")
+                contract = client.get_master_contract(self.exchange)
+                self.instruments = {
+                    instrument.symbol.lower(): instrument
+                    for instrument in contract.values()
+                }
+                self.loaded_on = today
+                self.__save_to_disk()
+
+    def __load_from_disk(self, today):
+        if not self.path.exists():
+            return False
+
+        try:
+            with open(self.path, "rb") as file:
+                data = pickle.load(file)
+        except (pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.warning(f"Unable to read {self.path} : {e}")
+            return False
+
+        if data["date"] != today:
+            logger.debug(f"{self.path} contains a stale master contract")
+            return False
+
+        logger.debug(f"Master contract for {self.exchange} loaded from {self.path}")
+        self.instruments = data["instruments"]
+        self.loaded_on = today
+        return True
+
+    def __save_to_disk(self):
+        with atomic_file(self.path) as file:
+            pickle.dump({"date": self.loaded_on, "instruments": self.instruments}, file)
@@ -1,4 +1,3 @@
-from . import tempserver as ts
 import multiprocessing as mp
 import webbrowser
 import os
@@ -14,6 +13,9 @@ def auth_upstox() -> str:
 
     """
 
+    # Flask is only needed when the user has to log in
+    from . import tempserver as ts
+
     def start_server(queue):
         ts.app.queue = queue
         ts.app.run()
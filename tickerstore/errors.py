@@ -4,3 +4,9 @@ class SourceError(Exception):
 
 class TickerStoreError(Exception):
     pass
+
+
+class SourcesFailedError(TickerStoreError):
+    """Raised when no source could be asked, as opposed to none having data."""
+
+    pass
@@ -0,0 +1,396 @@
+from tickerstore.errors import TickerStoreError
+from tickerstore.normalize import INDEX_NAME
+from tickerstore.normalize import TIMEZONE
+from tickerstore.normalize import local_nanoseconds
+from tickerstore.normalize import utc_nanoseconds
+from tickerstore.resample import DAY
+from tickerstore.shared import atomic_file
+import pathlib
+import struct
+import pandas
+import numpy
+import json
+import zlib
+
+TKS = "tks"
+PARQUET = "parquet"
+ARROW = "arrow"
+
+EXTENSIONS = {".tks": TKS, ".parquet": PARQUET, ".arrow": ARROW, ".feather": ARROW}
+
+MAGIC = b"TKS1"
+PRICE_SCALE = 100  # Prices are stored in paise when that is exact
+PRICE_COLUMNS = ["Open", "High", "Low", "Close"]
+
+PARTITION_KEYS = ["Symbol", "year", "month", "date"]
+
+
+def write(frame, path, format=None):
+    """
+    Writes bars to a file.
+
+    Parameters
+    ---------
+        frame: pandas.DataFrame
+            Bars in the schema returned by TickerStore.historical_data. Extra
+            numeric columns (eg. indicators) are written as well.
+        path: str
+            File to write, replaced atomically.
+        format: str
+            TKS, PARQUET or ARROW. Guessed from the extension of path when None.
+    """
+    format = format or _format(path)
+    if format == TKS:
+        with atomic_file(path) as file:
+            file.write(encode(frame))
+        return
+
+    pyarrow = _pyarrow()
+    table = pyarrow.Table.from_pandas(_categorical(frame), preserve_index=True)
+    with atomic_file(path) as file:
+        if format == PARQUET:
+            import pyarrow.parquet
+
+            pyarrow.parquet.write_table(table, file, compression="zstd")
+        else:
+            import pyarrow.ipc
+
+            options = pyarrow.ipc.IpcWriteOptions(compression="zstd")
+            with pyarrow.ipc.new_file(file, table.schema, options=options) as writer:
+                writer.write_table(table)
+
+
+def arrow_stream(frame):
+    """
+    Returns bars as an Arrow IPC stream, eg. to send them over the network.
+
+    Returns
+    -------
+    bytes
+        The stream, with the timestamps as its index.
+    """
+    pyarrow = _pyarrow()
+    import pyarrow.ipc
+
+    table = pyarrow.Table.from_pandas(_categorical(frame), preserve_index=True)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def read(path, format=None):
+    """
+    Reads bars written by write().
+
+    Returns
+    -------
+    pandas.DataFrame
+        Bars indexed by an IST aware timestamp, with Symbol as a plain column.
+    """
+    format = format or _format(path)
+    if format == TKS:
+        with open(path, "rb") as file:
+            return decode(file.read())
+
+    _pyarrow()
+    if format == PARQUET:
+        import pyarrow.parquet
+
+        table = pyarrow.parquet.read_table(str(path))
+    else:
+        import pyarrow.ipc
+
+        with pyarrow.ipc.open_file(str(path)) as reader:
+            table = reader.read_all()
+
+    frame = table.to_pandas()
+    if "Symbol" in frame.columns:
+        frame["Symbol"] = frame["Symbol"].astype(object)
+    return frame
+
+
+def encode(frame):
+    """
+    Encodes bars in the native TKS1 format.
+
+    The format is a header followed by one zlib compressed block per column.
+    Symbol is dictionary encoded, timestamps are stored as differences between
+    rows, prices as integer paise whenever that is exact and every integer
+    column in the narrowest type that holds it. Naive timestamps are taken as
+    IST wall clock times and decoded as naive again.
+
+    Returns
+    -------
+    bytes
+        The encoded bars.
+    """
+    columns = []
+    blocks = []
+
+    def add(name, values, **info):
+        values = numpy.ascontiguousarray(values)
+        block = zlib.compress(values.tobytes(), 1)
+        info.update({"name": name, "dtype": values.dtype.str, "size": len(block)})
+        columns.append(info)
+        blocks.append(block)
+
+    timestamps = utc_nanoseconds(frame.index)
+    unit = 10**9 if (timestamps % 10**9 == 0).all() else 1
+    ticks = timestamps // unit
+    deltas = numpy.concatenate(
+        [numpy.zeros(min(len(ticks), 1), numpy.int64), numpy.diff(ticks)]
+    )
+    add(INDEX_NAME, _narrow(deltas), encoding="delta", first=_first(ticks), unit=unit)
+
+    symbols = None
+    for name in frame.columns:
+        values = frame[name].values
+        if name == "Symbol":
+            codes, symbols = pandas.factorize(frame[name])
+            add(name, _narrow(codes), encoding="dictionary")
+        elif name in PRICE_COLUMNS and _exact_in_paise(values):
+            scaled = numpy.round(values.astype(numpy.float64) * PRICE_SCALE)
+            add(name, _narrow(scaled.astype(numpy.int64)), scale=PRICE_SCALE)
+        elif values.dtype.kind in "iu":
+            add(name, _narrow(values), original=values.dtype.str)
+        elif values.dtype.kind in "fb":
+            add(name, values)
+        else:
+            raise TickerStoreError(
+                f"Column {name} of type {values.dtype} can't be exported"
+            )
+
+    header = {
+        "rows": len(frame),
+        "tz": str(frame.index.tz) if frame.index.tz is not None else None,
+        "symbols": [str(symbol) for symbol in symbols] if symbols is not None else None,
+        "columns": columns,
+    }
+    header = json.dumps(header).encode()
+    return b"".join([MAGIC, struct.pack("<I", len(header)), header] + blocks)
+
+
+def decode(data):
+    """Decodes bars encoded by encode()."""
+    if data[:4] != MAGIC:
+        raise TickerStoreError("Not a TKS1 file")
+    (length,) = struct.unpack("<I", data[4:8])
+    header = json.loads(data[8 : 8 + length].decode())
+    offset = 8 + length
+
+    values = {}
+    for column in header["columns"]:
+        block = data[offset : offset + column["size"]]
+        offset += column["size"]
+        array = numpy.frombuffer(zlib.decompress(block), dtype=column["dtype"])
+
+        if column.get("encoding") == "delta":
+            array = numpy.cumsum(array, dtype=numpy.int64) + column["first"]
+            array = (array * column["unit"]).astype("datetime64[ns]")
+        elif column.get("encoding") == "dictionary":
+            array = numpy.asarray(header["symbols"], dtype=object)[array]
+        elif column.get("scale"):
+            array = array / column["scale"]
+        elif column.get("original"):
+            array = array.astype(column["original"])
+        values[column["name"]] = array
+
+    index = pandas.DatetimeIndex(values.pop(INDEX_NAME), tz="UTC", name=INDEX_NAME)
+    if header["tz"] is not None:
+        index = index.tz_convert(header["tz"])
+    else:
+        index = index.tz_convert(TIMEZONE).tz_localize(None)
+    return pandas.DataFrame(values, index=index)
+
+
+def write_partitioned(frame, root, format=TKS, partition_by=("Symbol", "date")):
+    """
+    Writes bars as a folder tree, one file per partition.
+
+    Partitions are hive style folders, eg. ``root/Symbol=SBIN/date=2018-01-01/``,
+    so a slice can be read without loading everything. A partition that is
+    written again is replaced.
+
+    Parameters
+    ---------
+        frame: pandas.DataFrame
+            Bars in the schema returned by TickerStore.historical_data.
+        root: str
+            Folder of the tree.
+        format: str
+            TKS, PARQUET or ARROW.
+        partition_by: tuple
+            Keys of the partition folders, in order. Any of "Symbol", "year",
+            "month" and "date" (IST calendar dates).
+
+    Returns
+    -------
+    list
+        Paths of the written files.
+    """
+    for key in partition_by:
+        if key not in PARTITION_KEYS:
+            raise TickerStoreError(f"Can't partition by {key}")
+
+    keys = pandas.DataFrame(
+        {key: _partition_values(frame, key) for key in partition_by}
+    )
+    extension = {TKS: ".tks", PARQUET: ".parquet", ARROW: ".arrow"}[format]
+
+    paths = []
+    groups = keys.groupby(list(partition_by), sort=True).indices
+    for values, positions in groups.items():
+        if not isinstance(values, tuple):
+            values = (values,)
+        folder = pathlib.Path(root).joinpath(
+            *[f"{key}={value}" for key, value in zip(partition_by, values)]
+        )
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"part-0{extension}"
+        write(frame.iloc[positions], path, format)
+        paths.append(path)
+    return paths
+
+
+def read_partitioned(root, symbols=None, start_date=None, end_date=None):
+    """
+    Reads the bars of a tree written by write_partitioned.
+
+    Only the partitions that can hold matching bars are read.
+
+    Parameters
+    ---------
+        root: str
+            Folder of the tree.
+        symbols: list
+            Tickers to read. None reads every ticker.
+        start_date: datetime.date
+            First date to read. None reads from the beginning.
+        end_date: datetime.date
+            Last date to read. None reads until the end.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The matching bars, or None if there are none.
+    """
+    frames = []
+    for path in sorted(pathlib.Path(root).rglob("part-0.*")):
+        if path.suffix not in EXTENSIONS:
+            continue
+        partition = dict(
+            part.split("=", 1)
+            for part in path.relative_to(root).parent.parts
+            if "=" in part
+        )
+        if (
+            symbols is not None
+            and "Symbol" in partition
+            and partition["Symbol"] not in symbols
+        ):
+            continue
+        if not _overlaps(partition, start_date, end_date):
+            continue
+
+        frame = read(path)
+        if symbols is not None and "Symbol" not in partition:
+            frame = frame[frame["Symbol"].isin(symbols)]
+        if start_date is not None or end_date is not None:
+            dates = _local_dates(frame.index)
+            keep = numpy.ones(len(frame), dtype=bool)
+            if start_date is not None:
+                keep &= dates >= start_date
+            if end_date is not None:
+                keep &= dates <= end_date
+            frame = frame[keep]
+        if len(frame):
+            frames.append(frame)
+
+    if not frames:
+        return None
+    return pandas.concat(frames)
+
+
+def _format(path):
+    format = EXTENSIONS.get(pathlib.Path(path).suffix.lower())
+    if format is None:
+        raise TickerStoreError(f"Unknown export format of {path}")
+    return format
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise TickerStoreError(
+            "pyarrow is needed for Parquet and Arrow files: pip install pyarrow"
+        )
+    return pyarrow
+
+
+def _categorical(frame):
+    if "Symbol" not in frame.columns:
+        return frame
+    frame = frame.copy()
+    frame["Symbol"] = frame["Symbol"].astype("category")
+    return frame
+
+
+def _local_dates(index):
+    days = local_nanoseconds(index) // DAY
+    return numpy.asarray(days, dtype="datetime64[D]").astype(object)
+
+
+def _partition_values(frame, key):
+    if key == "Symbol":
+        return frame["Symbol"].values
+    days = numpy.asarray(local_nanoseconds(frame.index) // DAY, dtype="datetime64[D]")
+    if key == "year":
+        return days.astype("datetime64[Y]").astype(str)
+    if key == "month":
+        return days.astype("datetime64[M]").astype(str)
+    return days.astype(str)
+
+
+def _overlaps(partition, start_date, end_date):
+    """Returns whether a partition can hold bars between two dates."""
+    for key, period in [("date", "D"), ("month", "M"), ("year", "Y")]:
+        if key not in partition:
+            continue
+        first = numpy.datetime64(partition[key], period)
+        last = (first + 1).astype("datetime64[D]") - 1
+        first = first.astype("datetime64[D]")
+        if start_date is not None and last < numpy.datetime64(start_date, "D"):
+            return False
+        if end_date is not None and first > numpy.datetime64(end_date, "D"):
+            return False
+    return True
+
+
+def _exact_in_paise(values):
+    if values.dtype.kind != "f" or numpy.isnan(values).any():
+        return False
+    scaled = numpy.round(values * PRICE_SCALE)
+    return bool(
+        numpy.all(
+            numpy.abs(scaled / PRICE_SCALE - values) <= 1e-9 * numpy.abs(values) + 1e-12
+        )
+    )
+
+
+def _narrow(values):
+    """Returns integer values in the narrowest integer type that holds them."""
+    values = numpy.asarray(values)
+    if len(values) == 0:
+        return values.astype(numpy.int8)
+    low, high = values.min(), values.max()
+    for dtype in [numpy.int8, numpy.int16, numpy.int32]:
+        info = numpy.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values.astype(dtype)
+    return values.astype(numpy.int64)
+
+
+def _first(ticks):
+    return int(ticks[0]) if len(ticks) else 0
@@ -0,0 +1,304 @@
+from tickerstore.normalize import local_nanoseconds
+from tickerstore.resample import DAY
+import math
+import numpy
+
+MAX_GROWTH = 1e12  # Largest factor a value is scaled by in the exponential scan
+
+
+class IndicatorPipeline:
+    """
+    Computes technical indicators on bars in the schema returned by
+    TickerStore.historical_data.
+
+    Indicators are added with the chainable methods and computed with
+    compute(). Frames with multiple tickers are computed separately for every
+    Symbol. The pipeline keeps the state at the end of every ticker, so
+    update() extends the indicators over newly appended bars without going
+    through the history again::
+
+        pipeline = IndicatorPipeline().sma(20).ema(12).rsi(14).atr(14).vwap()
+        frame = pipeline.compute(history)
+        latest = pipeline.update(new_bars)
+    """
+
+    def __init__(self):
+        self.indicators = []
+        self.state = {}  # (Symbol, column) to the state at the last bar
+
+    def sma(self, window, column="Close"):
+        """Adds the simple moving average of a column as SMA_<window>."""
+        return self.__add(_Sma(window, column))
+
+    def ema(self, span, column="Close"):
+        """Adds the exponential moving average of a column as EMA_<span>."""
+        return self.__add(_Ema(span, column))
+
+    def rsi(self, window=14):
+        """Adds Wilder's relative strength index of the close as RSI_<window>."""
+        return self.__add(_Rsi(window))
+
+    def atr(self, window=14):
+        """Adds Wilder's average true range as ATR_<window>."""
+        return self.__add(_Atr(window))
+
+    def vwap(self, anchor="day"):
+        """
+        Adds the volume weighted average of the typical price as VWAP.
+
+        Parameters
+        ---------
+            anchor: str
+                "day" restarts the average every trading day, None averages over
+                all the bars.
+        """
+        return self.__add(_Vwap(anchor))
+
+    def compute(self, frame):
+        """
+        Computes every indicator over a frame, starting from scratch.
+
+        Parameters
+        ---------
+            frame: pandas.DataFrame
+                Bars sorted by time within every Symbol.
+
+        Returns
+        -------
+        pandas.DataFrame
+            A copy of frame with a column for every indicator.
+        """
+        self.state = {}
+        return self.update(frame)
+
+    def update(self, frame):
+        """
+        Computes every indicator over bars that follow the last computed ones.
+
+        Returns
+        -------
+        pandas.DataFrame
+            A copy of frame with a column for every indicator.
+        """
+        result = frame.copy()
+        if len(frame) == 0:
+            for indicator in self.indicators:
+                result[indicator.name] = numpy.zeros(0)
+            return result
+
+        if "Symbol" in frame.columns:
+            groups = frame.groupby("Symbol", sort=False).indices.items()
+        else:
+            groups = [(None, numpy.arange(len(frame)))]
+
+        columns = {
+            indicator.name: numpy.empty(len(frame)) for indicator in self.indicators
+        }
+        for symbol, positions in groups:
+            bars = frame.iloc[positions]
+            for indicator in self.indicators:
+                key = (symbol, indicator.name)
+                values, self.state[key] = indicator.compute(bars, self.state.get(key))
+                columns[indicator.name][positions] = values
+
+        for name, values in columns.items():
+            result[name] = values
+        return result
+
+    def __add(self, indicator):
+        self.indicators.append(indicator)
+        return self
+
+
+class _Sma:
+    def __init__(self, window, column):
+        self.window = window
+        self.column = column
+        self.name = f"SMA_{window}"
+
+    def compute(self, bars, state):
+        # The state holds the last window - 1 values
+        values = numpy.asarray(bars[self.column], dtype=numpy.float64)
+        tail = state if state is not None else numpy.zeros(0)
+        series = numpy.concatenate([tail, values])
+
+        sums = numpy.cumsum(numpy.concatenate([[0.0], series]))
+        result = numpy.full(len(series), numpy.nan)
+        if len(series) >= self.window:
+            window_sums = sums[self.window :] - sums[: -self.window]
+            result[self.window - 1 :] = window_sums / self.window
+        keep = max(len(series) - self.window + 1, 0)
+        return result[len(tail) :], series[keep:]
+
+
+class _Ema:
+    def __init__(self, span, column):
+        self.column = column
+        self.average = _Smoothing(span, 2.0 / (span + 1))
+        self.name = f"EMA_{span}"
+
+    def compute(self, bars, state):
+        values = numpy.asarray(bars[self.column], dtype=numpy.float64)
+        return self.average.compute(values, state)
+
+
+class _Rsi:
+    def __init__(self, window):
+        self.gains = _Smoothing(window, 1.0 / window)
+        self.losses = _Smoothing(window, 1.0 / window)
+        self.name = f"RSI_{window}"
+
+    def compute(self, bars, state):
+        # The state holds the last close and the state of both averages
+        close = numpy.asarray(bars["Close"], dtype=numpy.float64)
+        previous, gains_state, losses_state = state or (None, None, None)
+
+        if previous is None:
+            # The first bar has no change, so it has no RSI
+            changes = numpy.diff(close)
+            offset = 1
+        else:
+            changes = numpy.diff(numpy.concatenate([[previous], close]))
+            offset = 0
+
+        gains, gains_state = self.gains.compute(numpy.maximum(changes, 0), gains_state)
+        losses, losses_state = self.losses.compute(
+            numpy.maximum(-changes, 0), losses_state
+        )
+
+        result = numpy.full(len(close), numpy.nan)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            rsi = 100.0 - 100.0 / (1.0 + gains / losses)
+        rsi[(losses == 0) & (gains > 0)] = 100.0
+        result[offset:] = rsi
+        return result, (close[-1], gains_state, losses_state)
+
+
+class _Atr:
+    def __init__(self, window):
+        self.average = _Smoothing(window, 1.0 / window)
+        self.name = f"ATR_{window}"
+
+    def compute(self, bars, state):
+        # The state holds the last close and the state of the average
+        high = numpy.asarray(bars["High"], dtype=numpy.float64)
+        low = numpy.asarray(bars["Low"], dtype=numpy.float64)
+        close = numpy.asarray(bars["Close"], dtype=numpy.float64)
+        previous, average_state = state or (None, None)
+
+        previous_close = numpy.concatenate([[numpy.nan], close[:-1]])
+        if previous is not None:
+            previous_close[0] = previous
+
+        true_range = high - low
+        with numpy.errstate(invalid="ignore"):
+            true_range = numpy.fmax(true_range, numpy.abs(high - previous_close))
+            true_range = numpy.fmax(true_range, numpy.abs(low - previous_close))
+
+        result, average_state = self.average.compute(true_range, average_state)
+        return result, (close[-1], average_state)
+
+
+class _Vwap:
+    def __init__(self, anchor):
+        self.anchor = anchor
+        self.name = "VWAP"
+
+    def compute(self, bars, state):
+        # The state holds the day of the last bar and the sums of that day
+        typical = (
+            numpy.asarray(bars["High"], dtype=numpy.float64)
+            + numpy.asarray(bars["Low"], dtype=numpy.float64)
+            + numpy.asarray(bars["Close"], dtype=numpy.float64)
+        ) / 3
+        volume = numpy.asarray(bars["Volume"], dtype=numpy.float64)
+        if self.anchor == "day":
+            days = local_nanoseconds(bars.index) // DAY
+        else:
+            days = numpy.zeros(len(bars), dtype=numpy.int64)
+
+        last_day, carried_value, carried_volume = state or (None, 0.0, 0.0)
+        value = numpy.cumsum(typical * volume)
+        total_volume = numpy.cumsum(volume)
+
+        # Restart the sums on every new day
+        starts = numpy.flatnonzero(numpy.diff(days)) + 1
+        segment = numpy.zeros(len(bars), dtype=numpy.int64)
+        segment[starts] = 1
+        segment = numpy.cumsum(segment)
+        value_offset = numpy.concatenate([[0.0], value[starts - 1]])[segment]
+        volume_offset = numpy.concatenate([[0.0], total_volume[starts - 1]])[segment]
+        value -= value_offset
+        total_volume -= volume_offset
+
+        # The first day continues the sums of the last update
+        if last_day == days[0]:
+            first = segment == 0
+            value[first] += carried_value
+            total_volume[first] += carried_volume
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            result = value / total_volume
+        return result, (days[-1], value[-1], total_volume[-1])
+
+
+class _Smoothing:
+    """
+    Exponential moving average seeded with the simple average of its first
+    window values, as in Wilder's RSI and ATR.
+    """
+
+    def __init__(self, window, alpha):
+        self.window = window
+        self.alpha = alpha
+
+    def compute(self, values, state):
+        # The state holds the values seen before the seed, or the last average
+        pending, last = state or (numpy.zeros(0), None)
+        result = numpy.full(len(values), numpy.nan)
+
+        if last is None:
+            series = numpy.concatenate([pending, values])
+            if len(series) < self.window:
+                return result, (series, None)
+
+            seeded = self.window - len(pending)  # Position of the seed in values
+            last = series[: self.window].mean()
+            result[seeded - 1] = last
+            values = values[seeded:]
+            start = seeded
+        else:
+            start = 0
+
+        if len(values):
+            result[start:] = _ewm(values, self.alpha, last)
+            last = result[-1]
+        return result, (None, last)
+
+
+def _ewm(values, alpha, initial):
+    """
+    Returns y[t] = (1 - alpha) * y[t - 1] + alpha * values[t], with y[-1] = initial.
+
+    Within a block y[t] = d^(t+1) * initial + alpha * d^t * sum(values[i] / d^i),
+    d being 1 - alpha, which is a cumulative sum. Blocks are kept short enough
+    for 1 / d^i not to overflow.
+    """
+    decay = 1.0 - alpha
+    if decay <= 0:
+        return numpy.array(values, dtype=numpy.float64)
+
+    block = max(1, int(math.log(MAX_GROWTH) / -math.log(decay)))
+    result = numpy.empty(len(values))
+    powers = decay ** numpy.arange(min(block, len(values)) + 1)
+
+    for start in range(0, len(values), block):
+        chunk = values[start : start + block]
+        size = len(chunk)
+        growth = powers[:size]
+        scaled = numpy.cumsum(chunk / growth)
+        result[start : start + size] = (
+            powers[1 : size + 1] * initial + alpha * growth * scaled
+        )
+        initial = result[start + size - 1]
+    return result
@@ -0,0 +1,321 @@
+from tickerstore.errors import TickerStoreError
+from tickerstore.normalize import utc_nanoseconds
+from loguru import logger
+import threading
+import queue
+import math
+import time
+import gzip
+
+RETRY_BACKOFF = 0.5  # Seconds to wait before the first retry of a batch
+
+
+class InfluxSink:
+    """
+    Writes bars to InfluxDB in batches, using the line protocol.
+
+    Every row becomes a point of ``measurement`` tagged with its Symbol, with
+    the numeric columns as fields. Rows are collected into batches of
+    ``batch_size`` points, which are gzipped and posted to the /write endpoint
+    by a small pool of sender threads sharing pooled HTTP connections. A batch
+    that isn't full is sent after ``flush_interval`` seconds.
+
+    At most ``max_pending`` batches wait to be sent. When the server falls
+    behind, write() blocks until there is room again, slowing the producer
+    down instead of buffering without bound::
+
+        with InfluxSink("http://localhost:8086", "market") as sink:
+            sink.write(fetcher.historical_data(...))
+    """
+
+    def __init__(
+        self,
+        url="http://localhost:8086",
+        database="tickerstore",
+        measurement="bars",
+        batch_size=5000,
+        flush_interval=1.0,
+        max_pending=8,
+        senders=2,
+        retries=3,
+        timeout=10.0,
+        username=None,
+        password=None,
+        metrics=None,
+    ):
+        """
+        Parameters
+        ---------
+            url: str
+                Base URL of the InfluxDB HTTP API.
+            database: str
+                Database the points are written to.
+            measurement: str
+                Measurement of the points.
+            batch_size: int
+                Points sent in a single request.
+            flush_interval: float
+                Seconds after which a partial batch is sent.
+            max_pending: int
+                Batches waiting to be sent before write() blocks.
+            senders: int
+                Threads sending batches, and size of the connection pool.
+            retries: int
+                Times a batch is sent again after a connection error or a 5xx
+                response before it is dropped.
+            timeout: float
+                Seconds to wait for the server to answer a request.
+            username: str
+                User to authenticate as. None doesn't authenticate.
+            password: str
+                Password of the user.
+            metrics: tickerstore.metrics.Metrics
+                Receives the influx_points_written and influx_points_dropped
+                counters and the influx_write_seconds and
+                influx_backpressure_seconds timings.
+        """
+        from requests.adapters import HTTPAdapter
+        import requests
+
+        self.url = url.rstrip("/")
+        self.database = database
+        self.measurement = measurement
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.timeout = timeout
+        self.metrics = metrics
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=senders)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if username is not None:
+            self.session.auth = (username, password)
+
+        self.__pending = []  # Lines of the next batch
+        self.__pending_since = None
+        self.__lock = threading.Lock()
+        self.__batches = queue.Queue(maxsize=max_pending)
+        self.__closed = threading.Event()
+        self.__threads = [
+            threading.Thread(target=self.__send_batches, daemon=True)
+            for _ in range(senders)
+        ]
+        self.__threads.append(threading.Thread(target=self.__flush_timer, daemon=True))
+        for thread in self.__threads:
+            thread.start()
+
+    def write(self, frame, tags=None):
+        """
+        Queues the rows of a frame.
+
+        Parameters
+        ---------
+            frame: pandas.DataFrame
+                Bars in the schema returned by TickerStore.historical_data.
+                Extra numeric columns (eg. indicators) are written as fields.
+            tags: dict
+                Tags added to every point, eg. {"interval": "minute_1"}.
+
+        Returns
+        -------
+        int
+            Number of points queued.
+        """
+        if self.__closed.is_set():
+            raise TickerStoreError("InfluxSink is closed")
+        if frame is None or len(frame) == 0:
+            return 0
+
+        points = lines(frame, self.measurement, tags)
+        with self.__lock:
+            if not self.__pending:
+                self.__pending_since = time.monotonic()
+            self.__pending.extend(points)
+            batches = []
+            while len(self.__pending) >= self.batch_size:
+                batches.append(self.__pending[: self.batch_size])
+                del self.__pending[: self.batch_size]
+
+        for batch in batches:
+            self.__enqueue(batch)
+        return len(points)
+
+    def flush(self):
+        """Sends the partial batch and waits until every batch was sent."""
+        with self.__lock:
+            batch, self.__pending = self.__pending, []
+        if batch:
+            self.__enqueue(batch)
+        self.__batches.join()
+
+    def close(self):
+        """Flushes the queued points and stops the sender threads."""
+        if self.__closed.is_set():
+            return
+        self.flush()
+        self.__closed.set()
+        for _ in self.__threads[:-1]:
+            self.__batches.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __enqueue(self, batch):
+        """Queues a batch, blocking while the queue is full."""
+        if not self.__batches.full():
+            self.__batches.put(batch)
+            return
+
+        started = time.perf_counter()
+        self.__batches.put(batch)
+        waited = time.perf_counter() - started
+        logger.debug(f"InfluxDB is lagging, waited {waited:.3f}s to queue a batch")
+        if self.metrics is not None:
+            self.metrics.observe("influx_backpressure_seconds", waited)
+
+    def __flush_timer(self):
+        while not self.__closed.wait(self.flush_interval / 2):
+            with self.__lock:
+                due = (
+                    self.__pending
+                    and time.monotonic() - self.__pending_since >= self.flush_interval
+                )
+                if not due:
+                    continue
+                batch, self.__pending = self.__pending, []
+            self.__enqueue(batch)
+
+    def __send_batches(self):
+        while True:
+            batch = self.__batches.get()
+            try:
+                if batch is None:
+                    return
+                self.__send(batch)
+            except Exception:
+                logger.exception("Writing to InfluxDB failed")
+            finally:
+                self.__batches.task_done()
+
+    def __send(self, batch):
+        """Posts a batch, retrying with a backoff while the server is unavailable."""
+        import requests
+
+        body = gzip.compress(("\n".join(batch) + "\n").encode(), compresslevel=5)
+        outcome = "dropped"
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(
+                    f"{self.url}/write",
+                    params={"db": self.database, "precision": "ns"},
+                    data=body,
+                    headers={
+                        "Content-Encoding": "gzip",
+                        "Content-Type": "text/plain; charset=utf-8",
+                    },
+                    timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            else:
+                if response.status_code < 300:
+                    outcome = "ok"
+                    break
+                error = f"{response.status_code} {response.text.strip()}"
+                if response.status_code < 500 and response.status_code != 429:
+                    break  # The batch itself was rejected, sending it again won't help
+
+            if attempt < self.retries:
+                delay = RETRY_BACKOFF * 2 ** attempt
+                logger.warning(
+                    f"Writing to InfluxDB failed ({error}), retrying in {delay}s"
+                )
+                time.sleep(delay)
+
+        if outcome != "ok":
+            logger.error(f"Dropping {len(batch)} points, InfluxDB answered: {error}")
+        if self.metrics is not None:
+            self.metrics.observe(
+                "influx_write_seconds", time.perf_counter() - started, outcome=outcome
+            )
+            name = (
+                "influx_points_written" if outcome == "ok" else "influx_points_dropped"
+            )
+            self.metrics.increment(name, len(batch))
+
+
+def lines(frame, measurement="bars", tags=None):
+    """
+    Formats the rows of a frame in the InfluxDB line protocol.
+
+    Parameters
+    ---------
+        frame: pandas.DataFrame
+            Rows indexed by timestamp. The Symbol column becomes a tag, numeric
+            and boolean columns become fields. Missing values are left out.
+        measurement: str
+            Measurement of the points.
+        tags: dict
+            Tags added to every point.
+
+    Returns
+    -------
+    list
+        One line per row, with nanosecond timestamps.
+    """
+    tags = dict(tags or {})
+    symbols = None
+    if "Symbol" in frame.columns:
+        symbols = [_escape_tag(str(symbol)) for symbol in frame["Symbol"].tolist()]
+        tags.pop("Symbol", None)
+
+    # Tags sorted by key, as InfluxDB stores them
+    tags = [(_escape_tag(str(k)), _escape_tag(str(v))) for k, v in sorted(tags.items())]
+    before = "".join(f",{key}={value}" for key, value in tags if key < "Symbol")
+    after = "".join(f",{key}={value}" for key, value in tags if key > "Symbol")
+    prefix = _escape_measurement(measurement) + before
+    if symbols is None:
+        heads = [prefix + after] * len(frame)
+    else:
+        heads = [f"{prefix},Symbol={symbol}{after}" for symbol in symbols]
+
+    columns = []
+    for name in frame.columns:
+        values = frame[name].values
+        key = _escape_tag(str(name))
+        if values.dtype.kind in "iu":
+            columns.append([f"{key}={value}i" for value in values.tolist()])
+        elif values.dtype.kind == "f":
+            columns.append(
+                [
+                    f"{key}={value!r}" if math.isfinite(value) else None
+                    for value in values.tolist()
+                ]
+            )
+        elif values.dtype.kind == "b":
+            columns.append([f"{key}={value}" for value in values.tolist()])
+
+    timestamps = utc_nanoseconds(frame.index).tolist()
+    result = []
+    for row, (head, timestamp) in enumerate(zip(heads, timestamps)):
+        fields = ",".join(column[row] for column in columns if column[row] is not None)
+        if fields:
+            result.append(f"{head} {fields} {timestamp}")
+    return result
+
+
+def _escape_measurement(value):
+    return value.replace(",", "\\,").replace(" ", "\\ ")
+
+
+def _escape_tag(value):
+    return value.replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
@@ -0,0 +1,188 @@
+import contextlib
+import threading
+import time
+
+
+class Metrics:
+    """
+    Records counters and timings and forwards them to pluggable sinks.
+
+    A sink is any object with ``increment(name, value, labels)`` and
+    ``observe(name, value, labels)`` methods, labels being a dict of strings.
+    """
+
+    def __init__(self, sinks=None):
+        """
+        Parameters
+        ---------
+            sinks: list
+                Sinks every metric is sent to. eg. [InMemorySink()]
+        """
+        self.sinks = list(sinks or [])
+
+    def add_sink(self, sink):
+        """Sends every following metric to sink as well."""
+        self.sinks.append(sink)
+
+    def increment(self, name, value=1, **labels):
+        """Adds value to a counter."""
+        for sink in self.sinks:
+            sink.increment(name, value, labels)
+
+    def observe(self, name, value, **labels):
+        """Records a single observation, eg. a duration in seconds."""
+        for sink in self.sinks:
+            sink.observe(name, value, labels)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """
+        Records the seconds spent in a with block as an observation.
+
+        The labels dict is yielded, so labels that are only known at the end of
+        the block (eg. the outcome) can still be added to it.
+        """
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+
+class InMemorySink:
+    """Keeps counters and observation summaries in memory."""
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) to value
+        self.summaries = {}  # (name, labels) to [count, sum, min, max]
+        self._lock = threading.Lock()
+
+    def increment(self, name, value, labels):
+        key = (name, _freeze(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels):
+        key = (name, _freeze(labels))
+        with self._lock:
+            summary = self.summaries.get(key)
+            if summary is None:
+                self.summaries[key] = [1, value, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                summary[2] = min(summary[2], value)
+                summary[3] = max(summary[3], value)
+
+    def counter(self, name, **labels):
+        """Returns the value of a counter, summed over the labels not given."""
+        with self._lock:
+            return sum(
+                value
+                for (key_name, key_labels), value in self.counters.items()
+                if key_name == name and _matches(key_labels, labels)
+            )
+
+    def summary(self, name, **labels):
+        """
+        Returns a summary of the observations of a metric.
+
+        Returns
+        -------
+        dict
+            count, sum, min, max and mean of the observations matching the labels.
+        """
+        count, total, low, high = 0, 0.0, None, None
+        with self._lock:
+            for (key_name, key_labels), values in self.summaries.items():
+                if key_name != name or not _matches(key_labels, labels):
+                    continue
+                count += values[0]
+                total += values[1]
+                low = values[2] if low is None else min(low, values[2])
+                high = values[3] if high is None else max(high, values[3])
+        return {
+            "count": count,
+            "sum": total,
+            "min": low,
+            "max": high,
+            "mean": total / count if count else None,
+        }
+
+    def reset(self):
+        """Clears every metric."""
+        with self._lock:
+            self.counters.clear()
+            self.summaries.clear()
+
+
+class PrometheusSink(InMemorySink):
+    """Keeps metrics in memory and renders them in the Prometheus text format."""
+
+    def __init__(self, namespace="tickerstore"):
+        super().__init__()
+        self.namespace = namespace
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            summaries = sorted(self.summaries.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"{self.namespace}_{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+        for (name, labels), (count, total, low, high) in summaries:
+            metric = f"{self.namespace}_{name}"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} summary")
+                seen.add(metric)
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total}")
+
+        return "\n".join(lines) + "\n"
+
+
+class CallbackSink:
+    """Calls a function for every metric."""
+
+    def __init__(self, callback):
+        """
+        Parameters
+        ---------
+            callback: callable
+                Called as ``callback(kind, name, value, labels)`` where kind is
+                "increment" or "observe".
+        """
+        self.callback = callback
+
+    def increment(self, name, value, labels):
+        self.callback("increment", name, value, labels)
+
+    def observe(self, name, value, labels):
+        self.callback("observe", name, value, labels)
+
+
+def _freeze(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _matches(frozen_labels, labels):
+    frozen = dict(frozen_labels)
+    return all(frozen.get(key) == str(value) for key, value in labels.items())
+
+
+def _format_labels(frozen_labels):
+    if not frozen_labels:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (key, value.replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in frozen_labels
+    )
+    return "{%s}" % pairs
@@ -0,0 +1,126 @@
+import pandas
+import numpy
+
+
+TIMEZONE = "Asia/Kolkata"  # All the bars are returned in IST
+INDEX_NAME = "timestamp"
+COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Symbol"]
+DTYPES = {
+    "Open": numpy.float64,
+    "High": numpy.float64,
+    "Low": numpy.float64,
+    "Close": numpy.float64,
+    "Volume": numpy.int64,
+}
+
+
+def upstox_frame(rows, ticker):
+    """
+    Builds a normalised DataFrame from the rows returned by Upstox get_ohlc.
+
+    Parameters
+    ---------
+        rows: list
+            List of dictionaries with timestamp (epoch milliseconds), open, high,
+            low, close and volume keys.
+        ticker: str
+            Ticker symbol the rows belong to.
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame indexed by an IST aware timestamp, or None if there are no rows.
+    """
+    if not rows:
+        return None
+
+    raw = pandas.DataFrame.from_records(
+        rows, columns=["timestamp", "open", "high", "low", "close", "volume"]
+    )
+    index = pandas.to_datetime(
+        raw["timestamp"].values.astype(numpy.int64), unit="ms", utc=True
+    ).tz_convert(TIMEZONE)
+
+    frame = pandas.DataFrame(
+        {
+            "Open": raw["open"].values.astype(DTYPES["Open"]),
+            "High": raw["high"].values.astype(DTYPES["High"]),
+            "Low": raw["low"].values.astype(DTYPES["Low"]),
+            "Close": raw["close"].values.astype(DTYPES["Close"]),
+            "Volume": raw["volume"].values.astype(DTYPES["Volume"]),
+        },
+        index=pandas.DatetimeIndex(index, name=INDEX_NAME),
+        columns=COLUMNS[:-1],
+    )
+    frame["Symbol"] = ticker
+    return _sorted_unique(frame)
+
+
+def nse_frame(data, ticker):
+    """
+    Builds a normalised DataFrame from the DataFrame returned by nsepy.get_history.
+
+    Parameters
+    ---------
+        data: pandas.DataFrame
+            DataFrame indexed by date, as returned by nsepy.get_history.
+        ticker: str
+            Ticker symbol the rows belong to.
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame indexed by an IST aware timestamp, or None if there are no rows.
+    """
+    if data is None or len(data) == 0:
+        return None
+
+    index = pandas.DatetimeIndex(pandas.to_datetime(data.index), name=INDEX_NAME)
+    frame = pandas.DataFrame(
+        {
+            "Open": data["Open"].values.astype(DTYPES["Open"]),
+            "High": data["High"].values.astype(DTYPES["High"]),
+            "Low": data["Low"].values.astype(DTYPES["Low"]),
+            "Close": data["Close"].values.astype(DTYPES["Close"]),
+            "Volume": data["Volume"].fillna(0).values.astype(DTYPES["Volume"]),
+        },
+        index=index.tz_localize(TIMEZONE),
+        columns=COLUMNS[:-1],
+    )
+    frame["Symbol"] = ticker
+    return _sorted_unique(frame)
+
+
+def utc_nanoseconds(index):
+    """
+    Returns every timestamp of an index as nanoseconds since epoch in UTC.
+
+    Naive timestamps are IST wall clock times, like every bar TickerStore
+    returns. Aware timestamps are converted from their own timezone.
+    """
+    index = pandas.DatetimeIndex(index)
+    if index.tz is None:
+        index = index.tz_localize(TIMEZONE)
+    index = index.tz_convert("UTC").tz_localize(None)
+    return numpy.asarray(index.values, dtype="datetime64[ns]").astype(numpy.int64)
+
+
+def local_nanoseconds(index):
+    """
+    Returns the wall clock time of every timestamp as nanoseconds since epoch.
+
+    Aware timestamps keep the wall clock of their own timezone, naive ones are
+    taken as they are, ie. as IST wall clock times.
+    """
+    index = pandas.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return numpy.asarray(index.values, dtype="datetime64[ns]").astype(numpy.int64)
+
+
+def _sorted_unique(frame):
+    """Sorts a frame by time, keeping the last row of duplicated timestamps."""
+    frame = frame[~frame.index.duplicated(keep="last")]
+    if not frame.index.is_monotonic_increasing:
+        frame = frame.sort_index()
+    return frame
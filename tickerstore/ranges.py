@@ -0,0 +1,97 @@
+import datetime
+
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def merge_ranges(ranges):
+    """
+    Merges overlapping or adjacent date ranges.
+
+    Parameters
+    ---------
+        ranges: list
+            A list of (start_date, end_date) tuples. Both ends are inclusive.
+
+    Returns
+    -------
+    list
+        Sorted list of non-overlapping (start_date, end_date) tuples.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + ONE_DAY:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_ranges(covered, start_date, end_date):
+    """
+    Works out which parts of a date range are not covered yet.
+
+    Parameters
+    ---------
+        covered: list
+            A list of (start_date, end_date) tuples that are already available.
+        start_date: datetime.date
+            Start of the requested range (inclusive).
+        end_date: datetime.date
+            End of the requested range (inclusive).
+
+    Returns
+    -------
+    list
+        Sorted list of (start_date, end_date) tuples inside the requested range
+        that are not part of ``covered``.
+    """
+    gaps = []
+    cursor = start_date
+    for start, end in merge_ranges(covered):
+        if end < cursor:
+            continue
+        if start > end_date:
+            break
+        if start > cursor:
+            gaps.append((cursor, start - ONE_DAY))
+        cursor = end + ONE_DAY
+        if cursor > end_date:
+            return gaps
+    if cursor <= end_date:
+        gaps.append((cursor, end_date))
+    return gaps
+
+
+def split_range(start_date, end_date, days):
+    """
+    Splits a date range into consecutive chunks.
+
+    Parameters
+    ---------
+        start_date: datetime.date
+            Start of the range (inclusive).
+        end_date: datetime.date
+            End of the range (inclusive).
+        days: int
+            Maximum number of days in each chunk, at least 1. None returns the
+            range as it is.
+
+    Returns
+    -------
+    list
+        Sorted list of (start_date, end_date) tuples covering the whole range.
+    """
+    if days is None:
+        return [(start_date, end_date)]
+    if days < 1:
+        raise ValueError(f"days must be at least 1, got {days}")
+
+    chunks = []
+    cursor = start_date
+    while cursor <= end_date:
+        chunk_end = min(cursor + datetime.timedelta(days=days - 1), end_date)
+        chunks.append((cursor, chunk_end))
+        cursor = chunk_end + ONE_DAY
+    return chunks
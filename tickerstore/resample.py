@@ -0,0 +1,132 @@
+from tickerstore.normalize import local_nanoseconds
+import datetime
+import pandas
+import numpy
+
+
+MINUTE = 60 * 10 ** 9  # nanoseconds
+DAY = 24 * 60 * MINUTE
+SESSION_OPEN = (9 * 60 + 15) * MINUTE  # 09:15 IST
+SESSION_CLOSE = (15 * 60 + 30) * MINUTE  # 15:30 IST
+
+WEEK = "week"
+MONTH = "month"
+
+AGGREGATION = {
+    "Open": "first",
+    "High": "max",
+    "Low": "min",
+    "Close": "last",
+    "Volume": "sum",
+}
+
+
+def bars(frame, size):
+    """
+    Builds coarser bars out of finer ones.
+
+    Parameters
+    ---------
+        frame: pandas.DataFrame
+            Bars in the schema returned by TickerStore.historical_data. Frames
+            with multiple tickers are resampled separately for every Symbol.
+        size: int or str
+            Number of minutes in every bar, for resampling intraday bars. WEEK or
+            MONTH for resampling daily bars.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Resampled bars in the same schema, labelled with the start of each bar.
+    """
+    if size == WEEK or size == MONTH:
+        return period_bars(frame, size)
+    return intraday_bars(frame, size)
+
+
+def intraday_bars(frame, minutes):
+    """
+    Builds bars of a number of minutes out of finer intraday bars.
+
+    Bars are aligned to the NSE session, which runs from 09:15 to 15:30 IST. So
+    60 minute bars start at 09:15, 10:15 and so on, the last bar of the day only
+    covers 15:15 to 15:30. Bars outside the session are dropped.
+
+    Parameters
+    ---------
+        frame: pandas.DataFrame
+            Intraday bars indexed by an IST timestamp.
+        minutes: int
+            Number of minutes in every bar.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Resampled bars in the same schema.
+    """
+    timestamps = local_nanoseconds(frame.index)
+    days = timestamps - timestamps % DAY
+    offsets = timestamps - days - SESSION_OPEN
+
+    in_session = (offsets >= 0) & (offsets < SESSION_CLOSE - SESSION_OPEN)
+    step = minutes * MINUTE
+    starts = days + SESSION_OPEN + offsets // step * step
+
+    return _aggregate(frame[in_session], starts[in_session], frame.index.tz)
+
+
+def period_bars(frame, period):
+    """
+    Builds weekly or monthly bars out of daily bars.
+
+    Parameters
+    ---------
+        frame: pandas.DataFrame
+            Daily bars indexed by an IST timestamp.
+        period: str
+            WEEK for bars starting on Monday, MONTH for bars starting on the first
+            day of the month.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Resampled bars in the same schema. A bar only holds the daily bars of
+        frame, so frame should start at the period_start of its first bar.
+    """
+    timestamps = local_nanoseconds(frame.index)
+    days = timestamps - timestamps % DAY
+    if period == WEEK:
+        starts = days - numpy.asarray(frame.index.dayofweek, dtype=numpy.int64) * DAY
+    else:
+        starts = days - (numpy.asarray(frame.index.day, dtype=numpy.int64) - 1) * DAY
+
+    return _aggregate(frame, starts, frame.index.tz)
+
+
+def period_start(date, period):
+    """Returns the first day of the week (Monday) or month holding a date."""
+    if period == WEEK:
+        return date - datetime.timedelta(days=date.weekday())
+    return date.replace(day=1)
+
+
+def _aggregate(frame, starts, tz):
+    """Aggregates the rows of frame that share the same bar start."""
+    labels = pandas.DatetimeIndex(starts)
+    if tz is not None:
+        labels = labels.tz_localize(tz)
+
+    work = frame[list(AGGREGATION)].reset_index(drop=True)
+    work["timestamp"] = labels
+    if "Symbol" in frame.columns:
+        work["Symbol"] = frame["Symbol"].values
+        grouped = work.groupby(["Symbol", "timestamp"], sort=True)
+    else:
+        grouped = work.groupby("timestamp", sort=True)
+
+    result = grouped.agg(AGGREGATION)
+    if "Symbol" in frame.columns:
+        result = result.reset_index(level="Symbol")
+        result = result[list(AGGREGATION) + ["Symbol"]]
+
+    return result.astype({column: frame[column].dtype for column in AGGREGATION})
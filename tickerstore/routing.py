@@ -0,0 +1,209 @@
+from loguru import logger
+import threading
+import time
+
+CLOSED = "closed"  # Source is used
+OPEN = "open"  # Source is skipped until it recovers
+HALF_OPEN = "half_open"  # A single trial request decides whether it recovered
+
+
+class SourceHealth:
+    """
+    Success rate, latency and circuit breaker state of a single source.
+
+    Success rate and latency are exponentially weighted moving averages, so
+    recent requests matter more than old ones. The circuit opens after a run of
+    consecutive failures and is closed again by the first successful trial once
+    the cooldown has passed.
+    """
+
+    def __init__(self, alpha=0.2, failure_threshold=3, cooldown=30.0):
+        """
+        Parameters
+        ---------
+            alpha: float
+                Weight of the latest request in the moving averages.
+            failure_threshold: int
+                Consecutive failures after which the circuit opens.
+            cooldown: float
+                Seconds an open circuit waits before a source is tried again.
+        """
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self.state = CLOSED
+        self.latency = None  # Seconds, moving average
+        self.success_rate = 1.0  # Moving average
+        self.requests = 0
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.__trial_started = None
+        self.__lock = threading.Lock()
+
+    def record(self, success, seconds):
+        """Updates the health with the result of a request."""
+        with self.__lock:
+            self.requests += 1
+            self.success_rate += self.alpha * (float(success) - self.success_rate)
+            if success:
+                if self.latency is None:
+                    self.latency = seconds
+                else:
+                    self.latency += self.alpha * (seconds - self.latency)
+                self.consecutive_failures = 0
+                self.state = CLOSED
+            else:
+                self.consecutive_failures += 1
+                if (
+                    self.state == HALF_OPEN
+                    or self.consecutive_failures >= self.failure_threshold
+                ):
+                    self.state = OPEN
+                    self.opened_at = time.monotonic()
+            self.__trial_started = None
+
+    def allow(self, trial=True):
+        """
+        Returns whether a request may be sent to the source.
+
+        Parameters
+        ---------
+            trial: bool
+                Let a single request through once an open circuit has cooled
+                down. Disabled when a background prober does the trials.
+        """
+        with self.__lock:
+            if self.state == CLOSED:
+                return True
+            if not trial or not self.cooled_down():
+                return False
+            # A trial whose source ended up unused doesn't block the next one
+            # for longer than a cooldown
+            now = time.monotonic()
+            if (
+                self.__trial_started is not None
+                and now - self.__trial_started < self.cooldown
+            ):
+                return False
+            self.state = HALF_OPEN
+            self.__trial_started = now
+            return True
+
+    def cooled_down(self):
+        return (
+            self.opened_at is not None
+            and time.monotonic() - self.opened_at >= self.cooldown
+        )
+
+    def snapshot(self):
+        """Returns the health as a dict."""
+        return {
+            "state": self.state,
+            "latency": self.latency,
+            "success_rate": self.success_rate,
+            "requests": self.requests,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class AdaptiveRouter:
+    """
+    Orders sources by their observed health instead of a fixed fetch order.
+
+    Sources with an open circuit are skipped and the remaining ones are ordered
+    by their average latency. Sources that haven't been used yet keep their
+    place in the default order, so every source gets tried.
+    """
+
+    def __init__(self, sources, supports=None, **health_options):
+        """
+        Parameters
+        ---------
+            sources: list
+                Sources in their default order. eg. [TickerStore.UPSTOX, TickerStore.NSE]
+            supports: callable
+                Called as ``supports(source, interval)``, returns whether a source
+                can provide an interval. All intervals are assumed when None.
+            health_options:
+                Passed on to the SourceHealth of every source.
+        """
+        self.sources = list(sources)
+        self.supports = supports
+        self.health = {source: SourceHealth(**health_options) for source in sources}
+        self.__prober = None
+        self.__stop = threading.Event()
+
+    def order(self, interval=None):
+        """Returns the sources to try for an interval, best first."""
+        trial = self.__prober is None
+        candidates = []
+        for position, source in enumerate(self.sources):
+            if (
+                interval is not None
+                and self.supports is not None
+                and not self.supports(source, interval)
+            ):
+                continue
+            health = self.health[source]
+            if not health.allow(trial):
+                continue
+            latency = health.latency if health.latency is not None else 0.0
+            candidates.append((latency, position, source))
+        return [source for latency, position, source in sorted(candidates)]
+
+    def record(self, source, success, seconds):
+        """Updates the health of a source with the result of a request."""
+        health = self.health.get(source)
+        if health is None:
+            return
+        previous = health.state
+        health.record(success, seconds)
+        if health.state != previous:
+            logger.warning(f"Circuit of source {source} is now {health.state}")
+
+    def start_probing(self, probe, interval=30.0):
+        """
+        Probes sources with an open circuit in a background thread.
+
+        Once a probe succeeds the source is used again, so a recovered source
+        doesn't cost a real request a failed attempt.
+
+        Parameters
+        ---------
+            probe: callable
+                Called as ``probe(source)`` and raising an exception on failure.
+            interval: float
+                Seconds between probing rounds.
+        """
+        self.stop_probing()
+        self.__stop.clear()
+        self.__prober = threading.Thread(
+            target=self.__probe_loop,
+            args=(probe, interval),
+            name="tickerstore-probe",
+            daemon=True,
+        )
+        self.__prober.start()
+
+    def stop_probing(self):
+        """Stops the background prober, if it is running."""
+        if self.__prober is None:
+            return
+        self.__stop.set()
+        self.__prober.join()
+        self.__prober = None
+
+    def __probe_loop(self, probe, interval):
+        while not self.__stop.wait(interval):
+            for source, health in self.health.items():
+                if health.state == CLOSED or not health.cooled_down():
+                    continue
+                started = time.monotonic()
+                try:
+                    probe(source)
+                    success = True
+                except Exception as e:
+                    logger.debug(f"Probe of source {source} failed : {e}")
+                    success = False
+                self.record(source, success, time.monotonic() - started)
@@ -0,0 +1,284 @@
+from tickerstore.errors import TickerStoreError
+from tickerstore.store import TickerStore
+from tickerstore import export
+from loguru import logger
+import argparse
+import datetime
+import hashlib
+import gzip
+import json
+import sys
+
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+TKS = "application/x-tickerstore"
+
+FORMATS = {"json": JSON, "arrow": ARROW, "tks": TKS}
+MAX_TICKERS = 500  # Tickers a single batch request may ask for
+BODY_FIELDS = ["tickers", "start", "end", "interval", "format"]  # Of POST batches
+MIN_GZIP_SIZE = 1024  # Smaller JSON responses aren't worth compressing
+
+
+class BadRequest(TickerStoreError):
+    pass
+
+
+def create_app(store=None, **options):
+    """
+    Builds the Flask app serving historical data over HTTP.
+
+    Endpoints::
+
+        GET /historical?ticker=SBIN&start=2018-01-01&end=2018-01-31&interval=day_1
+        GET /historical/batch?tickers=SBIN,INFY&start=...&end=...&interval=...
+        POST /historical/batch {"tickers": ["SBIN", "INFY"], "start": ..., ...}
+        GET /health
+
+    Bars are returned as JSON (gzipped when the client accepts it), as an
+    Arrow IPC stream or in the native TKS1 format, picked with the format
+    query parameter or the Accept header. Every response carries an ETag of
+    its bars, a request sending it back in If-None-Match gets an empty 304.
+
+    Parameters
+    ---------
+        store: TickerStore
+            Store the bars are fetched with. Give it a cache_dir shared with
+            the other processes, so data is fetched from the sources once.
+        options:
+            Used to create a TickerStore when store is None.
+
+    Returns
+    -------
+    flask.Flask
+        The WSGI app, eg. for gunicorn "tickerstore.server:create_app()".
+    """
+    from flask import Flask, request
+
+    app = Flask(__name__)
+    store = store or TickerStore(**options)
+    app.config["TICKERSTORE"] = store
+
+    @app.errorhandler(BadRequest)
+    def bad_request(e):
+        return _error(400, str(e))
+
+    @app.route("/health")
+    def health():
+        return _json_response(
+            request,
+            {"status": "ok", "sources": store.available_sources()},
+            cache=False,
+        )
+
+    @app.route("/historical")
+    def historical():
+        params = request.args
+        ticker = _argument(params, "ticker")
+        start_date, end_date, interval = _range(params)
+        data = store.historical_data(ticker, start_date, end_date, interval)
+        if data is None:
+            return _error(404, f"No data for {ticker}")
+        return _bars_response(request, params, data, end_date)
+
+    @app.route("/historical/batch", methods=["GET", "POST"])
+    def historical_batch():
+        if request.method == "POST":
+            params = _body(request)
+            tickers = params["tickers"]
+        else:
+            params = request.args
+            tickers = _argument(params, "tickers").split(",")
+        tickers = [ticker.strip() for ticker in tickers if ticker.strip()]
+        if not tickers:
+            raise BadRequest("tickers is empty")
+        if len(tickers) > MAX_TICKERS:
+            raise BadRequest(f"At most {MAX_TICKERS} tickers can be asked at once")
+
+        start_date, end_date, interval = _range(params)
+        data, failures = store.historical_data_many(
+            tickers, start_date, end_date, interval
+        )
+        if data is None:
+            return _error(404, "No data for any of the tickers", failures=failures)
+        return _bars_response(request, params, data, end_date, failures)
+
+    return app
+
+
+def main(argv=None):
+    """Entry point of the tickerstore-serve command."""
+    parser = argparse.ArgumentParser(
+        description="Serve historical data over HTTP from a shared cache."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cache-dir", default=".tickerstore-cache")
+    parser.add_argument("--cache-size-limit", type=int, help="bytes")
+    parser.add_argument(
+        "--fetch-order",
+        help="comma separated sources, eg. nse,upstox",
+    )
+    parser.add_argument("--dotenv", help="path of the .env file with Upstox keys")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    logger.enable("tickerstore")
+
+    kwargs = {
+        "cache_dir": args.cache_dir,
+        "cache_size_limit": args.cache_size_limit,
+    }
+    if args.dotenv:
+        kwargs["dotenv_path"] = args.dotenv
+    store = TickerStore(**kwargs)
+    if args.fetch_order:
+        store.set_fetch_order(args.fetch_order.split(","))
+
+    app = create_app(store)
+    logger.info(f"Serving historical data on http://{args.host}:{args.port}")
+    app.run(host=args.host, port=args.port, threaded=True)
+    return 0
+
+
+def _argument(params, name):
+    value = params.get(name)
+    if not value:
+        raise BadRequest(f"{name} is missing")
+    return value
+
+
+def _body(request):
+    """
+    Returns the parameters of a batch request sent as a JSON body.
+
+    The body is an object with tickers as a list of strings, and the start,
+    end, interval and format fields of the query string as strings. Query
+    parameters are used for the fields the body leaves out.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise BadRequest("Body must be a JSON object")
+
+    unknown = sorted(set(body) - set(BODY_FIELDS))
+    if unknown:
+        raise BadRequest(f"Unknown fields {', '.join(unknown)}")
+
+    tickers = body.get("tickers")
+    if (
+        not isinstance(tickers, list)
+        or not tickers
+        or not all(isinstance(ticker, str) for ticker in tickers)
+    ):
+        raise BadRequest("tickers must be a non-empty list of strings")
+
+    params = {"tickers": tickers}
+    for name in BODY_FIELDS[1:]:
+        value = body.get(name, request.args.get(name))
+        if value is not None and not isinstance(value, str):
+            raise BadRequest(f"{name} must be a string")
+        if value is not None:
+            params[name] = value
+    return params
+
+
+def _range(params):
+    """Returns the start date, end date and interval of a request."""
+    try:
+        start_date = datetime.date.fromisoformat(_argument(params, "start"))
+        end_date = datetime.date.fromisoformat(_argument(params, "end"))
+    except ValueError as e:
+        raise BadRequest(f"Dates must be YYYY-MM-DD: {e}")
+    if start_date > end_date:
+        raise BadRequest("start is after end")
+
+    name = params.get("interval", "day_1")
+    if name not in TickerStore.INTERVAL_NAMES or name == "tick":
+        raise BadRequest(f"Unknown interval {name}")
+    return start_date, end_date, TickerStore.INTERVAL_NAMES[name]
+
+
+def _format(request, params):
+    """Returns the media type a request asks for."""
+    name = params.get("format")
+    if name is not None:
+        if name not in FORMATS:
+            raise BadRequest(f"Unknown format {name}")
+        return FORMATS[name]
+    return request.accept_mimetypes.best_match([JSON, ARROW, TKS], default=JSON)
+
+
+def _bars_response(request, params, data, end_date, failures=None):
+    media_type = _format(request, params)
+    if media_type == JSON:
+        frame = data.reset_index()
+        frame[frame.columns[0]] = frame[frame.columns[0]].map(
+            lambda timestamp: timestamp.isoformat()
+        )
+        body = {"columns": list(frame.columns), "data": frame.values.tolist()}
+        if failures is not None:
+            body["failures"] = failures
+        payload = json.dumps(body).encode()
+    elif media_type == ARROW:
+        try:
+            payload = export.arrow_stream(data)
+        except TickerStoreError as e:
+            return _error(406, str(e))
+    else:
+        payload = export.encode(data)
+
+    headers = {}
+    if failures and media_type != JSON:
+        headers["X-TickerStore-Failures"] = json.dumps(failures)
+    return _response(
+        request,
+        payload,
+        media_type,
+        cache=end_date < datetime.date.today(),
+        headers=headers,
+    )
+
+
+def _json_response(request, body, cache=True):
+    return _response(request, json.dumps(body).encode(), JSON, cache)
+
+
+def _error(status, message, **extra):
+    from flask import Response
+
+    body = dict(extra, error=message)
+    return Response(json.dumps(body), status=status, mimetype=JSON)
+
+
+def _response(request, payload, media_type, cache, headers=None):
+    """Answers with a payload, or with a 304 if the client already has it."""
+    from flask import Response
+
+    # Weak, since the same bars are sent with and without compression
+    etag = hashlib.sha1(media_type.encode() + payload).hexdigest()
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept, Accept-Encoding"
+    # Bars of past days don't change, today's are still being formed
+    headers["Cache-Control"] = "max-age=3600" if cache else "no-cache"
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag, weak=True)
+        return response
+
+    if (
+        media_type == JSON
+        and len(payload) >= MIN_GZIP_SIZE
+        and "gzip" in request.accept_encodings
+    ):
+        payload = gzip.compress(payload, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+
+    response = Response(payload, mimetype=media_type, headers=headers)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,188 @@
+from tickerstore.errors import TickerStoreError
+from loguru import logger
+import contextlib
+import threading
+import pathlib
+import sqlite3
+import socket
+import json
+import time
+import os
+
+DATABASE_FILE = "tickerstore.db"
+DEFAULT_LEASE = 10 * 60  # Seconds a lock is held at most, unless released earlier
+
+
+class SharedState:
+    """
+    State shared by every process on a host that uses the same folder.
+
+    Backed by an SQLite database, it provides small JSON values and named
+    locks. A lock is a lease: it is released when its holder leaves the with
+    block, and taken over by others if the holder died or the lease ran out.
+
+    Use SharedState.for_folder to share one instance within a process.
+    """
+
+    _instances = {}  # Database path to instance
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path):
+        """
+        Parameters
+        ---------
+            path: str
+                Path of the SQLite database. Created if missing.
+        """
+        self.path = str(path)
+        # SQLite connections can't be shared by threads
+        self.__local = threading.local()
+
+        with self.__transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS locks "
+                "(name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)"
+            )
+
+    @classmethod
+    def for_folder(cls, folder):
+        """Returns the shared state kept in a folder."""
+        folder = pathlib.Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        path = str((folder / DATABASE_FILE).resolve())
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    @classmethod
+    def forget(cls, folder):
+        """Drops the shared state of a folder, eg. before the folder is removed."""
+        path = str((pathlib.Path(folder) / DATABASE_FILE).resolve())
+        with cls._instances_lock:
+            cls._instances.pop(path, None)
+
+    def get(self, key, default=None):
+        """Returns the value stored under key."""
+        row = (
+            self.__connection()
+            .execute("SELECT value FROM kv WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """Stores a JSON serialisable value under key."""
+        with self.__transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                (key, json.dumps(value)),
+            )
+
+    @contextlib.contextmanager
+    def lock(self, name, lease=DEFAULT_LEASE, timeout=None):
+        """
+        Holds a lock shared by every thread and process using this state.
+
+        Parameters
+        ---------
+            name: str
+                Name of the lock. eg. "access_token"
+            lease: float
+                Seconds after which the lock is considered abandoned.
+            timeout: float
+                Seconds to wait for the lock. None waits forever.
+        """
+        owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        started = time.monotonic()
+        delay = 0.01
+        while not self.__acquire(name, owner, lease):
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise TickerStoreError(f"Timed out waiting for the {name} lock")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+        try:
+            yield
+        finally:
+            with self.__transaction() as db:
+                db.execute(
+                    "DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner)
+                )
+
+    def __acquire(self, name, owner, lease):
+        now = time.time()
+        with self.__transaction() as db:
+            row = db.execute(
+                "SELECT owner, expires_at FROM locks WHERE name = ?", (name,)
+            ).fetchone()
+            if row is not None and row[1] > now and _alive(row[0]):
+                return False
+            if row is not None:
+                logger.warning(f"Taking over the {name} lock abandoned by {row[0]}")
+            db.execute(
+                "INSERT OR REPLACE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, owner, now + lease),
+            )
+            return True
+
+    @contextlib.contextmanager
+    def __transaction(self):
+        db = self.__connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def __connection(self):
+        db = getattr(self.__local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.__local.db = db
+        return db
+
+
+@contextlib.contextmanager
+def atomic_file(path, mode="wb"):
+    """
+    Yields a file that replaces path once the with block completes.
+
+    Readers see either the old or the new file, never a partially written one,
+    even when several processes write the same path.
+    """
+    path = pathlib.Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(str(tmp_path), str(path))
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+
+def _alive(owner):
+    """Returns whether the process holding a lock is still running."""
+    host, pid, thread = owner.rsplit(":", 2)
+    if host != socket.gethostname():
+        return True  # Can't tell, the lease decides
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
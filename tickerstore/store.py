@@ -1,28 +1,37 @@
-from upstox_api.api import *
-from . import daemon as daemon
+from tickerstore import auth
+from tickerstore.cache import HistoricalDataCache
+from tickerstore.coalesce import SingleFlight
+from tickerstore.contracts import MasterContract
 from tickerstore.errors import SourceError
+from tickerstore.errors import SourcesFailedError
 from tickerstore.errors import TickerStoreError
-from dotenv import load_dotenv
+from tickerstore.metrics import InMemorySink
+from tickerstore.metrics import Metrics
+from tickerstore.ranges import split_range
+from tickerstore.routing import AdaptiveRouter
+from tickerstore import normalize
+from tickerstore import resample
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from concurrent.futures import wait
 from loguru import logger
-import nsepy
+import threading
 import datetime
 import pathlib
 import pandas
+import numpy
 import os
 import time
-import json
-import math
-import crayons
-import urllib3
 import pandas as pd
 
-logger.add("TickerStore.log", rotation="50 MB")
-
 
 class TickerStore:
     UPSTOX = "upstox"
     NSE = "nse"
 
+    SOURCE_NAMES = {UPSTOX: "Upstox", NSE: "NSE"}
+
     INTERVAL_TICK_BY_TICK = 1
     INTERVAL_MINUTE_1 = 2
     INTERVAL_MINUTE_5 = 3
@@ -33,23 +42,105 @@ class TickerStore:
     INTERVAL_WEEK_1 = 8
     INTERVAL_MONTH_1 = 9
 
+    # Names of the intervals, used by the command line tools
+    INTERVAL_NAMES = {
+        "tick": INTERVAL_TICK_BY_TICK,
+        "minute_1": INTERVAL_MINUTE_1,
+        "minute_5": INTERVAL_MINUTE_5,
+        "minute_10": INTERVAL_MINUTE_10,
+        "minute_30": INTERVAL_MINUTE_30,
+        "minute_60": INTERVAL_MINUTE_60,
+        "day_1": INTERVAL_DAY_1,
+        "week_1": INTERVAL_WEEK_1,
+        "month_1": INTERVAL_MONTH_1,
+    }
+
+    # Names of the matching upstox_api.api.OHLCInterval members, upstox_api is
+    # only imported once Upstox is used
+    UPSTOX_INTERVALS = {
+        INTERVAL_MINUTE_1: "Minute_1",
+        INTERVAL_MINUTE_5: "Minute_5",
+        INTERVAL_MINUTE_10: "Minute_10",
+        INTERVAL_MINUTE_30: "Minute_30",
+        INTERVAL_MINUTE_60: "Minute_60",
+        INTERVAL_DAY_1: "Day_1",
+        INTERVAL_WEEK_1: "Week_1",
+        INTERVAL_MONTH_1: "Month_1",
+    }
+
+    # Number of days requested at once from Upstox. Weekly and monthly bars
+    # aren't split, since a chunk boundary would cut a bar in two.
+    DEFAULT_CHUNK_DAYS = {
+        INTERVAL_MINUTE_1: 30,
+        INTERVAL_MINUTE_5: 90,
+        INTERVAL_MINUTE_10: 90,
+        INTERVAL_MINUTE_30: 180,
+        INTERVAL_MINUTE_60: 365,
+        INTERVAL_DAY_1: 3650,
+        INTERVAL_WEEK_1: None,
+        INTERVAL_MONTH_1: None,
+    }
+
+    # Intervals that can be built locally out of finer bars, and the finer
+    # interval they are built from
+    RESAMPLED_INTERVALS = {
+        INTERVAL_MINUTE_5: (INTERVAL_MINUTE_1, 5),
+        INTERVAL_MINUTE_10: (INTERVAL_MINUTE_1, 10),
+        INTERVAL_MINUTE_30: (INTERVAL_MINUTE_1, 30),
+        INTERVAL_MINUTE_60: (INTERVAL_MINUTE_1, 60),
+        INTERVAL_WEEK_1: (INTERVAL_DAY_1, resample.WEEK),
+        INTERVAL_MONTH_1: (INTERVAL_DAY_1, resample.MONTH),
+    }
+
+    RETRY_BACKOFF = 0.5  # Seconds to wait before the first retry of a chunk
+
     def __init__(self, **kwargs):
-        logger.info("Creating TickerStore instance object")
+        logger.debug("Creating TickerStore instance object")
 
         # Initializing object with default values
         self.fetch_order = [TickerStore.UPSTOX, TickerStore.NSE]  # Default fetch order
-        self.upstox_credentials_verified = (
-            False
-        )  # To make sure upstox credentials are correct
+        # Whether the upstox credentials are correct. False until credentials are
+        # found, then None until they are verified on first use
+        self.__upstox_credentials = False
         self.upstox_access_token = None  # For storing the upstox access token
+        self.token_manager = None  # Holds the access token until it expires
         self.access_token_file_path = None  # path for access token file
+        self.upstox_client = None  # Upstox client shared by all the calls
+        self.upstox_client_token = None  # Access token the client was created with
+        self.upstox_client_lock = threading.Lock()
+        self.master_contract = None  # Symbol to instrument index for NSE_EQ
+        self.cache = None  # On-disk cache of fetched bars
+        # Timings and counters of every fetch
+        self.metrics = kwargs.get("metrics") or Metrics([InMemorySink()])
+        self.source_semaphores = {}  # Concurrency limits for each source
+        # Shares in-flight fetches between threads asking for the same bars
+        self.coalescer = None
+        if kwargs.get("coalesce", True):
+            self.coalescer = SingleFlight(self.metrics)
+        self.router = None  # Orders sources by their health, see set_adaptive_routing
+        # Run the first and the hedge requests of hedged fetches apart, so
+        # hedges never queue behind slow first requests. Threads are only
+        # started when used, see close
+        self.primary_executor = ThreadPoolExecutor(
+            max_workers=kwargs.get("hedge_workers", 8)
+        )
+        self.hedge_executor = ThreadPoolExecutor(
+            max_workers=kwargs.get("hedge_workers", 8)
+        )
+        self.chunk_days = dict(TickerStore.DEFAULT_CHUNK_DAYS)
+        self.chunk_workers = kwargs.get("chunk_workers", 4)
+        self.chunk_retries = kwargs.get("chunk_retries", 2)
+        # Build coarse Upstox intervals out of finer bars instead of fetching them
+        self.local_resample = kwargs.get("local_resample", False)
 
         # Load the values from .env files to Enviroment variable
         if "dotenv_path" in kwargs:
-            logger.info("dotfile path was passed. Loading dotfile")
+            logger.debug("dotfile path was passed. Loading dotfile")
+            from dotenv import load_dotenv
+
             load_dotenv(dotenv_path=kwargs["dotenv_path"])
-            self.__upstox_verify_credentails()
-            logger.info("dotfile loaded")
+            self.__upstox_credentials = None
+            logger.debug("dotfile loaded")
 
         if (
             "upstox_api_key" in kwargs.keys()
@@ -57,12 +148,12 @@ class TickerStore:
             and "upstox_redirect_uri" in kwargs.keys()
             and "temp_server_auth_page" in kwargs.keys()
         ):
-            logger.info("making upstox API key, secret as enviroment variables.")
+            logger.debug("making upstox API key, secret as enviroment variables.")
             os.environ["UPSTOX_API_KEY"] = kwargs["upstox_api_key"]
             os.environ["UPSTOX_API_SECRET"] = kwargs["upstox_api_secret"]
             os.environ["UPSTOX_REDIRECT_URI"] = kwargs["upstox_redirect_uri"]
             os.environ["TEMP_SERVER_AUTH_PAGE"] = kwargs["temp_server_auth_page"]
-            self.__upstox_verify_credentails()
+            self.__upstox_credentials = None
 
         if "access_token_file_path" in kwargs.keys():
             self.access_token_file_path = kwargs["access_token_file_path"]
@@ -70,6 +161,38 @@ class TickerStore:
                 f"Specified a custom path for access_token.file: {self.access_token_file_path}"
             )
 
+        if "cache_dir" in kwargs.keys():
+            logger.debug(f"Caching fetched bars in {kwargs['cache_dir']}")
+            self.cache = HistoricalDataCache(
+                kwargs["cache_dir"],
+                size_limit=kwargs.get("cache_size_limit"),
+                refetch_today=kwargs.get("cache_refetch_today", True),
+            )
+
+        if "chunk_days" in kwargs.keys():
+            for interval, days in kwargs["chunk_days"].items():
+                self.set_chunk_days(interval, days)
+
+        if "source_concurrency" in kwargs.keys():
+            for source, limit in kwargs["source_concurrency"].items():
+                self.set_source_concurrency(source, limit)
+
+    @property
+    def upstox_credentials_verified(self):
+        """Whether Upstox accepted the credentials, checked on first use."""
+        if self.__upstox_credentials is None:
+            self.__upstox_credentials = auth.verify_credentials(
+                os.getenv("UPSTOX_API_KEY"),
+                os.getenv("UPSTOX_API_SECRET"),
+                os.getenv("UPSTOX_REDIRECT_URI"),
+                self.__state_folder(),
+            )
+        return self.__upstox_credentials
+
+    @upstox_credentials_verified.setter
+    def upstox_credentials_verified(self, verified):
+        self.__upstox_credentials = verified
+
     def set_fetch_order(self, fetch_order):
         """
         Fetches data from multiple sources.
@@ -87,14 +210,98 @@ class TickerStore:
         if self.fetch_order is not None:
             self.fetch_order = fetch_order
 
+        # A static fetch order overrides adaptive routing
+        if self.router is not None:
+            self.router.stop_probing()
+            self.router = None
+
+    def set_adaptive_routing(self, probe_ticker="SBIN", probe_interval=30.0, **options):
+        """
+        Routes every request to the fastest healthy source instead of following
+        the fetch order.
+
+        The success rate and latency of every source are tracked. A source that
+        keeps failing is skipped (its circuit opens) and probed in the
+        background until it answers again. Sources that can't provide the
+        requested interval are skipped as well. Call set_fetch_order to go back
+        to a static order.
+
+        Parameters
+        ---------
+            probe_ticker: str
+                Ticker whose recent daily bars are fetched to probe a source.
+            probe_interval: float
+                Seconds between background probes. None disables probing, an
+                open circuit then lets a single real request through once it
+                has cooled down.
+            options:
+                alpha, failure_threshold and cooldown of
+                tickerstore.routing.SourceHealth.
+
+        Returns
+        -------
+        None
+        """
+        if self.router is not None:
+            self.router.stop_probing()
+
+        self.probe_ticker = probe_ticker
+        self.router = AdaptiveRouter(
+            self.fetch_order, supports=self.source_supports, **options
+        )
+        if probe_interval is not None:
+            self.router.start_probing(self.__probe, probe_interval)
+
+    def source_supports(self, source, interval):
+        """Returns whether a source can provide bars of an interval."""
+        if interval in TickerStore.RESAMPLED_INTERVALS:
+            base_interval, size = TickerStore.RESAMPLED_INTERVALS[interval]
+            if self.source_supports(source, base_interval):
+                return True
+
+        if source == TickerStore.UPSTOX:
+            return interval in TickerStore.UPSTOX_INTERVALS
+        if source == TickerStore.NSE:
+            return interval == TickerStore.INTERVAL_DAY_1
+        return False
+
+    def record_source_result(self, source, success, seconds):
+        """Feeds the result of a request to a source to adaptive routing."""
+        if self.router is not None:
+            self.router.record(source, success, seconds)
+
     def get_fetch_order(self):
         """Returns the fetch order of historical data."""
         return self.fetch_order
 
-    def historical_data(self, ticker, start_date, end_date, interval):
+    def available_sources(self, interval=None):
+        """
+        Returns the sources that can be used right now, in the order they
+        should be tried.
+
+        With adaptive routing the order follows the health of the sources and
+        sources that don't support the interval are left out.
+        """
+        if self.router is not None:
+            sources = self.router.order(interval)
+        else:
+            sources = self.fetch_order
+        return [
+            source
+            for source in sources
+            if source == TickerStore.NSE
+            or (source == TickerStore.UPSTOX and self.upstox_credentials_verified)
+        ]
+
+    def historical_data(self, ticker, start_date, end_date, interval, hedge_delay=None):
         """
         Fetches data from multiple sources.
 
+        With a hedge delay the request is sent to the first source and, if it
+        hasn't answered after hedge_delay seconds, to the next source as well.
+        The first source to return data wins and the other request is cancelled,
+        trading extra provider calls for a bounded tail latency.
+
         Parameters
         ---------
             ticker: str
@@ -106,61 +313,423 @@ class TickerStore:
             interval: int
                 Make use of INTERVAL_* variables in TickerStore class to specify the
                 time interval in which to operate on.
+            hedge_delay: float
+                Seconds to wait for a source before also asking the next one.
+                None tries the sources one after another.
 
         Returns
         -------
-        JSON
-            A list of dictionaries is return. Each dictionary represents
-            each time interval.
+        pandas.DataFrame
+            Bars indexed by an IST aware timestamp with Open, High, Low, Close,
+            Volume and Symbol columns. None if there is no data.
         """
-        logger.info("Starting to fetch historical data")
-        historical_data = None
-        for source in self.fetch_order:
+        logger.debug("Starting to fetch historical data")
+        try:
+            return self.__fetch_with_fallback(
+                ticker, start_date, end_date, interval, hedge_delay
+            )
+        except TickerStoreError:
+            logger.error("None of the source provided any data")
+            # Returning back an empty data frame
+            return None
 
-            # Source: Upstox
-            if source == TickerStore.UPSTOX and self.upstox_credentials_verified:
+    def historical_data_many(
+        self,
+        tickers,
+        start_date,
+        end_date,
+        interval,
+        max_workers=8,
+        combine=True,
+        hedge_delay=None,
+    ):
+        """
+        Fetches data for multiple tickers concurrently.
+
+        Every ticker is fetched on a bounded thread pool using the same fetch order
+        fallback as historical_data. A ticker that no source could provide data for
+        is reported in the failures and does not abort the rest of the batch.
+
+        Parameters
+        ---------
+            tickers: list
+                List of ticker symbols. eg. ["SBIN", "RELIANCE"]
+            start_date: datetime.date
+                Date from where historical data needs to be fetched. Eg. date(2018,1,1)
+            end_date: datetime.date
+                Date uptil which you want the historical data to be fetched. Eg. date(2018,6,1)
+            interval: int
+                Make use of INTERVAL_* variables in TickerStore class to specify the
+                time interval in which to operate on.
+            max_workers: int
+                Maximum number of tickers fetched at the same time.
+            combine: bool
+                If True, return a single DataFrame with all the tickers, distinguished
+                by its Symbol column. Otherwise return a dict of DataFrames keyed by ticker.
+            hedge_delay: float
+                Seconds to wait for a source before also asking the next one, see
+                historical_data.
 
-                # Fetching data from upstox
-                logger.info("Trying source UPSTOX for fetching historical data")
+        Returns
+        -------
+        tuple
+            (data, failures) where data is a DataFrame (or dict of DataFrames) and
+            failures is a dict mapping each failed ticker to its error message.
+        """
+        logger.debug(f"Starting to fetch historical data for {len(tickers)} tickers")
+        frames = {}
+        failures = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    self.__fetch_with_fallback,
+                    ticker,
+                    start_date,
+                    end_date,
+                    interval,
+                    hedge_delay,
+                ): ticker
+                for ticker in tickers
+            }
+            for future in as_completed(futures):
+                ticker = futures[future]
                 try:
-                    logger.info("Calling upstox_historical_data")
-                    historical_data = self.upstox_historical_data(
-                        ticker, start_date, end_date, interval
-                    )
-                    logger.info("upstox_historical_data method returned")
+                    frames[ticker] = future.result()
+                except Exception as e:
+                    logger.error(f"Unable to fetch historical data for {ticker} : {e}")
+                    failures[ticker] = str(e)
 
-                    break
-                except SourceError as e:
-                    logger.error("Upstox SourceError : %s" % e)
-                    print(crayons.red("Upstox source error: %s" % e, bold=True))
+        # Keep the order in which the tickers were requested
+        frames = {ticker: frames[ticker] for ticker in tickers if ticker in frames}
 
-            # Source: NSE
-            elif source == TickerStore.NSE:
+        if not combine:
+            return frames, failures
 
-                # Fetching data from NSE
-                logger.info("Trying source NSE for fetching historical data")
-                try:
-                    logger.info("Calling nse_historical_data")
-                    historical_data = self.nse_historical_data(
-                        ticker, start_date, end_date, interval
-                    )
-                    logger.info("nse_historical_data method returned")
+        if not frames:
+            return None, failures
 
-                    break
-                except SourceError as e:
-                    logger.error("NSE SourceError : %s" % e)
-                    print(crayons.red("NSE source error: %s" % e, bold=True))
+        return pandas.concat(list(frames.values())), failures
+
+    def iter_historical_data(
+        self, ticker, start_date, end_date, interval, rows=None, days_per_fetch=None
+    ):
+        """
+        Fetches data from multiple sources, yielding it in small DataFrames.
+
+        The date range is fetched one sub-range at a time, so only a single
+        sub-range is held in memory. Every yielded DataFrame has the same columns
+        as the one returned by historical_data.
+
+        Parameters
+        ---------
+            ticker: str
+                String representing the ticker symbol. eg. "SBIN"
+            start_date: datetime.date
+                Date from where historical data needs to be fetched. Eg. date(2018,1,1)
+            end_date: datetime.date
+                Date uptil which you want the historical data to be fetched. Eg. date(2018,6,1)
+            interval: int
+                Make use of INTERVAL_* variables in TickerStore class to specify the
+                time interval in which to operate on.
+            rows: int
+                Number of rows in each yielded DataFrame. If None, one DataFrame is
+                yielded for every trading day.
+            days_per_fetch: int
+                Number of days fetched from a source at once. Defaults to the chunk
+                size of the interval.
+
+        Yields
+        ------
+        pandas.DataFrame
+            Consecutive bars between start_date and end_date. Sub-ranges the
+            sources have no bars for are skipped.
+
+        Raises
+        ------
+        SourcesFailedError
+            If every source failed for a sub-range, after the bars before it
+            were yielded.
+        """
+        days = days_per_fetch or self.chunk_days.get(interval)
+        buffered = []  # Frames not yielded yet when rows is given
+        buffered_rows = 0
+
+        for sub_start, sub_end in split_range(start_date, end_date, days):
+            logger.debug(f"Fetching historical data from {sub_start} to {sub_end}")
+            try:
+                frame = self.__fetch_with_fallback(ticker, sub_start, sub_end, interval)
+            except SourcesFailedError as e:
+                # The sub-range can't be skipped like one without bars, the
+                # caller would never know the bars are missing
+                raise SourcesFailedError(
+                    f"Unable to fetch {ticker} from {sub_start} to {sub_end}: {e}"
+                )
+            except TickerStoreError as e:
+                logger.error(f"No data from {sub_start} to {sub_end} : {e}")
+                continue
+
+            if rows is None:
+                yield from _split_by_day(frame)
+                continue
+
+            buffered.append(frame)
+            buffered_rows += len(frame)
+            if buffered_rows < rows:
+                continue
+
+            pending = pandas.concat(buffered)
+            full = len(pending) - len(pending) % rows
+            for offset in range(0, full, rows):
+                yield pending.iloc[offset : offset + rows]
+            buffered = [pending.iloc[full:]]
+            buffered_rows = len(pending) - full
+
+        if buffered_rows > 0:
+            yield pandas.concat(buffered)
+
+    def set_source_concurrency(self, source, limit):
+        """
+        Limits the number of requests made to a source at the same time.
+        Every chunk of a long Upstox fetch counts as a request of its own.
+
+        Parameters
+        ---------
+            source: str
+                TickerStore.UPSTOX or TickerStore.NSE
+            limit: int
+                Maximum number of concurrent requests. None removes the limit.
+
+        Returns
+        -------
+        None
+
+        """
+        if limit is None:
+            self.source_semaphores.pop(source, None)
+        else:
+            self.source_semaphores[source] = threading.BoundedSemaphore(limit)
+
+    def __limited(self, source, request, *args):
+        """Makes a single request to source within its concurrency limit."""
+        semaphore = self.source_semaphores.get(source)
+        if semaphore is None:
+            return request(*args)
+        with semaphore:
+            return request(*args)
+
+    def __fetch_with_fallback(
+        self, ticker, start_date, end_date, interval, hedge_delay=None
+    ):
+        """Tries every source in fetch order until one of them provides data."""
+        if hedge_delay is not None:
+            return self.__fetch_hedged(
+                ticker, start_date, end_date, interval, hedge_delay
+            )
+
+        historical_data = None
+        answered = False
+        errors = []
+        for source in self.available_sources(interval):
+            try:
+                historical_data = self.fetch_source(
+                    source, ticker, start_date, end_date, interval
+                )
+                answered = True
+                break
+            except SourceError as e:
+                errors.append("%s: %s" % (TickerStore.SOURCE_NAMES[source], e))
+                self.metrics.increment("source_fallbacks", source=source)
 
         if historical_data is None:
-            logger.error("None of the source provided any data")
-            # Returning back an empty data frame
-            return None
-            # raise TickerStoreError(
-            #     "No data returned. No data source provided data for the requested time interval!"
-            # )
+            _raise_no_data(answered, errors)
 
         return historical_data
 
+    def __fetch_hedged(self, ticker, start_date, end_date, interval, hedge_delay):
+        """
+        Asks the next source as well whenever the running ones take longer than
+        hedge_delay, returning the first data that comes back. The first request
+        runs on primary_executor, the following ones on hedge_executor.
+        """
+        sources = list(self.available_sources(interval))  # Not asked yet
+        count = len(sources)
+        pending = {}  # Future to source
+        answered = False  # Whether a source answered, even without data
+        errors = []
+
+        def launch():
+            if len(sources) == count:
+                executor = self.primary_executor
+            else:
+                executor = self.hedge_executor
+            source = sources.pop(0)
+            logger.debug(f"Sending request for {ticker} to source {source}")
+            future = executor.submit(
+                self.fetch_source, source, ticker, start_date, end_date, interval
+            )
+            pending[future] = source
+
+        if sources:
+            launch()
+
+        while pending:
+            done, _ = wait(
+                pending,
+                timeout=hedge_delay if sources else None,
+                return_when=FIRST_COMPLETED,
+            )
+
+            if not done:
+                self.metrics.increment("hedges", source=sources[0])
+                launch()
+                continue
+
+            for future in done:
+                source = pending.pop(future)
+                try:
+                    data = future.result()
+                except SourceError as e:
+                    errors.append("%s: %s" % (TickerStore.SOURCE_NAMES[source], e))
+                    self.metrics.increment("source_fallbacks", source=source)
+                    continue
+
+                answered = True
+                if data is None:
+                    continue
+
+                # Threads can't be interrupted, a request that already started
+                # finishes in the background and its result is dropped
+                for loser in pending:
+                    loser.cancel()
+                self.metrics.increment("hedge_wins", source=source)
+                return data
+
+            # Nothing running anymore, fall back to the next source right away
+            if not pending and sources:
+                launch()
+
+        _raise_no_data(answered, errors)
+
+    def fetch_source(self, source, ticker, start_date, end_date, interval):
+        """
+        Fetches from a single source, recording its latency and outcome.
+
+        Like source_historical_data, but the fetch is timed in the
+        source_fetch_seconds metric and reported to the router, as every
+        fetch of historical_data is.
+        """
+        name = TickerStore.SOURCE_NAMES[source]
+        logger.debug(f"Trying source {name} for fetching historical data")
+
+        with self.metrics.timer("source_fetch_seconds", source=source) as labels:
+            started = time.perf_counter()
+            try:
+                data = self.source_historical_data(
+                    source, ticker, start_date, end_date, interval
+                )
+            except SourceError as e:
+                labels["outcome"] = "error"
+                self.record_source_result(source, False, time.perf_counter() - started)
+                logger.error("%s SourceError : %s" % (name, e))
+                import crayons
+
+                print(crayons.red("%s source error: %s" % (name, e), bold=True))
+                raise
+
+            labels["outcome"] = "ok" if data is not None else "empty"
+            self.record_source_result(source, True, time.perf_counter() - started)
+            return data
+
+    def source_historical_data(self, source, ticker, start_date, end_date, interval):
+        """
+        Fetches data from a single source, going through the cache if enabled.
+
+        Threads asking for bars that another thread is already fetching from
+        the same source wait for that fetch and share its result.
+
+        Parameters
+        ---------
+            source: str
+                TickerStore.UPSTOX or TickerStore.NSE
+            ticker: str
+                String representing the ticker symbol. eg. "SBIN"
+            start_date: datetime.date
+                Date from where historical data needs to be fetched. Eg. date(2018,1,1)
+            end_date: datetime.date
+                Date uptil which you want the historical data to be fetched. Eg. date(2018,6,1)
+            interval: int
+                Make use of INTERVAL_* variables in TickerStore class to specify the
+                time interval in which to operate on.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Bars indexed by an IST aware timestamp with Open, High, Low, Close,
+            Volume and Symbol columns. None if there is no data.
+        """
+        if interval == TickerStore.INTERVAL_TICK_BY_TICK:
+            raise SourceError(
+                "tick by tick data is only available live, use stream_ticks."
+            )
+
+        # NSE only provides daily bars, so weekly and monthly bars are always
+        # built locally for it
+        if interval in TickerStore.RESAMPLED_INTERVALS and (
+            self.local_resample or source == TickerStore.NSE
+        ):
+            base_interval, size = TickerStore.RESAMPLED_INTERVALS[interval]
+            # A weekly or monthly bar is built from its whole period, even when
+            # the range starts in the middle of it, so it doesn't depend on
+            # start_date. Every bar then starts within the widened range.
+            base_start = start_date
+            if size == resample.WEEK or size == resample.MONTH:
+                base_start = resample.period_start(start_date, size)
+            data = self.source_historical_data(
+                source, ticker, base_start, end_date, base_interval
+            )
+            if data is None:
+                return None
+            logger.debug(f"Resampling bars locally to {size}")
+            return resample.bars(data, size)
+
+        if source == TickerStore.UPSTOX:
+            fetch = self.upstox_historical_data
+        else:
+            fetch = self.nse_historical_data
+
+        def limited_fetch(start, end):
+            # Upstox fans out into chunk requests, which are limited one by one
+            if source == TickerStore.UPSTOX:
+                data = fetch(ticker, start, end, interval)
+            else:
+                data = self.__limited(source, fetch, ticker, start, end, interval)
+
+            if data is not None:
+                self.metrics.increment("rows_fetched", len(data), source=source)
+                self.metrics.increment(
+                    "bytes_fetched", int(data.memory_usage().sum()), source=source
+                )
+            return data
+
+        def cached_fetch():
+            if self.cache is None:
+                return limited_fetch(start_date, end_date)
+            return self.cache.get(
+                source, ticker, interval, start_date, end_date, limited_fetch
+            )
+
+        if self.coalescer is None:
+            return cached_fetch()
+
+        return self.coalescer.do(
+            (source, ticker, interval),
+            start_date,
+            end_date,
+            cached_fetch,
+            source=source,
+        )
+
     def upstox_historical_data(self, ticker, start_date, end_date, interval):
         """
         Fetches data from Upstox API
@@ -179,132 +748,191 @@ class TickerStore:
 
         Returns
         -------
-        JSON
-            A list of dictionaries is return. Each dictionary represents
-            each time interval.
+        pandas.DataFrame
+            Bars indexed by an IST aware timestamp with Open, High, Low, Close,
+            Volume and Symbol columns. None if there is no data.
 
         """
 
+        from upstox_api.api import OHLCInterval
+        import requests
+
         # Fetching upstox access token
         self.__upstox_get_access_token()
 
-        # Fetching data depending on the interval specified
-        data = None
-
         ##########################################
         # Credentails have been verfied
         # Creating upstox object to connect with
         # the API
         ##########################################
         try:
-            logger.info("Creating Upstox object")
-            u = Upstox(os.getenv("UPSTOX_API_KEY"), self.upstox_access_token)
-            logger.info("Fetching the master contracts")
-            u.get_master_contract("NSE_EQ")
-
-            logger.info("Fetch all equity symbols")
-            instrument = u.get_instrument_by_symbol("NSE_EQ", ticker)
-            logger.info("All equity symbols fetched")
-
-            # 1 minute interval
-            if interval == TickerStore.INTERVAL_MINUTE_1:
-                logger.info("fetching data for 1 minute interval")
-                data = u.get_ohlc(
-                    instrument, OHLCInterval.Minute_1, start_date, end_date
-                )
+            u = self.__upstox_client()
 
-            # 5 minute interval
-            elif interval == TickerStore.INTERVAL_MINUTE_5:
-                logger.info("fetching data for 5 minute interval")
-                data = u.get_ohlc(
-                    instrument, OHLCInterval.Minute_5, start_date, end_date
-                )
+            logger.debug("Looking up instrument in the master contract")
+            instrument = self.master_contract.instrument(u, ticker)
+            if instrument is None:
+                raise SourceError(f"{ticker} not found in the NSE_EQ master contract.")
 
-            # 10 minute interval
-            elif interval == TickerStore.INTERVAL_MINUTE_10:
-                logger.info("fetching data for 10 minute interval")
-                data = u.get_ohlc(
-                    instrument, OHLCInterval.Minute_10, start_date, end_date
-                )
+            if interval not in TickerStore.UPSTOX_INTERVALS:
+                raise SourceError("not available for requested time interval.")
+            ohlc_interval = getattr(
+                OHLCInterval, TickerStore.UPSTOX_INTERVALS[interval]
+            )
 
-            # 30 minute interval
-            elif interval == TickerStore.INTERVAL_MINUTE_30:
-                logger.info("fetching data for 30 minute interval")
-                data = u.get_ohlc(
-                    instrument, OHLCInterval.Minute_30, start_date, end_date
-                )
+        # Raised rather than returned as no data, so the failure is counted by
+        # the circuit breaker, the next source is tried and nothing is cached
+        except requests.HTTPError as e:
+            logger.error(f"Exception occured (requests.HTTPError) : {e}")
+            raise SourceError(f"unable to set up the Upstox client: {e}")
+
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.error(f"Exception occured ({type(e).__name__}) : {e}")
+            raise SourceError(f"unable to reach Upstox: {e}")
+
+        # Long ranges are split into chunks which are fetched concurrently
+        chunks = split_range(start_date, end_date, self.chunk_days.get(interval))
+        logger.debug(f"fetching data for {ohlc_interval} in {len(chunks)} chunk(s)")
+        data = self.__fetch_chunks(
+            lambda start, end: self.__limited(
+                TickerStore.UPSTOX, u.get_ohlc, instrument, ohlc_interval, start, end
+            ),
+            chunks,
+        )
 
-            # 60 minute interval
-            elif interval == TickerStore.INTERVAL_MINUTE_60:
-                logger.info("fetching data for 60 minute interval")
-                data = u.get_ohlc(
-                    instrument, OHLCInterval.Minute_60, start_date, end_date
-                )
+        # Data formatting
+        logger.debug("Creating pandas dataframe")
+
+        # If there was no data, None is returned
+        with self.metrics.timer("normalise_seconds", source=TickerStore.UPSTOX):
+            return normalize.upstox_frame(data, ticker)
+
+    def stream_ticks(
+        self,
+        tickers,
+        column_store=None,
+        intervals=(INTERVAL_MINUTE_1,),
+        feed=None,
+        **options,
+    ):
+        """
+        Streams live ticks into bars, which are appended to a column store.
 
-            # 1 day interval
-            elif interval == TickerStore.INTERVAL_DAY_1:
-                logger.info("fetching data for 1 day interval")
-                data = u.get_ohlc(instrument, OHLCInterval.Day_1, start_date, end_date)
-
-            # 1 week interval
-            elif interval == TickerStore.INTERVAL_WEEK_1:
-                logger.info("fetching data for 1 week interval")
-                data = u.get_ohlc(instrument, OHLCInterval.Week_1, start_date, end_date)
-
-            # 1 month interval
-            elif interval == TickerStore.INTERVAL_MONTH_1:
-                logger.info("fetching data for 1 month interval")
-                data = u.get_ohlc(
-                    instrument, OHLCInterval.Month_1, start_date, end_date
-                )
+        Parameters
+        ---------
+            tickers: list
+                Ticker symbols to subscribe to. eg. ["SBIN", "INFY"]
+            column_store: tickerstore.columnar.ColumnStore
+                Store the completed bars are appended to.
+            intervals: tuple
+                INTERVAL_MINUTE_* values to build bars for.
+            feed: tickerstore.ticks.ReplayFeed
+                Source of the ticks. None subscribes to the Upstox quote stream.
+            options:
+                Passed on to tickerstore.ticks.TickIngester, eg. capacity,
+                flush_interval or on_bars.
 
-        except requests.HTTPError as e:
-            logger.error(f"Exception occured (requests.HTTPError) : {e}")
-            return None
+        Returns
+        -------
+        tickerstore.ticks.TickIngester
+            The running ingester, stop() it to unsubscribe.
+        """
+        from tickerstore import ticks
+
+        if feed is None:
+            self.__upstox_get_access_token()
+            client = self.__upstox_client()
+            instruments = {}
+            for ticker in tickers:
+                instrument = self.master_contract.instrument(client, ticker)
+                if instrument is None:
+                    raise SourceError(
+                        f"{ticker} not found in the NSE_EQ master contract."
+                    )
+                instruments[ticker] = instrument
+            feed = ticks.UpstoxFeed(client, instruments)
 
-        except requests.ConnectionError as e:
-            logger.exception("Exception Occured! (requests.ConnectionError)")
-            return None
+        options.setdefault("metrics", self.metrics)
+        ingester = ticks.TickIngester(feed, column_store, intervals, **options)
+        return ingester.start()
 
-        # Data formatting
-        logger.info("Creating pandas dataframe")
-
-        # If there was no data, return None
-        if len(data) > 0:
-            formatted_data = pandas.DataFrame(data)
-
-            # setting dtypes for columns
-            formatted_data.close = formatted_data.close.astype(float)
-            formatted_data.high = formatted_data.high.astype(float)
-            formatted_data.low = formatted_data.low.astype(float)
-            formatted_data.open = formatted_data.open.astype(float)
-            formatted_data.timestamp = formatted_data.timestamp.astype(int)
-            formatted_data.volume = formatted_data.volume.astype(int)
-
-            # Formatting dataframe for consumption
-            logger.info("Formatting timestamp information in dataframe")
-            formatted_data["timestamp"] = formatted_data["timestamp"] / 1000
-            formatted_data["timestamp"] = formatted_data["timestamp"].apply(
-                datetime.datetime.fromtimestamp
-            )
-            formatted_data = formatted_data.set_index("timestamp")
-            formatted_data["Symbol"] = ticker
-
-            logger.info("Renaming column name")
-            formatted_data = formatted_data.rename(
-                columns={
-                    "close": "Close",
-                    "high": "High",
-                    "low": "Low",
-                    "open": "Open",
-                    "volume": "Volume",
-                }
+    def close(self):
+        """
+        Stops the threads of hedged fetches and adaptive routing probes.
+        Requests that lost their race are not waited for.
+        """
+        self.primary_executor.shutdown(wait=False, cancel_futures=True)
+        self.hedge_executor.shutdown(wait=False, cancel_futures=True)
+        if self.router is not None:
+            self.router.stop_probing()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def set_chunk_days(self, interval, days):
+        """
+        Sets the number of days requested at once from Upstox for an interval.
+
+        Parameters
+        ---------
+            interval: int
+                One of the INTERVAL_* variables in TickerStore class.
+            days: int
+                Number of days in each chunk, at least 1. None fetches the whole
+                range at once.
+
+        Returns
+        -------
+        None
+
+        """
+        if days is not None and days < 1:
+            raise ValueError(f"days must be at least 1, got {days}")
+        self.chunk_days[interval] = days
+
+    def __fetch_chunks(self, fetch, chunks):
+        """Fetches every chunk concurrently and returns all the rows in order."""
+        if len(chunks) == 1:
+            return self.__fetch_with_retry(fetch, *chunks[0])
+
+        workers = min(self.chunk_workers, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    lambda chunk: self.__fetch_with_retry(fetch, *chunk), chunks
+                )
             )
 
-            logger.info("returning formatted data frame")
-            return formatted_data
-        else:
-            return None
+        rows = []
+        for result in results:
+            rows.extend(result or [])
+        return rows
+
+    def __fetch_with_retry(self, fetch, start_date, end_date):
+        """Calls fetch for a chunk, retrying with a backoff on network errors."""
+        import requests
+
+        for attempt in range(self.chunk_retries + 1):
+            try:
+                return fetch(start_date, end_date)
+            except (
+                requests.HTTPError,
+                requests.ConnectionError,
+                requests.Timeout,
+            ) as e:
+                if attempt == self.chunk_retries:
+                    logger.error(f"Giving up on chunk {start_date} - {end_date} : {e}")
+                    raise SourceError(
+                        f"unable to fetch data from {start_date} to {end_date}: {e}"
+                    )
+
+                delay = TickerStore.RETRY_BACKOFF * 2 ** attempt
+                logger.warning(
+                    f"Chunk {start_date} - {end_date} failed ({e}), retrying in {delay}s"
+                )
+                time.sleep(delay)
 
     def nse_historical_data(self, ticker, start_date, end_date, interval):
         """
@@ -324,144 +952,87 @@ class TickerStore:
 
         Returns
         -------
-        JSON
-            A list of dictionaries is return. Each dictionary represents
-            each time interval.
+        pandas.DataFrame
+            Bars indexed by an IST aware timestamp with Open, High, Low, Close,
+            Volume and Symbol columns. None if there is no data.
         """
         if interval == TickerStore.INTERVAL_DAY_1:
+            import nsepy
+
             data = nsepy.get_history(symbol=ticker, start=start_date, end=end_date)
-            formatted_data = data.copy(deep=True)
-            formatted_data = formatted_data.drop(
-                columns=[
-                    "Series",
-                    "Prev Close",
-                    "VWAP",
-                    "Turnover",
-                    "Trades",
-                    "Deliverable Volume",
-                    "%Deliverble",
-                    "Last",
-                ]
-            )
-            return formatted_data
+            with self.metrics.timer("normalise_seconds", source=TickerStore.NSE):
+                return normalize.nse_frame(data, ticker)
         else:
             raise SourceError("not available for requested time interval.")
 
-    def __upstox_verify_credentails(self):
-        """Verify the given Upstox credentials."""
-
-        logger.info("Verifying API key and secret credentials")
-        api_key = os.getenv("UPSTOX_API_KEY", "temp")
-        redirect_uri = os.getenv("UPSTOX_REDIRECT_URI", "temp")
-        api_secret = os.getenv("UPSTOX_API_SECRET", "temp")
+    def __probe(self, source):
+        """Fetches a few recent daily bars straight from a source, skipping the cache."""
+        end_date = datetime.date.today()
+        start_date = end_date - datetime.timedelta(days=7)
+        if source == TickerStore.UPSTOX:
+            self.upstox_historical_data(
+                self.probe_ticker, start_date, end_date, TickerStore.INTERVAL_DAY_1
+            )
+        else:
+            self.nse_historical_data(
+                self.probe_ticker, start_date, end_date, TickerStore.INTERVAL_DAY_1
+            )
 
-        if (
-            api_key is not "temp"
-            or redirect_uri is not "temp"
-            or api_secret is not "temp"
-        ):
-            logger.info("api_key, redirect_uri and api_secret are not temp")
-            logger.info("creating an Upstox Session")
-            try:
-                s = Session(os.getenv("UPSTOX_API_KEY"))
-                s.set_redirect_uri(os.getenv("UPSTOX_REDIRECT_URI"))
-                s.set_api_secret(os.getenv("UPSTOX_API_SECRET"))
-                url = s.get_login_url()
-
-                req = requests.get(url)
-                logger.debug(
-                    f"Status code for the login url request is {req.status_code}"
+    def __upstox_client(self):
+        """Returns the Upstox client, creating it again only if the access token changed."""
+        with self.upstox_client_lock:
+            if (
+                self.upstox_client is None
+                or self.upstox_client_token != self.upstox_access_token
+            ):
+                logger.debug("Creating Upstox object")
+                from upstox_api.api import Upstox
+
+                self.upstox_client = Upstox(
+                    os.getenv("UPSTOX_API_KEY"), self.upstox_access_token
                 )
+                self.upstox_client_token = self.upstox_access_token
 
-                if req.status_code != 200:
-                    # Something, wrong with the API or credentials provided
-                    info = req.json()
-                    logger.debug(f"Unable to verify credentials. Error: {info}")
-                    return  # Don't continue execution if there was an error
-
-                # Upstox credentials are verified
-                self.upstox_credentials_verified = True
-
-            except ConnectionError:
-                logger.exception(
-                    "ConnectionError(HTTPSConnectionPool) error while creating upstox session object."
+            if self.master_contract is None:
+                self.master_contract = MasterContract(
+                    "NSE_EQ", self.__state_folder(), metrics=self.metrics
                 )
 
-        else:
-            logger.error(
-                "Unable to access values of UPSTOX_API_KEY, UPSTOX_API_SECRET or UPSTOX_REDIRECT_URI"
-            )
-            return
-
-    def __upstox_get_access_token(self):
-        """Fetch access token for given API creds"""
-
-        logger.info("Getting Upstox access token")
+            return self.upstox_client
 
+    def __state_folder(self):
+        """Folder in which the access token and master contract are stored."""
         # Choose access_token_file_path or the __file__ for storing access_token on disk
         if self.access_token_file_path:
-            package_folder_path = pathlib.Path(self.access_token_file_path)
-        else:
-            package_folder_path = pathlib.Path(__file__).parent
-
-        access_token_file = package_folder_path / "access_token.file"
-
-        logger.debug(f"Path for access_token file: {access_token_file}")
-
-        # Access toke file exists
-        if access_token_file.exists():
-            logger.info("access_token.file already exists")
-
-            # Open access token file
-            with open(access_token_file, "r") as file:
-
-                # Load and parse data from file
-                logger.info("Opening access_token.file")
-                data = json.load(file)
-                access_token_time = datetime.datetime.fromtimestamp(data["time"])
-                present_time = datetime.datetime.fromtimestamp(int(time.time()))
-
-                # Content in file is old, re-fetch access token
-                if math.fabs(access_token_time.day - present_time.day) > 0:
+            return pathlib.Path(self.access_token_file_path)
+        return pathlib.Path(__file__).parent
 
-                    # Again fetch the access_token
-                    logger.info(
-                        "access_token.file contains stale credentials. Getting new credentials"
-                    )
-                    self.upstox_access_token = daemon.auth_upstox()
-                    logger.debug(f"Access Token fetched")
-
-                    # Writing new access token to file
-                    with open(access_token_file, "w") as z:
-                        logger.info("Writing new access token to file")
-                        json.dump(
-                            {
-                                "access_token": self.upstox_access_token,
-                                "time": int(time.time()),
-                            },
-                            z,
-                        )
-
-                # Contents of file is new
-                else:
-                    logger.info("Contents of access token file is usable")
-                    self.upstox_access_token = data["access_token"]
-
-        # No access token file found
-        else:
-
-            # No access token file found, authorizing user and creating access token file
-            logger.info("access_token.file not found, fetching new access token")
-            self.upstox_access_token = daemon.auth_upstox()
-            logger.debug(f"access token fetched: {self.upstox_access_token}")
-
-            # Writing the access token to file
-            with open(access_token_file, "w") as file:
-                logger.info("Writing the new access token to file")
-                json.dump(
-                    {
-                        "access_token": self.upstox_access_token,
-                        "time": int(time.time()),
-                    },
-                    file,
-                )
+    def __upstox_get_access_token(self):
+        """Fetch access token for given API creds"""
+        if self.token_manager is None:
+            self.token_manager = auth.TokenManager.for_folder(
+                self.__state_folder(), metrics=self.metrics
+            )
+        self.upstox_access_token = self.token_manager.token()
+
+
+def _raise_no_data(answered, errors):
+    """Raises the error of a fetch no source provided data for."""
+    if not answered:
+        raise SourcesFailedError(
+            "No data returned. Every data source failed! %s" % "; ".join(errors)
+        )
+    raise TickerStoreError(
+        "No data returned. No data source provided data for the requested time interval! %s"
+        % "; ".join(errors)
+    )
+
+
+def _split_by_day(frame):
+    """Yields the rows of a time sorted frame one day at a time."""
+    days = frame.index.normalize()
+    boundaries = numpy.flatnonzero(days[1:] != days[:-1]) + 1
+    start = 0
+    for end in list(boundaries) + [len(frame)]:
+        yield frame.iloc[start:end]
+        start = end
@@ -0,0 +1,234 @@
+from tickerstore.columnar import ColumnStore
+from tickerstore.store import TickerStore
+from loguru import logger
+import argparse
+import datetime
+import time
+import sys
+
+
+DEFAULT_HISTORY_DAYS = 365  # Days fetched for a ticker that has no stored bars
+
+
+class SyncStats:
+    """Throughput of a sync run."""
+
+    def __init__(self):
+        self.tickers = 0  # Tickers that were synced
+        self.up_to_date = 0  # Tickers that didn't need any new bars
+        self.failures = {}  # Ticker to error message
+        self.bars = 0  # New bars appended to the store, replaced ones excluded
+        self.bytes_fetched = 0  # In-memory size of the fetched bars
+        self.started = time.time()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def summary(self):
+        """Returns a one line summary of the run."""
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"Synced {self.tickers} tickers ({self.up_to_date} up to date, "
+            f"{len(self.failures)} failed) in {self.elapsed:.1f}s: "
+            f"{self.tickers / elapsed:.1f} tickers/s, {self.bars / elapsed:.1f} bars/s, "
+            f"{self.bars} bars, {self.bytes_fetched} bytes fetched"
+        )
+
+
+def read_universe(path):
+    """
+    Reads a universe file.
+
+    Parameters
+    ---------
+        path: str
+            Text file with one ticker per line. Blank lines and lines starting
+            with # are ignored.
+
+    Returns
+    -------
+    list
+        The tickers in the file, in order.
+    """
+    tickers = []
+    with open(path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                tickers.append(line)
+    return tickers
+
+
+def sync(
+    fetcher,
+    column_store,
+    tickers,
+    interval=TickerStore.INTERVAL_DAY_1,
+    start_date=None,
+    end_date=None,
+    max_workers=8,
+    sink=None,
+):
+    """
+    Fetches the bars that are newer than the last stored bar of every ticker.
+
+    Bars are appended to the column store, which only commits complete
+    appends. A run that is interrupted can simply be started again, it carries
+    on from the last committed bar of every ticker.
+
+    The last stored bar might have been synced before its day, week or month
+    was over, so its whole period is fetched again and replaces it.
+
+    Parameters
+    ---------
+        fetcher: TickerStore
+            TickerStore used to fetch the bars, with its fetch order.
+        column_store: ColumnStore
+            Store the bars are appended to.
+        tickers: list
+            Tickers to sync.
+        interval: int
+            Make use of INTERVAL_* variables in TickerStore class.
+        start_date: datetime.date
+            Date from where tickers without stored bars are fetched. Defaults to
+            DEFAULT_HISTORY_DAYS days ago.
+        end_date: datetime.date
+            Date uptil which bars are fetched. Defaults to today.
+        max_workers: int
+            Maximum number of tickers fetched at the same time.
+        sink: tickerstore.influx.InfluxSink
+            Also receives every fetched bar, tagged with the interval name.
+            Points are idempotent, so bars that are fetched again overwrite
+            themselves.
+
+    Returns
+    -------
+    SyncStats
+        Throughput of the run.
+    """
+    end_date = end_date or datetime.date.today()
+    start_date = start_date or end_date - datetime.timedelta(days=DEFAULT_HISTORY_DAYS)
+    stats = SyncStats()
+    interval_name = {v: k for k, v in TickerStore.INTERVAL_NAMES.items()}[interval]
+
+    # Tickers stored up to the same day share a start date, so they are fetched
+    # in a single batch
+    batches = {}
+    for ticker in tickers:
+        ticker_start = _resume_date(column_store, ticker, interval, start_date)
+        if ticker_start > end_date:
+            stats.up_to_date += 1
+            continue
+        batches.setdefault(ticker_start, []).append(ticker)
+
+    for batch_start, batch in sorted(batches.items()):
+        logger.info(f"Syncing {len(batch)} tickers from {batch_start} to {end_date}")
+        frames, failures = fetcher.historical_data_many(
+            batch, batch_start, end_date, interval, max_workers, combine=False
+        )
+        stats.failures.update(failures)
+
+        for ticker, frame in frames.items():
+            stats.bytes_fetched += int(frame.memory_usage(deep=True).sum())
+            added = column_store.append(ticker, interval, frame, replace=True)
+            if sink is not None:
+                sink.write(frame, tags={"interval": interval_name})
+            # Only the last stored period was fetched again, nothing was new
+            if added == 0:
+                stats.up_to_date += 1
+                continue
+            stats.bars += added
+            stats.tickers += 1
+
+    stats.finished = time.time()
+    return stats
+
+
+def _resume_date(column_store, ticker, interval, start_date):
+    """Returns the date from where new bars of a ticker have to be fetched."""
+    last = column_store.last_timestamp(ticker, interval)
+    if last is None:
+        return start_date
+
+    # The period of the last bar might be incomplete, it is fetched again from
+    # its start. Intraday bars are fetched again from the start of their day.
+    last_date = last.date()
+    if interval == TickerStore.INTERVAL_WEEK_1:
+        return last_date - datetime.timedelta(days=last_date.weekday())
+    if interval == TickerStore.INTERVAL_MONTH_1:
+        return last_date.replace(day=1)
+    return last_date
+
+
+def main(argv=None):
+    """Entry point of the tickerstore-sync command."""
+    parser = argparse.ArgumentParser(
+        description="Fetch the bars that are missing from a local column store."
+    )
+    parser.add_argument("universe", help="file with one ticker per line")
+    parser.add_argument("store", help="folder of the column store")
+    parser.add_argument(
+        "--interval",
+        default="day_1",
+        choices=[name for name in TickerStore.INTERVAL_NAMES if name != "tick"],
+    )
+    parser.add_argument("--start", type=_date, help="YYYY-MM-DD, for new tickers")
+    parser.add_argument("--end", type=_date, help="YYYY-MM-DD, defaults to today")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--fetch-order",
+        help="comma separated sources, eg. nse,upstox",
+    )
+    parser.add_argument("--dotenv", help="path of the .env file with Upstox keys")
+    parser.add_argument("--cache-dir", help="folder for the on-disk cache")
+    parser.add_argument("--influx", help="InfluxDB URL the bars are also written to")
+    parser.add_argument("--influx-db", default="tickerstore")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    logger.enable("tickerstore")
+
+    kwargs = {}
+    if args.dotenv:
+        kwargs["dotenv_path"] = args.dotenv
+    if args.cache_dir:
+        kwargs["cache_dir"] = args.cache_dir
+    fetcher = TickerStore(**kwargs)
+    if args.fetch_order:
+        fetcher.set_fetch_order(args.fetch_order.split(","))
+
+    sink = None
+    if args.influx:
+        from tickerstore.influx import InfluxSink
+
+        sink = InfluxSink(args.influx, args.influx_db, metrics=fetcher.metrics)
+
+    stats = sync(
+        fetcher,
+        ColumnStore(args.store),
+        read_universe(args.universe),
+        interval=TickerStore.INTERVAL_NAMES[args.interval],
+        start_date=args.start,
+        end_date=args.end,
+        max_workers=args.workers,
+        sink=sink,
+    )
+    if sink is not None:
+        sink.close()
+
+    for ticker, error in sorted(stats.failures.items()):
+        print(f"{ticker}: {error}")
+    print(stats.summary())
+    return 1 if stats.failures else 0
+
+
+def _date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
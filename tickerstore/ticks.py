@@ -0,0 +1,682 @@
+from tickerstore.normalize import INDEX_NAME
+from tickerstore.normalize import TIMEZONE
+from tickerstore.resample import DAY
+from tickerstore.resample import MINUTE
+from tickerstore.resample import SESSION_CLOSE
+from tickerstore.resample import SESSION_OPEN
+from tickerstore.store import TickerStore
+from loguru import logger
+import threading
+import pandas
+import numpy
+import json
+import time
+
+IST_OFFSET = 330 * MINUTE  # IST is UTC+05:30 all year round
+
+# Minutes in every bar of the intervals built out of ticks
+INTERVAL_MINUTES = {
+    TickerStore.INTERVAL_MINUTE_1: 1,
+    TickerStore.INTERVAL_MINUTE_5: 5,
+    TickerStore.INTERVAL_MINUTE_10: 10,
+    TickerStore.INTERVAL_MINUTE_30: 30,
+    TickerStore.INTERVAL_MINUTE_60: 60,
+}
+
+BAR_FIELDS = ["symbol", "start", "Open", "High", "Low", "Close", "Volume"]
+
+
+class TickBuffer:
+    """
+    Fixed size buffer of ticks waiting to be aggregated.
+
+    The columns are allocated once, so taking a tick never allocates. When
+    the buffer is full new ticks are dropped and counted in ``dropped``,
+    which keeps memory bounded however far the consumer falls behind.
+    """
+
+    def __init__(self, capacity=2 ** 20):
+        """
+        Parameters
+        ---------
+            capacity: int
+                Number of ticks the buffer holds.
+        """
+        self.capacity = capacity
+        self.symbols = numpy.zeros(capacity, dtype=numpy.int32)
+        self.timestamps = numpy.zeros(capacity, dtype=numpy.int64)
+        self.prices = numpy.zeros(capacity, dtype=numpy.float64)
+        self.quantities = numpy.zeros(capacity, dtype=numpy.int64)
+        self.received = 0
+        self.dropped = 0
+        self.__head = 0  # Ticks written since the start
+        self.__tail = 0  # Ticks drained since the start
+        self.__lock = threading.Lock()
+
+    def put(self, symbol, timestamp, price, quantity):
+        """
+        Adds a tick.
+
+        Parameters
+        ---------
+            symbol: int
+                Code of the ticker, see SymbolTable.
+            timestamp: int
+                Time of the trade in nanoseconds since epoch, UTC.
+            price: float
+                Traded price.
+            quantity: int
+                Traded quantity.
+
+        Returns
+        -------
+        bool
+            False if the buffer was full and the tick was dropped.
+        """
+        with self.__lock:
+            self.received += 1
+            if self.__head - self.__tail >= self.capacity:
+                self.dropped += 1
+                return False
+            position = self.__head % self.capacity
+            self.symbols[position] = symbol
+            self.timestamps[position] = timestamp
+            self.prices[position] = price
+            self.quantities[position] = quantity
+            self.__head += 1
+            return True
+
+    def drain(self):
+        """
+        Takes every buffered tick out of the buffer.
+
+        Returns
+        -------
+        tuple
+            Copies of the symbol, timestamp, price and quantity columns, in the
+            order the ticks arrived.
+        """
+        with self.__lock:
+            positions = numpy.arange(self.__tail, self.__head) % self.capacity
+            self.__tail = self.__head
+            return (
+                self.symbols[positions],
+                self.timestamps[positions],
+                self.prices[positions],
+                self.quantities[positions],
+            )
+
+    def __len__(self):
+        return self.__head - self.__tail
+
+
+class SymbolTable:
+    """Gives every ticker a small integer code, so ticks fit in numpy columns."""
+
+    def __init__(self):
+        self.names = []
+        self.codes = {}
+        self.__lock = threading.Lock()
+
+    def code(self, symbol):
+        """Returns the code of a ticker, giving it one on first use."""
+        code = self.codes.get(symbol)
+        if code is None:
+            with self.__lock:
+                code = self.codes.setdefault(symbol, len(self.names))
+                if code == len(self.names):
+                    self.names.append(symbol)
+        return code
+
+    def snapshot(self):
+        """Returns the tickers indexed by their code."""
+        with self.__lock:
+            return numpy.asarray(self.names, dtype=object)
+
+
+class BarAggregator:
+    """
+    Builds bars of a fixed number of minutes out of ticks, incrementally.
+
+    Only the open bar of every ticker is kept, as one slot in a set of numpy
+    columns, and each batch of ticks is folded into it with a handful of
+    vectorised operations. Bars are aligned to the NSE session like
+    resample.intraday_bars, ticks outside the session are ignored and ticks
+    older than the open bar of their ticker are counted in ``late``.
+    """
+
+    def __init__(self, minutes):
+        """
+        Parameters
+        ---------
+            minutes: int
+                Number of minutes in every bar.
+        """
+        self.step = minutes * MINUTE
+        self.late = 0
+        self.start = numpy.zeros(0, dtype=numpy.int64)  # Wall clock ns in IST
+        self.active = numpy.zeros(0, dtype=bool)
+        self.open = numpy.zeros(0)
+        self.high = numpy.zeros(0)
+        self.low = numpy.zeros(0)
+        self.close = numpy.zeros(0)
+        self.volume = numpy.zeros(0, dtype=numpy.int64)
+
+    def add(self, symbols, times, prices, quantities):
+        """
+        Folds a batch of ticks into the open bars.
+
+        Parameters
+        ---------
+            symbols: numpy.ndarray
+                Ticker codes.
+            times: numpy.ndarray
+                Wall clock time of every tick in IST, as nanoseconds since epoch.
+            prices: numpy.ndarray
+                Traded prices.
+            quantities: numpy.ndarray
+                Traded quantities.
+
+        Returns
+        -------
+        dict
+            Columns of the bars completed by the batch, keyed by BAR_FIELDS.
+        """
+        if len(symbols) == 0:
+            return _no_bars()
+        self.__reserve(int(symbols.max()) + 1)
+
+        days = times - times % DAY
+        offsets = times - days - SESSION_OPEN
+        in_session = (offsets >= 0) & (offsets < SESSION_CLOSE - SESSION_OPEN)
+        starts = days + SESSION_OPEN + offsets // self.step * self.step
+
+        # Ticks of a ticker in time order, whatever order they arrived in
+        order = numpy.lexsort((times, symbols))
+        order = order[in_session[order]]
+        symbols, starts = symbols[order], starts[order]
+        prices, quantities = prices[order], quantities[order]
+
+        current = self.start[symbols]
+        late = (starts < current) | ((starts == current) & ~self.active[symbols])
+        if late.any():
+            self.late += int(late.sum())
+            keep = ~late
+            symbols, starts = symbols[keep], starts[keep]
+            prices, quantities = prices[keep], quantities[keep]
+        if len(symbols) == 0:
+            return _no_bars()
+
+        # One group per (ticker, bar)
+        boundary = numpy.ones(len(symbols), dtype=bool)
+        boundary[1:] = (symbols[1:] != symbols[:-1]) | (starts[1:] != starts[:-1])
+        first = numpy.flatnonzero(boundary)
+        last = numpy.append(first[1:], len(symbols)) - 1
+
+        bars = {
+            "symbol": symbols[first],
+            "start": starts[first],
+            "Open": prices[first],
+            "High": numpy.maximum.reduceat(prices, first),
+            "Low": numpy.minimum.reduceat(prices, first),
+            "Close": prices[last],
+            "Volume": numpy.add.reduceat(quantities, first),
+        }
+        group_symbols = bars["symbol"]
+        first_of_symbol = numpy.ones(len(first), dtype=bool)
+        first_of_symbol[1:] = group_symbols[1:] != group_symbols[:-1]
+        last_of_symbol = numpy.ones(len(first), dtype=bool)
+        last_of_symbol[:-1] = group_symbols[1:] != group_symbols[:-1]
+
+        # The first bar of a ticker either continues its open bar or replaces it
+        active = first_of_symbol & self.active[group_symbols]
+        same = active & (bars["start"] == self.start[group_symbols])
+        replaced = active & ~same
+
+        codes = group_symbols[same]
+        bars["Open"][same] = self.open[codes]
+        bars["High"][same] = numpy.maximum(bars["High"][same], self.high[codes])
+        bars["Low"][same] = numpy.minimum(bars["Low"][same], self.low[codes])
+        bars["Volume"][same] += self.volume[codes]
+
+        completed = [
+            self.__bars(group_symbols[replaced]),
+            {field: values[~last_of_symbol] for field, values in bars.items()},
+        ]
+
+        # The last bar of every ticker in the batch stays open
+        codes = group_symbols[last_of_symbol]
+        self.start[codes] = bars["start"][last_of_symbol]
+        self.open[codes] = bars["Open"][last_of_symbol]
+        self.high[codes] = bars["High"][last_of_symbol]
+        self.low[codes] = bars["Low"][last_of_symbol]
+        self.close[codes] = bars["Close"][last_of_symbol]
+        self.volume[codes] = bars["Volume"][last_of_symbol]
+        self.active[codes] = True
+        return _concat(completed)
+
+    def expire(self, now, grace=0):
+        """
+        Completes the open bars that ended before now.
+
+        Parameters
+        ---------
+            now: int
+                Wall clock time in IST, as nanoseconds since epoch.
+            grace: int
+                Nanoseconds to wait after the end of a bar for late ticks.
+
+        Returns
+        -------
+        dict
+            Columns of the completed bars, keyed by BAR_FIELDS.
+        """
+        days = self.start - self.start % DAY
+        ends = numpy.minimum(self.start + self.step, days + SESSION_CLOSE)
+        codes = numpy.flatnonzero(self.active & (ends + grace <= now))
+        return self.__bars(codes)
+
+    def close_all(self):
+        """Completes every open bar, eg. when the feed stops."""
+        return self.__bars(numpy.flatnonzero(self.active))
+
+    def __bars(self, codes):
+        """Takes the open bars of some tickers out of the state."""
+        self.active[codes] = False
+        return {
+            "symbol": codes.astype(numpy.int32),
+            "start": self.start[codes],
+            "Open": self.open[codes],
+            "High": self.high[codes],
+            "Low": self.low[codes],
+            "Close": self.close[codes],
+            "Volume": self.volume[codes],
+        }
+
+    def __reserve(self, size):
+        """Grows the state to hold size tickers."""
+        if size <= len(self.start):
+            return
+        size = max(size, 2 * len(self.start))
+        grow = size - len(self.start)
+        self.start = numpy.append(self.start, numpy.full(grow, -1, numpy.int64))
+        self.active = numpy.append(self.active, numpy.zeros(grow, dtype=bool))
+        self.open = numpy.append(self.open, numpy.zeros(grow))
+        self.high = numpy.append(self.high, numpy.zeros(grow))
+        self.low = numpy.append(self.low, numpy.zeros(grow))
+        self.close = numpy.append(self.close, numpy.zeros(grow))
+        self.volume = numpy.append(self.volume, numpy.zeros(grow, numpy.int64))
+
+
+class TickIngester:
+    """
+    Takes live ticks from a feed and turns them into bars.
+
+    Ticks go into a TickBuffer as they arrive. A background thread drains the
+    buffer every flush_interval seconds, folds the ticks into the open bars of
+    every interval and writes the completed bars to a ColumnStore::
+
+        ingester = fetcher.stream_ticks(["SBIN", "INFY"], ColumnStore("bars"))
+        ...
+        ingester.stop()
+
+    Memory stays bounded by the buffer capacity and one open bar per ticker
+    and interval.
+    """
+
+    def __init__(
+        self,
+        feed,
+        column_store=None,
+        intervals=(TickerStore.INTERVAL_MINUTE_1,),
+        capacity=2 ** 20,
+        flush_interval=1.0,
+        grace=2.0,
+        on_bars=None,
+        clock=None,
+        metrics=None,
+    ):
+        """
+        Parameters
+        ---------
+            feed: UpstoxFeed or ReplayFeed
+                Source of the ticks.
+            column_store: ColumnStore
+                Store the completed bars are appended to. None keeps them out
+                of the store, eg. when on_bars handles them.
+            intervals: tuple
+                TickerStore.INTERVAL_MINUTE_* values to build bars for.
+            capacity: int
+                Number of ticks buffered between two flushes.
+            flush_interval: float
+                Seconds between two flushes.
+            grace: float
+                Seconds to wait after the end of a bar for late ticks.
+            on_bars: callable
+                Called as ``on_bars(interval, frame)`` with every batch of
+                completed bars.
+            clock: callable
+                Returns the current time in nanoseconds since epoch, UTC. Bars
+                are completed by this clock. Defaults to the wall clock.
+            metrics: tickerstore.metrics.Metrics
+                Receives the ticks_received, ticks_dropped, ticks_late and
+                bars_flushed counters.
+        """
+        for interval in intervals:
+            if interval not in INTERVAL_MINUTES:
+                raise ValueError(f"Can't build bars of interval {interval} from ticks")
+
+        self.feed = feed
+        self.column_store = column_store
+        self.flush_interval = flush_interval
+        self.grace = int(grace * 10 ** 9)
+        self.on_bars = on_bars
+        self.clock = clock or (lambda: int(time.time() * 10 ** 9))
+        self.metrics = metrics
+        self.symbols = SymbolTable()
+        self.buffer = TickBuffer(capacity)
+        self.aggregators = {
+            interval: BarAggregator(INTERVAL_MINUTES[interval])
+            for interval in intervals
+        }
+        self.bars_flushed = 0
+        self.__reported = {"received": 0, "dropped": 0, "late": 0}
+        self.__flush_lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def on_tick(self, symbol, timestamp, price, quantity):
+        """
+        Takes a tick from the feed.
+
+        Parameters
+        ---------
+            symbol: str
+                Ticker symbol. eg. "SBIN"
+            timestamp: int
+                Time of the trade in nanoseconds since epoch, UTC.
+            price: float
+                Traded price.
+            quantity: int
+                Traded quantity.
+        """
+        self.buffer.put(self.symbols.code(symbol), timestamp, price, quantity)
+
+    def start(self):
+        """Starts the feed and the flushing thread."""
+        self.__stopped.clear()
+        self.__thread = threading.Thread(
+            target=self.__run, name="tickerstore-ticks", daemon=True
+        )
+        self.__thread.start()
+        self.feed.start(self.on_tick)
+        return self
+
+    def stop(self, close_open_bars=False):
+        """
+        Stops the feed and flushes the remaining ticks.
+
+        Parameters
+        ---------
+            close_open_bars: bool
+                Whether to also write the bars that haven't ended yet, eg. after
+                the session closed.
+        """
+        self.feed.stop()
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.flush(close_open_bars)
+
+    def flush(self, close_open_bars=False):
+        """
+        Aggregates the buffered ticks and writes the completed bars.
+
+        Returns
+        -------
+        int
+            Number of bars completed.
+        """
+        with self.__flush_lock:
+            # Read first, so no tick drained below is newer than the clock
+            now = self.clock() + IST_OFFSET
+            symbols, timestamps, prices, quantities = self.buffer.drain()
+            times = timestamps + IST_OFFSET
+
+            completed = 0
+            for interval, aggregator in self.aggregators.items():
+                bars = [aggregator.add(symbols, times, prices, quantities)]
+                if close_open_bars:
+                    bars.append(aggregator.close_all())
+                else:
+                    bars.append(aggregator.expire(now, self.grace))
+                bars = _concat(bars)
+                if len(bars["symbol"]):
+                    completed += len(bars["symbol"])
+                    self.__write(interval, bars)
+
+            self.bars_flushed += completed
+            self.__report(completed)
+            return completed
+
+    def __write(self, interval, bars):
+        frame = _frame(bars, self.symbols.snapshot())
+        if self.column_store is not None:
+            for symbol, positions in frame.groupby("Symbol").indices.items():
+                self.column_store.append(symbol, interval, frame.iloc[positions])
+        if self.on_bars is not None:
+            self.on_bars(interval, frame)
+
+    def __report(self, completed):
+        counts = {
+            "received": self.buffer.received,
+            "dropped": self.buffer.dropped,
+            "late": sum(a.late for a in self.aggregators.values()),
+        }
+        dropped = counts["dropped"] - self.__reported["dropped"]
+        if dropped:
+            logger.warning(f"Tick buffer is full, dropped {dropped} ticks")
+        if self.metrics is not None:
+            for name, count in counts.items():
+                self.metrics.increment(f"ticks_{name}", count - self.__reported[name])
+            self.metrics.increment("bars_flushed", completed)
+        self.__reported = counts
+
+    def __run(self):
+        while not self.__stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing ticks failed")
+
+
+class UpstoxFeed:
+    """Ticks of the Upstox websocket quote stream."""
+
+    def __init__(self, client, instruments, record_to=None):
+        """
+        Parameters
+        ---------
+            client: upstox_api.api.Upstox
+                Client with a valid access token.
+            instruments: dict
+                Ticker to the upstox_api Instrument to subscribe to.
+            record_to: str
+                File every quote is appended to as a JSON line, for replaying
+                it later with ReplayFeed.
+        """
+        self.client = client
+        self.instruments = instruments
+        self.record_to = record_to
+        self.__record_file = None
+
+    def start(self, on_tick):
+        """Subscribes to the full quotes of every instrument."""
+        from upstox_api.api import LiveFeedType
+
+        parse = QuoteParser(on_tick, self.instruments)
+        if self.record_to is not None:
+            self.__record_file = open(self.record_to, "a")
+
+        def on_quote(quote):
+            if self.__record_file is not None:
+                self.__record_file.write(json.dumps(quote, default=str) + "\n")
+            parse(quote)
+
+        self.client.set_on_quote_update(on_quote)
+        for ticker, instrument in self.instruments.items():
+            logger.debug(f"Subscribing to the quotes of {ticker}")
+            self.client.subscribe(instrument, LiveFeedType.Full)
+        self.client.start_websocket(True)
+
+    def stop(self):
+        """Unsubscribes from every instrument and closes the websocket."""
+        from upstox_api.api import LiveFeedType
+
+        for instrument in self.instruments.values():
+            self.client.unsubscribe(instrument, LiveFeedType.Full)
+        websocket = getattr(self.client, "websocket", None)
+        if websocket is not None:
+            websocket.close()
+        if self.__record_file is not None:
+            self.__record_file.close()
+            self.__record_file = None
+
+
+class ReplayFeed:
+    """
+    Stand-in for the Upstox quote stream that replays recorded quotes.
+
+    Quotes are the dictionaries the websocket delivers, eg. recorded by
+    UpstoxFeed(record_to=...), and go through the same parsing as live ones.
+    """
+
+    def __init__(self, quotes, speed=None):
+        """
+        Parameters
+        ---------
+            quotes: str or list
+                JSON lines file of quotes, or the quotes themselves.
+            speed: float
+                Replay speed relative to the recording, eg. 10 replays ten
+                times faster. None replays as fast as possible.
+        """
+        self.quotes = quotes
+        self.speed = speed
+        self.last_timestamp = 0  # Time of the last replayed quote, ns UTC
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def start(self, on_tick):
+        """Starts replaying on a background thread."""
+        parse = QuoteParser(on_tick)
+        self.__stopped.clear()
+        self.__thread = threading.Thread(
+            target=self.__replay, args=(parse,), name="tickerstore-replay", daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self):
+        """Stops replaying."""
+        self.__stopped.set()
+        self.join()
+
+    def join(self, timeout=None):
+        """Waits until every quote was replayed."""
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def clock(self):
+        """Returns the time of the last replayed quote, for TickIngester(clock=...)."""
+        return self.last_timestamp
+
+    def __replay(self, parse):
+        previous = None
+        for quote in self.__read():
+            if self.__stopped.is_set():
+                return
+            timestamp = _quote_time(quote)
+            if self.speed and previous is not None and timestamp > previous:
+                time.sleep((timestamp - previous) / 10 ** 9 / self.speed)
+            previous = timestamp
+            parse(quote)
+            self.last_timestamp = max(self.last_timestamp, timestamp)
+
+    def __read(self):
+        if not isinstance(self.quotes, str):
+            yield from self.quotes
+            return
+        with open(self.quotes, "r") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class QuoteParser:
+    """
+    Turns Upstox quotes into ticks.
+
+    The traded quantity is the change of the day's traded volume (vtt) since
+    the previous quote of a ticker, falling back to the last traded quantity
+    (ltq) for the first quote.
+    """
+
+    def __init__(self, on_tick, instruments=None):
+        self.on_tick = on_tick
+        # Upstox symbols are upper case, ticks carry the tickers as requested
+        self.tickers = {ticker.upper(): ticker for ticker in instruments or {}}
+        self.volumes = {}  # Ticker to the last traded volume of the day
+
+    def __call__(self, quote):
+        try:
+            symbol = str(quote["symbol"]).upper()
+            ticker = self.tickers.get(symbol, symbol)
+            price = float(quote["ltp"])
+            quantity = int(float(quote.get("ltq") or 0))
+            if quote.get("vtt") is not None:
+                volume = int(float(quote["vtt"]))
+                previous = self.volumes.get(ticker)
+                if previous is not None:
+                    quantity = max(volume - previous, 0)
+                self.volumes[ticker] = volume
+            self.on_tick(ticker, _quote_time(quote), price, quantity)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Ignoring malformed quote {quote}: {e}")
+
+
+def _quote_time(quote):
+    """Returns the trade time of a quote in nanoseconds since epoch, UTC."""
+    milliseconds = quote.get("ltt") or quote["timestamp"]
+    return int(float(milliseconds)) * 10 ** 6
+
+
+def _no_bars():
+    return {
+        "symbol": numpy.zeros(0, dtype=numpy.int32),
+        "start": numpy.zeros(0, dtype=numpy.int64),
+        "Open": numpy.zeros(0),
+        "High": numpy.zeros(0),
+        "Low": numpy.zeros(0),
+        "Close": numpy.zeros(0),
+        "Volume": numpy.zeros(0, dtype=numpy.int64),
+    }
+
+
+def _concat(parts):
+    return {
+        field: numpy.concatenate([part[field] for part in parts])
+        for field in BAR_FIELDS
+    }
+
+
+def _frame(bars, names):
+    """Builds a frame in the schema of TickerStore.historical_data out of bars."""
+    index = pandas.DatetimeIndex(
+        numpy.asarray(bars["start"], dtype="datetime64[ns]"), name=INDEX_NAME
+    ).tz_localize(TIMEZONE)
+    frame = pandas.DataFrame(
+        {field: bars[field] for field in BAR_FIELDS[2:]}, index=index
+    )
+    frame["Symbol"] = names[bars["symbol"]]
+    return frame.sort_index(kind="mergesort")